@@ -9,8 +9,35 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+import os
+import time
 from datetime import datetime, timedelta
 
+inicio_rerun = time.perf_counter()
+
+from data_factory import generate_readings
+from sap_dispatcher import dispatch_work_orders
+from sap_stub import start_stub_server
+from spatial_index import build_asset_registry, build_asset_indexes, events_within
+from map_layer import meter_status, aggregate_tiles, build_map_figure
+from dataset_graph import build_dataset_graph
+from dataset_store import SharedDatasetStore
+from html_cards import CardTemplate, render_card_list
+from figure_cache import FigureCache
+from event_grid import SORT_COLUMNS
+from precompute import PrecomputeScheduler
+from rules import RULES_PATH, RuleConfigError, RuleEngine
+from streaming import JANELAS, StreamingIngestor, replay_readings
+from metrics import (REGISTRY, RERUN_SECONDS, DETECTION_SECONDS, EVENTS_DETECTED, ROWS_INGESTED,
+                     INGEST_ROWS_PER_SECOND, OUTBOUND_ORDERS, PROCESS_MEMORY_BYTES,
+                     cache_hit_ratio, start_metrics_server, track_cache, track_dataset_store,
+                     write_metrics_file)
+
+# Datasets são compartilhados entre sessões: copy-on-write impede que uma página altere os dados das outras
+# (padrão a partir do pandas 3, onde a opção está obsoleta)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # Configuração da página
 st.set_page_config(
     page_title="CPFL LABS | TEMA 3",
@@ -321,188 +348,490 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Templates de cards (compilados uma vez; cada lista é enviada em um único bloco HTML)
+BADGE_POR_SEVERIDADE = {'CRÍTICA': 'badge-critico', 'ALTA': 'badge-alerta'}
+
+PRIORITY_EVENT_CARD = CardTemplate("""
+<div class="section-card" style="margin-bottom: 1rem;">
+    <span class="status-badge {badge_class}">{severidade}</span>
+    <h4 style='color: #003D5C; margin: 0.5rem 0;'>{tipo}</h4>
+    <p style='margin: 0.3rem 0; font-size: 0.9rem;'><strong>ID:</strong> {id_medidor}</p>
+    <p style='margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;'>{regiao}</p>
+    <p style='margin: 0.5rem 0; font-size: 0.9rem;'>{descricao}</p>
+</div>
+""")
+
+FEEDER_CARD = CardTemplate("""
+<div style='margin: 1rem 0; padding: 1rem; background: #F5F7FA; border-radius: 8px;'>
+<strong style='color: #003D5C;'>{alimentador}</strong><br>
+<span style='font-size: 0.9rem; color: #546E7A;'>
+Carga: {carga_mw:.2f} MW | Medidores: {medidores}
+</span>
+</div>
+""")
+
+CRITICAL_EVENT_CARD = CardTemplate("""
+<div class="section-card" style="border-left-color: #C62828;">
+    <div style="display: flex; justify-content: space-between; align-items: center;">
+        <div>
+            <h4 style="margin: 0; color: #C62828;">{tipo}</h4>
+            <p style="margin: 0.3rem 0;"><strong>{id_medidor}</strong> | {alimentador}</p>
+            <p style="margin: 0.3rem 0; font-size: 0.9rem; color: #546E7A;">{regiao}</p>
+        </div>
+        <div>
+            <span class="status-badge badge-critico">{severidade}</span>
+        </div>
+    </div>
+    <p style="margin: 0.8rem 0 0.3rem 0;"><strong>Descrição:</strong> {descricao}</p>
+    <p style="margin: 0.3rem 0;"><strong>Ação Sugerida:</strong> {acao_sugerida}</p>
+    <p style="margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;">
+    <strong>Timestamp:</strong> {timestamp_fmt}
+    </p>
+</div>
+""")
+
+WORK_ORDER_CARD = CardTemplate("""
+<div class="section-card">
+    <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.8rem;">
+        <h4 style="margin: 0; color: #003D5C;">{id_os}</h4>
+        <span class="status-badge {badge_class}">{tipo_os}</span>
+    </div>
+    <p style="margin: 0.3rem 0;"><strong>Tipo de Serviço:</strong> {tipo_servico}</p>
+    <p style="margin: 0.3rem 0;"><strong>Medidor:</strong> {id_medidor}</p>
+    <p style="margin: 0.3rem 0;"><strong>Local:</strong> {regiao}</p>
+    <p style="margin: 0.3rem 0;"><strong>Alimentador:</strong> {alimentador}</p>
+    <p style="margin: 0.3rem 0;"><strong>Prioridade:</strong> {prioridade}</p>
+    <p style="margin: 0.5rem 0 0 0; font-size: 0.9rem; color: #546E7A;">
+    <strong>Ação:</strong> {acao}
+    </p>
+    <p style="margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;">
+    <strong>Custo Estimado:</strong> R$ {custo_estimado:,.2f} |
+    <strong>Evento em:</strong> {timestamp_fmt}
+    </p>
+</div>
+""")
+
 # Funções de geração de dados - NATAL/PARNAMIRIM/RN
-@st.cache_data
-def generate_smart_meter_data(num_meters=50, days=7):
+def generate_smart_meter_data(num_meters=50, days=7, seed=None):
     """Gera dados sintéticos de smart meters para região Natal/Parnamirim/RN"""
-    end_time = datetime.now()
-    start_time = end_time - timedelta(days=days)
-    timestamps = pd.date_range(start=start_time, end=end_time, freq='15min')
-    
-    # Alimentadores da região Natal/Parnamirim
-    alimentadores = [
-        'AL-NAT-04 (Ponta Negra)',
-        'AL-NAT-07 (Capim Macio)', 
-        'AL-PAR-02 (Parnamirim Centro)',
-        'AL-PAR-05 (Nova Parnamirim)'
-    ]
-    
-    regioes = [
-        'Zona Sul - Natal',
-        'Zona Leste - Natal',
-        'Centro - Parnamirim',
-        'Cotovelo - Parnamirim'
-    ]
-    
-    data = []
-    
-    for meter_id in range(1, num_meters + 1):
-        id_medidor = f"RN-{39200 + meter_id:05d}"
-        alimentador = np.random.choice(alimentadores)
-        regiao = np.random.choice(regioes)
-        consumo_base = np.random.uniform(2.0, 4.5)  # kW - perfil residencial RN
-        
-        for ts in timestamps:
-            hora = ts.hour
-            # Padrão de consumo adaptado ao clima do RN (uso de AC)
-            if 12 <= hora <= 15:  # Pico de calor - uso intenso de AC
-                fator = 3.2
-            elif 18 <= hora <= 22:  # Noite - ainda quente
-                fator = 2.8
-            elif 6 <= hora <= 8:  # Manhã
-                fator = 1.8
-            elif 0 <= hora <= 5:  # Madrugada
-                fator = 0.5
-            else:
-                fator = 1.2
-            
-            potencia = consumo_base * fator * np.random.uniform(0.88, 1.12)
-            
-            # Anomalias ocasionais
-            if np.random.random() < 0.015:
-                anomaly_type = np.random.choice(['pico_ac', 'queda', 'oscilacao'])
-                if anomaly_type == 'pico_ac':
-                    potencia = potencia * 4.5  # Múltiplos ACs ligados
-                elif anomaly_type == 'queda':
-                    potencia = 0.02
-                else:
-                    potencia = potencia * 0.3
-            
-            # Tensão (127V nominal no RN)
-            tensao = 127 + np.random.normal(0, 2.5)
-            
-            # Subtensões mais frequentes em horário de pico
-            if np.random.random() < 0.012 and 12 <= hora <= 15:
-                tensao = np.random.uniform(108, 117)
-            
-            # Fator de potência
-            fator_pot = np.random.uniform(0.87, 0.97)
-            if np.random.random() < 0.025:  # FP baixo por equipamentos
-                fator_pot = np.random.uniform(0.62, 0.75)
-            
-            data.append({
-                'id_medidor': id_medidor,
-                'timestamp': ts,
-                'tensao_v': tensao,
-                'potencia_kw': potencia,
-                'fator_potencia': fator_pot,
-                'energia_kwh': potencia * 0.25,
-                'alimentador': alimentador,
-                'regiao': regiao,
-                'hora': hora,
-                'temperatura_estimada': 26 + np.random.uniform(-2, 8) if 10 <= hora <= 16 else 24 + np.random.uniform(-2, 4)
-            })
-    
-    return pd.DataFrame(data)
+    inicio = time.perf_counter()
+    df = generate_readings(num_meters, days, seed=seed)
+    ROWS_INGESTED.inc(len(df))
+    INGEST_ROWS_PER_SECOND.set(len(df) / max(time.perf_counter() - inicio, 1e-9))
+    return df
+
+@st.cache_resource
+def get_rule_engine():
+    """Regras de detecção compiladas a partir de regras_eventos.json (recarregadas quando o arquivo muda)"""
+    return RuleEngine(RULES_PATH)
 
-@st.cache_data
 def detect_events_advanced(df):
-    """Detecção avançada de eventos - adaptado para RN"""
-    events = []
-    event_id = 1
-    
-    for _, row in df.iterrows():
-        # Subtensão (127V nominal)
-        if row['tensao_v'] < 117:
-            events.append({
-                'id_evento': f"EVT-RN-{event_id:06d}",
-                'id_medidor': row['id_medidor'],
-                'timestamp': row['timestamp'],
-                'alimentador': row['alimentador'],
-                'regiao': row['regiao'],
-                'tipo': 'SUBTENSÃO',
-                'severidade': 'CRÍTICA' if row['tensao_v'] < 110 else 'ALTA',
-                'valor': f"{row['tensao_v']:.1f}V",
-                'descricao': f"Tensão {row['tensao_v']:.1f}V abaixo do limite adequado (117V)",
-                'acao_sugerida': 'Verificar transformador e rede MT - possível sobrecarga por AC',
-                'destino': 'Operação',
-                'impacto': 'ALTO'
-            })
-            event_id += 1
-        
-        # Sobretensão
-        if row['tensao_v'] > 133:
-            events.append({
-                'id_evento': f"EVT-RN-{event_id:06d}",
-                'id_medidor': row['id_medidor'],
-                'timestamp': row['timestamp'],
-                'alimentador': row['alimentador'],
-                'regiao': row['regiao'],
-                'tipo': 'SOBRETENSÃO',
-                'severidade': 'ALTA',
-                'valor': f"{row['tensao_v']:.1f}V",
-                'descricao': f"Tensão {row['tensao_v']:.1f}V acima do limite adequado (133V)",
-                'acao_sugerida': 'Verificar regulador de tensão',
-                'destino': 'Operação',
-                'impacto': 'MÉDIO'
-            })
-            event_id += 1
-        
-        # Queda de energia
-        if row['potencia_kw'] < 0.08:
-            events.append({
-                'id_evento': f"EVT-RN-{event_id:06d}",
-                'id_medidor': row['id_medidor'],
-                'timestamp': row['timestamp'],
-                'alimentador': row['alimentador'],
-                'regiao': row['regiao'],
-                'tipo': 'INTERRUPÇÃO',
-                'severidade': 'CRÍTICA',
-                'valor': f"{row['potencia_kw']:.3f}kW",
-                'descricao': 'Possível interrupção no fornecimento de energia',
-                'acao_sugerida': 'Despachar equipe emergencial - verificar alimentador',
-                'destino': 'Operação',
-                'impacto': 'CRÍTICO'
-            })
-            event_id += 1
-        
-        # Consumo anormal (pico de AC)
-        if row['potencia_kw'] > 15:
-            events.append({
-                'id_evento': f"EVT-RN-{event_id:06d}",
-                'id_medidor': row['id_medidor'],
-                'timestamp': row['timestamp'],
-                'alimentador': row['alimentador'],
-                'regiao': row['regiao'],
-                'tipo': 'CONSUMO ELEVADO',
-                'severidade': 'MÉDIA',
-                'valor': f"{row['potencia_kw']:.2f}kW",
-                'descricao': f"Consumo atípico detectado ({row['potencia_kw']:.2f}kW) - possível uso excessivo de climatização",
-                'acao_sugerida': 'Análise comercial - orientar cliente sobre eficiência energética',
-                'destino': 'Comercial',
-                'impacto': 'BAIXO'
-            })
-            event_id += 1
-        
-        # Fator de potência baixo
-        if row['fator_potencia'] < 0.75:
-            events.append({
-                'id_evento': f"EVT-RN-{event_id:06d}",
-                'id_medidor': row['id_medidor'],
-                'timestamp': row['timestamp'],
-                'alimentador': row['alimentador'],
-                'regiao': row['regiao'],
-                'tipo': 'FP INADEQUADO',
-                'severidade': 'MÉDIA',
-                'valor': f"{row['fator_potencia']:.3f}",
-                'descricao': f"Fator de potência {row['fator_potencia']:.3f} abaixo do regulamentado (0.92)",
-                'acao_sugerida': 'Notificar cliente - sugerir correção com banco de capacitores',
-                'destino': 'Cliente',
-                'impacto': 'MÉDIO'
-            })
-            event_id += 1
-    
-    return pd.DataFrame(events) if events else pd.DataFrame()
+    """Detecção avançada de eventos - adaptado para RN (limites por perfil de alimentador/medidor)"""
+    with DETECTION_SECONDS.time():
+        events = get_rule_engine().detect(df)
+    EVENTS_DETECTED.set(len(events))
+    return events
+
+def voltage_limits(df):
+    """Faixa adequada de tensão (inferior, superior) por leitura, do perfil de cada alimentador/medidor"""
+    return get_rule_engine().voltage_limits(df)
+
+def feeder_voltage_limits(alimentadores):
+    """{alimentador: (inferior, superior)} pelo perfil de cada alimentador (sem override de medidor)"""
+    alimentadores = list(alimentadores)
+    inferior, superior = voltage_limits(pd.DataFrame({'alimentador': alimentadores, 'id_medidor': ''}))
+    return {a: (float(i), float(s)) for a, i, s in zip(alimentadores, inferior, superior)}
+
+@st.cache_resource
+def get_sap_endpoint():
+    """Endpoint do SAP PM (SAP_ENDPOINT=host:porta) ou stub local compartilhado pelo processo"""
+    endpoint = os.environ.get('SAP_ENDPOINT')
+    if endpoint:
+        host, _, port = endpoint.rpartition(':')
+        return host, int(port)
+    server = start_stub_server()
+    return server.server_address[0], server.server_address[1]
+
+@st.cache_resource
+def get_metrics_endpoint():
+    """Endpoint Prometheus (/metrics) do processo em METRICS_HOST:METRICS_PORT; None se a porta estiver ocupada"""
+    port = int(os.environ.get('METRICS_PORT', 9464))
+    try:
+        server = start_metrics_server(port, os.environ.get('METRICS_HOST', '127.0.0.1'))
+    except OSError:
+        return None
+    return f":{server.server_address[1]}/metrics"
+
+@st.cache_resource
+def get_streaming_ingestor():
+    """Ingestão em streaming do processo (socket local STREAM_PORT); None se a porta estiver ocupada"""
+    port = int(os.environ.get('STREAM_PORT', 9470))
+    try:
+        return StreamingIngestor(get_rule_engine(), port=port).start()
+    except OSError:
+        return None
+
+def load_assets(df):
+    """Cadastro georreferenciado de ativos + índices R-tree"""
+    registry = build_asset_registry(df[['id_medidor', 'alimentador', 'regiao']].drop_duplicates('id_medidor'))
+    return registry, build_asset_indexes(registry)
+
+# Datasets que cada página renderiza - o grafo calcula apenas estes nós (e suas dependências)
+PAGE_DATASETS = {
+    "📊 Ingestão & Qualidade": ['readings', 'sketches', 'quality'],
+    "📈 Visão Operacional": ['readings', 'sketches', 'events', 'assets', 'rollups', 'energy_balance', 'forecast'],
+    "🔍 Análise Avançada": ['readings', 'assets', 'profiles'],
+    "⚡ Motor de Eventos": ['events', 'episodes', 'event_index'],
+    "🔧 Integrações Corporativas": ['events', 'assets', 'rollups', 'work_orders'],
+}
+
+@st.cache_resource
+def get_dataset_graph():
+    """Grafo + store únicos no processo: todas as sessões compartilham as mesmas versões dos datasets"""
+    # Versão publicada + a em cálculo para cada configuração aquecida pelo pré-cálculo
+    graph = build_dataset_graph(generate_smart_meter_data, detect_events_advanced, load_assets,
+                                store=SharedDatasetStore(max_versions=9), voltage_limits=voltage_limits)
+    track_dataset_store(graph.store)
+    return graph
+
+dataset_graph = get_dataset_graph()
+
+@st.cache_resource
+def get_precompute_scheduler():
+    """Recalcula todos os datasets das páginas a cada 15 min (PRECOMPUTE_INTERVAL_S) em segundo plano"""
+    datasets = sorted({nome for nomes in PAGE_DATASETS.values() for nome in nomes})
+    return PrecomputeScheduler(dataset_graph, datasets,
+                               interval_s=int(os.environ.get('PRECOMPUTE_INTERVAL_S', 900)),
+                               max_warm=4, warm=[(50, 7)]).start()
+
+precompute = get_precompute_scheduler()
+
+# Recarga a quente das regras: só eventos, sketches (faixa de tensão por perfil) e derivados são recalculados
+try:
+    if get_rule_engine().reload_if_changed():
+        dataset_graph.invalidate('events')
+        dataset_graph.invalidate('sketches')
+except (RuleConfigError, ValueError) as exc:
+    st.sidebar.error(f"⚠️ regras_eventos.json inválido - mantendo regras anteriores: {exc}")
+
+PERIODOS_ANALISE = {
+    "Últimas 24 Horas": timedelta(hours=24),
+    "Últimos 7 Dias": timedelta(days=7),
+    "Últimos 30 Dias": timedelta(days=30),
+}
+
+# Construtores de figuras (usados via FigureCache: só executam em caso de falta no cache)
+def build_feeder_energy_figure(alim_energy):
+    fig = px.bar(alim_energy, x='timestamp', y='energia_kwh', color='alimentador',
+                 labels={'timestamp': 'Hora do Dia', 'energia_kwh': 'Energia (kWh)', 'alimentador': 'Alimentador'},
+                 title='Consumo Energético Horário por Alimentador',
+                 color_discrete_sequence=['#00A9CE', '#0088AA', '#006688', '#004466'])
+    
+    fig.update_layout(
+        height=400,
+        margin=dict(l=20, r=20, t=50, b=20),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=12),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    
+    return fig
+
+def build_feeder_loss_figure(perdas_intervalo):
+    diario = perdas_intervalo.groupby(['alimentador', perdas_intervalo['timestamp'].dt.floor('D')], observed=True).agg(
+        energia_injetada_kwh=('energia_injetada_kwh', 'sum'),
+        perda_kwh=('perda_kwh', 'sum'),
+        perda_nao_tecnica_kwh=('perda_nao_tecnica_kwh', 'sum'),
+    ).reset_index()
+    diario['perda_pct'] = diario['perda_kwh'] / diario['energia_injetada_kwh'] * 100
+    
+    fig = px.line(diario, x='timestamp', y='perda_pct', color='alimentador', markers=True,
+                  labels={'timestamp': 'Dia', 'perda_pct': 'Perda Total (%)', 'alimentador': 'Alimentador'},
+                  title='Perdas Diárias (Cabeça do Alimentador x Energia Faturada)',
+                  color_discrete_sequence=['#00A9CE', '#0088AA', '#006688', '#004466'])
+    
+    fig.update_layout(
+        height=380,
+        margin=dict(l=20, r=20, t=50, b=20),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=12),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    
+    return fig
+
+def build_forecast_figure(historico, previsao):
+    fig = go.Figure()
+    cores = ['#00A9CE', '#0088AA', '#006688', '#004466']
+    
+    for cor, (alimentador, grupo) in zip(cores, historico.groupby('alimentador', sort=True)):
+        fig.add_trace(go.Scatter(x=grupo['timestamp'], y=grupo['carga_kw'], mode='lines', name=alimentador,
+                                 legendgroup=alimentador, line=dict(color=cor, width=2)))
+        futuro = previsao[previsao['alimentador'] == alimentador]
+        fig.add_trace(go.Scatter(x=futuro['timestamp'], y=futuro['previsao_kw'], mode='lines',
+                                 name=f"{alimentador} (previsão)", legendgroup=alimentador, showlegend=False,
+                                 line=dict(color=cor, width=2, dash='dash')))
+    
+    # Janela do pico de AC (12-15h) no dia previsto
+    for dia in previsao['timestamp'].dt.normalize().unique():
+        fig.add_vrect(x0=dia + pd.Timedelta(hours=12), x1=dia + pd.Timedelta(hours=16),
+                      fillcolor="#FFB300", opacity=0.12, line_width=0)
+    if not previsao.empty:
+        fig.add_vline(x=previsao['timestamp'].min(), line_dash="dot", line_color="#546E7A")
+    
+    fig.update_layout(
+        height=380,
+        title='Carga Observada (48h) e Prevista (24h) por Alimentador',
+        margin=dict(l=20, r=20, t=50, b=20),
+        xaxis_title="Horário",
+        yaxis_title="Carga (kW)",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=12),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    
+    return fig
+
+def nominal_voltage(faixa):
+    """Tensão nominal do perfil: o limite superior adequado é 1,05 x nominal (PRODIST Módulo 8)"""
+    return round(faixa[1] / 1.05)
+
+def build_voltage_percentile_figure(percentis, faixas):
+    fig = go.Figure()
+    cores = ['#00A9CE', '#0088AA', '#006688', '#004466']
+    
+    for cor, (alimentador, grupo) in zip(cores, percentis.groupby('alimentador', sort=True)):
+        fig.add_trace(go.Scatter(x=grupo['hora_dia'], y=grupo['p99'], mode='lines', name=f"{alimentador} p99",
+                                 line=dict(color=cor, width=2)))
+        fig.add_trace(go.Scatter(x=grupo['hora_dia'], y=grupo['p1'], mode='lines', name=f"{alimentador} p1",
+                                 line=dict(color=cor, width=2, dash='dot')))
+    
+    # Faixa adequada de cada perfil de tensão presente (127V, 220V...)
+    for inferior, superior in sorted({faixas[a] for a in percentis['alimentador'].unique()}):
+        fig.add_hrect(y0=inferior, y1=superior, fillcolor="#81C784", opacity=0.08, line_width=0)
+    fig.update_layout(
+        height=380,
+        title='Tensão p1/p99 por Hora do Dia e Alimentador',
+        margin=dict(l=20, r=20, t=50, b=20),
+        xaxis_title="Hora do Dia",
+        yaxis_title="Tensão (V)",
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=12),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1, font=dict(size=9))
+    )
+    
+    return fig
+
+def build_voltage_figure(meter_data, faixa):
+    meter_sorted = meter_data.sort_values('timestamp').tail(200)
+    inferior, superior = faixa
+    
+    fig = go.Figure()
+    
+    # Linha de tensão
+    fig.add_trace(go.Scatter(
+        x=meter_sorted['timestamp'],
+        y=meter_sorted['tensao_v'],
+        mode='lines',
+        name='Tensão Medida',
+        line=dict(color='#00A9CE', width=2.5),
+        fill='tozeroy',
+        fillcolor='rgba(0,169,206,0.1)'
+    ))
+    
+    # Limites PRODIST do perfil do medidor
+    fig.add_hline(y=superior, line_dash="dash", line_color="#F57C00", 
+                 annotation_text=f"Limite Superior Adequado ({superior:g}V)",
+                 annotation_position="right")
+    fig.add_hline(y=nominal_voltage(faixa), line_dash="dot", line_color="#4CAF50",
+                 annotation_text=f"Tensão Nominal ({nominal_voltage(faixa)}V)",
+                 annotation_position="right")
+    fig.add_hline(y=inferior, line_dash="dash", line_color="#F57C00",
+                 annotation_text=f"Limite Inferior Adequado ({inferior:g}V)",
+                 annotation_position="right")
+    
+    fig.update_layout(
+        height=350,
+        margin=dict(l=0, r=0, t=30, b=0),
+        xaxis_title="",
+        yaxis_title="Tensão (V)",
+        showlegend=False,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=11)
+    )
+    
+    return fig
+
+def build_load_curve_figure(meter_data):
+    hourly_profile = meter_data.groupby('hora').agg({
+        'potencia_kw': ['mean', 'max'],
+        'energia_kwh': 'sum'
+    }).reset_index()
+    hourly_profile.columns = ['hora', 'potencia_media', 'potencia_max', 'energia_total']
+    
+    fig = go.Figure()
+    
+    fig.add_trace(go.Bar(
+        x=hourly_profile['hora'],
+        y=hourly_profile['potencia_media'],
+        name='Potência Média',
+        marker_color='#FFB300',
+        marker_line_color='#FF8F00',
+        marker_line_width=1.5
+    ))
+    
+    fig.add_trace(go.Scatter(
+        x=hourly_profile['hora'],
+        y=hourly_profile['potencia_max'],
+        name='Pico de Demanda',
+        line=dict(color='#C62828', width=3),
+        mode='lines+markers'
+    ))
+    
+    fig.update_layout(
+        height=350,
+        margin=dict(l=0, r=0, t=30, b=0),
+        xaxis_title="Hora do Dia",
+        yaxis_title="Potência (kW)",
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=11)
+    )
+    
+    return fig
+
+def build_profile_similarity_figure(motor, selected_meter, semelhantes):
+    horas = np.arange(motor.forma.shape[1]) * 24 / motor.forma.shape[1]
+    segmento = motor.profile(selected_meter)['segmento']
+    
+    fig = go.Figure()
+    for i, id_medidor in enumerate(semelhantes['id_medidor']):
+        fig.add_trace(go.Scatter(x=horas, y=motor.shape(id_medidor), mode='lines',
+                                 name='Semelhantes', legendgroup='semelhantes', showlegend=i == 0,
+                                 line=dict(color='#B0BEC5', width=1)))
+    fig.add_trace(go.Scatter(x=horas, y=motor.centers[segmento], mode='lines', name=f'Centro do segmento {segmento}',
+                             line=dict(color='#0088AA', width=2, dash='dash')))
+    fig.add_trace(go.Scatter(x=horas, y=motor.shape(selected_meter), mode='lines+markers', name=selected_meter,
+                             line=dict(color='#FFB300', width=3)))
+    
+    fig.update_layout(
+        height=350,
+        margin=dict(l=0, r=0, t=30, b=0),
+        xaxis_title="Hora do Dia",
+        yaxis_title="Potência / média do medidor",
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(family='Inter', size=11)
+    )
+    
+    return fig
+
+@st.cache_resource
+def get_figure_cache():
+    cache = FigureCache(max_entries=256)
+    track_cache('figuras', cache)
+    return cache
+
+figure_cache = get_figure_cache()
+metrics_endpoint = get_metrics_endpoint()
+
+def render_system_status(container, page, publicado_em):
+    """STATUS DO SISTEMA a partir das mesmas métricas expostas em /metrics"""
+    REGISTRY.collect()
+
+    def linha(estado, rotulo, texto):
+        return f"<p><span class='status-indicator status-{estado}'></span><strong>{rotulo}:</strong> {texto}</p>"
+
+    p95 = RERUN_SECONDS.quantile(0.95, pagina=page)
+    if p95 is None:
+        latencia = linha('warning', 'Latência p95', 'sem amostras')
+    else:
+        estado = 'online' if p95 < 1 else 'warning' if p95 < 3 else 'offline'
+        latencia = linha(estado, 'Latência p95', f"{p95 * 1000:,.0f} ms")
+
+    vazao = INGEST_ROWS_PER_SECOND.value()
+    acertos = cache_hit_ratio()
+    # O envio ao SAP é síncrono (a fila esvazia antes do rerun terminar): o que importa aqui são as falhas
+    falhas_sap = OUTBOUND_ORDERS.value(integracao='sap', status='falha')
+    memoria_mb = PROCESS_MEMORY_BYTES.value() / 1e6
+
+    streaming = ''
+    if modo_ao_vivo:
+        if ingestor is None:
+            streaming = linha('offline', 'Streaming', 'porta indisponível')
+        else:
+            atraso = '' if ingestor.last_lag_s is None else f" | atraso {ingestor.last_lag_s * 1000:,.0f} ms"
+            streaming = linha('online' if ingestor.connections or ingestor.readings else 'warning', 'Streaming',
+                              f"Tempo real - {ingestor.readings:,} leituras{atraso}")
+
+    idade_s = (datetime.now() - publicado_em).total_seconds()
+    texto = f"{publicado_em.strftime('%H:%M:%S')} (há {idade_s / 60:.0f} min)"
+    if precompute.running:
+        texto += " - recalculando em segundo plano"
+    atualizacao = linha('online' if idade_s < 1.5 * precompute.interval_s else 'warning', 'Atualização', texto)
+
+    container.markdown("<div style='font-size: 0.85rem; line-height: 1.8;'>" + ''.join([
+        linha('online', 'Ambiente', 'Laboratório (Sandbox)'),
+        linha('online' if vazao else 'warning', 'Dados', f"Sintéticos - RN ({vazao:,.0f} leituras/s)"),
+        atualizacao,
+        latencia,
+        linha('online' if acertos is None or acertos >= 0.5 else 'warning', 'Cache',
+              'sem acessos' if acertos is None else f"{acertos:.0%} de acertos"),
+        linha('online', 'Memória', f"{memoria_mb:,.0f} MB"),
+        linha('online' if falhas_sap == 0 else 'warning', 'Envio SAP', f"{falhas_sap:,.0f} OS com falha"),
+        linha('online' if metrics_endpoint else 'offline', 'Métricas', metrics_endpoint or 'endpoint indisponível'),
+        streaming,
+    ]) + "</div>", unsafe_allow_html=True)
+
+def render_live_windows(ingestor):
+    """Janelas deslizantes por alimentador lidas direto da ingestão em streaming"""
+    janela = st.radio("Janela", list(JANELAS), horizontal=True, key='janela_ao_vivo')
+    
+    col_a, col_b, col_c, col_d = st.columns(4)
+    fim = ingestor.windows.fim
+    col_a.metric("Leituras Recebidas", f"{ingestor.readings:,}")
+    col_b.metric("Eventos ao Vivo", f"{ingestor.events:,}")
+    col_c.metric("Atraso do Último Lote", "-" if ingestor.last_lag_s is None else f"{ingestor.last_lag_s * 1000:,.0f} ms")
+    col_d.metric("Relógio das Leituras", "-" if fim is None else fim.strftime('%d/%m %H:%M'))
+    
+    st.dataframe(
+        ingestor.windows.window(JANELAS[janela]),
+        column_config={
+            'alimentador': 'Alimentador',
+            'leituras': 'Leituras',
+            'carga_media_kw': st.column_config.NumberColumn('Carga Média (kW)', format='%.0f'),
+            'energia_kwh': st.column_config.NumberColumn('Energia (kWh)', format='%.0f'),
+            'tensao_media_v': st.column_config.NumberColumn('Tensão Média (V)', format='%.1f'),
+            'tensao_min_v': st.column_config.NumberColumn('Tensão Mín. (V)', format='%.1f'),
+            'tensao_max_v': st.column_config.NumberColumn('Tensão Máx. (V)', format='%.1f'),
+            'violacoes_pct': st.column_config.NumberColumn('Fora da Faixa', format='%.1f%%'),
+            'eventos': 'Eventos',
+            'criticos': 'Críticos',
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    eventos = ingestor.latest_events(10)
+    if not eventos.empty:
+        st.dataframe(
+            eventos[['id_evento', 'timestamp', 'id_medidor', 'alimentador', 'tipo', 'severidade', 'valor']],
+            hide_index=True,
+            use_container_width=True
+        )
+
+if hasattr(st, 'fragment'):
+    # Reexecuta só este trecho a cada 2 s: eventos novos chegam à tela sem rerun da página
+    render_live_windows = st.fragment(run_every=2)(render_live_windows)
 
 # Header principal
 st.markdown("""
@@ -535,20 +864,19 @@ with st.sidebar:
     num_meters = st.slider("📡 Medidores Ativos", 10, 100, 50, 10)
     num_days = st.slider("📅 Histórico (dias)", 1, 30, 7)
     
+    modo_ao_vivo = st.checkbox("📡 Modo ao vivo (streaming)", value=bool(os.environ.get('STREAM_PORT')))
+    ingestor = get_streaming_ingestor() if modo_ao_vivo else None
+    
     if st.button("🔄 ATUALIZAR DADOS"):
-        st.cache_data.clear()
-        st.rerun()
+        # Recalcula em segundo plano; a versão atual continua sendo servida até a nova ser publicada
+        precompute.request_refresh()
+        st.info("🔄 Atualização solicitada - os dados atuais seguem disponíveis até a nova versão ser publicada")
     
     st.markdown("---")
     st.markdown("### STATUS DO SISTEMA")
     
-    st.markdown("""
-    <div style='font-size: 0.85rem; line-height: 1.8;'>
-    <p><span class='status-indicator status-online'></span><strong>Ambiente:</strong> Laboratório (Sandbox)</p>
-    <p><span class='status-indicator status-online'></span><strong>Dados:</strong> Sintéticos - RN</p>
-    <p><span class='status-indicator status-online'></span><strong>Atualização:</strong> Tempo Real</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # Preenchido ao final da execução, com a latência desta página já medida
+    status_sistema = st.empty()
     
     st.markdown("---")
     st.markdown("### STACK TECNOLÓGICO")
@@ -563,10 +891,14 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
-# Carregar dados
+# Carregar dados (apenas os nós do grafo usados pela página)
+data_version, publicado_em = precompute.version(num_meters, num_days)
 with st.spinner("⚙️ Processando dados da rede elétrica..."):
-    df = generate_smart_meter_data(num_meters, num_days)
-    events_df = detect_events_advanced(df)
+    datasets = {name: dataset_graph.get(name, data_version) for name in PAGE_DATASETS[page]}
+
+df = datasets.get('readings')
+events_df = datasets.get('events')
+asset_registry, asset_indexes = datasets.get('assets', (None, None))
 
 # PÁGINA 1: Ingestão & Qualidade
 if page == "📊 Ingestão & Qualidade":
@@ -602,8 +934,8 @@ if page == "📊 Ingestão & Qualidade":
         <strong>📁 Fonte de Dados</strong><br>
         Origem: /data/raw/mdm_export_natal_parnamirim_2026.csv<br><br>
         <strong>🗓️ Período</strong><br>
-        """ + f"{df['timestamp'].min().strftime('%d/%m/%Y %H:%M')}" + """<br>
-        até """ + f"{df['timestamp'].max().strftime('%d/%m/%Y %H:%M')}" + """<br><br>
+        """ + f"{datasets['quality']['inicio'].strftime('%d/%m/%Y %H:%M')}" + """<br>
+        até """ + f"{datasets['quality']['fim'].strftime('%d/%m/%Y %H:%M')}" + """<br><br>
         <strong>📊 Volume</strong><br>
         """ + f"{len(df):,} leituras" + """<br>
         """ + f"{num_meters} medidores" + """
@@ -622,7 +954,7 @@ if page == "📊 Ingestão & Qualidade":
     
     with col2:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
-        missing = int(len(df) * 0.002)
+        missing = datasets['quality']['corrigidos']
         st.metric("DADOS CORRIGIDOS", missing, delta="-99.8%", delta_color="normal")
         st.markdown('</div>', unsafe_allow_html=True)
     
@@ -633,9 +965,52 @@ if page == "📊 Ingestão & Qualidade":
     
     with col4:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
-        conformidade = ((df['tensao_v'] >= 117) & (df['tensao_v'] <= 133)).sum() / len(df) * 100
+        conformidade = datasets['quality']['conformidade']
         st.metric("CONFORMIDADE PRODIST", f"{conformidade:.1f}%")
         st.markdown('</div>', unsafe_allow_html=True)
+    
+    # Percentis e cardinalidades a partir dos sketches mantidos na ingestão
+    st.markdown('<div class="section-title">📐 Estatísticas da Frota (Sketches Mescláveis)</div>', unsafe_allow_html=True)
+    
+    sketches = datasets['sketches']
+    col1, col2 = st.columns(2)
+    with col1:
+        janela = st.selectbox("Janela", ["Período completo", *PERIODOS_ANALISE], key="janela_sketches")
+    with col2:
+        alimentador_sel = st.selectbox("Alimentador", ["Todos", *sorted(sketches.keys['alimentador'].unique())],
+                                       key="alimentador_sketches")
+    
+    filtros = {}
+    if janela in PERIODOS_ANALISE:
+        filtros['inicio'] = datasets['quality']['fim'] - PERIODOS_ANALISE[janela]
+    if alimentador_sel != "Todos":
+        filtros['alimentador'] = alimentador_sel
+    
+    inicio_consulta = time.perf_counter()
+    resumo_frota = sketches.summary(**filtros)
+    p1, p50, p99 = sketches.quantiles('tensao_v', [0.01, 0.5, 0.99], **filtros)
+    duracao_consulta = (time.perf_counter() - inicio_consulta) * 1000
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("TENSÃO p1 / p99", f"{p1:.1f} / {p99:.1f} V", delta=f"mediana {p50:.1f} V", delta_color="off")
+    with col2:
+        st.metric("MEDIDORES DISTINTOS", f"≈ {resumo_frota['medidores']:,.0f}")
+    with col3:
+        st.metric("MEDIDORES COM VIOLAÇÃO", f"≈ {resumo_frota['medidores_violacao']:,.0f}",
+                 delta="tensão fora da faixa do perfil", delta_color="off")
+    with col4:
+        st.metric("CONFORMIDADE NA JANELA", f"{resumo_frota['conformidade']:.1f}%")
+    
+    fig = figure_cache.get_or_build(
+        (data_version, get_rule_engine().version, 'percentis_tensao', janela, alimentador_sel),
+        lambda: build_voltage_percentile_figure(
+            sketches.quantiles_by('tensao_v', [0.01, 0.99], by=['alimentador', 'hora_dia'], **filtros),
+            feeder_voltage_limits(sketches.keys['alimentador'].unique()))
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Consulta respondida em {duracao_consulta:.1f} ms mesclando {sketches.select(**filtros).sum():,} partições "
+               f"(alimentador x região x hora) | quantis com erro relativo ≤ 0,2% | distintos via HyperLogLog (≈3%)")
 
 # PÁGINA 2: Visão Operacional
 elif page == "📈 Visão Operacional":
@@ -645,8 +1020,10 @@ elif page == "📈 Visão Operacional":
     # Métricas principais
     col1, col2, col3, col4 = st.columns(4)
     
+    resumo_frota = datasets['sketches'].summary()
+    
     with col1:
-        tensao_media = df['tensao_v'].mean()
+        tensao_media = resumo_frota['tensao_media']
         delta_tensao = tensao_media - 127
         st.metric("TENSÃO MÉDIA DA REDE", f"{tensao_media:.1f} V", 
                  delta=f"{delta_tensao:+.1f}V em relação ao nominal",
@@ -659,70 +1036,79 @@ elif page == "📈 Visão Operacional":
                  delta_color="inverse" if eventos_criticos > 0 else "normal")
     
     with col3:
-        carga_total = df['potencia_kw'].sum() / 1000
+        carga_total = resumo_frota['potencia_total_kw'] / 1000
         st.metric("CARGA TOTAL INSTANTÂNEA", f"{carga_total:.2f} MW")
     
     with col4:
-        temp_media = df['temperatura_estimada'].mean()
+        temp_media = resumo_frota['temperatura_media']
         st.metric("TEMPERATURA ESTIMADA", f"{temp_media:.1f}°C",
                  delta="Alta demanda por refrigeração" if temp_media > 30 else "Normal")
     
     st.markdown("---")
     
+    # Modo ao vivo: janelas deslizantes alimentadas pela ingestão em streaming
+    if modo_ao_vivo:
+        st.markdown('<div class="section-title">📡 Janelas Deslizantes ao Vivo</div>', unsafe_allow_html=True)
+        
+        if ingestor is None:
+            st.warning("⚠️ Porta de ingestão (STREAM_PORT) indisponível - modo ao vivo desativado")
+        else:
+            host, port = ingestor.address
+            st.caption(f"Leituras JSON (uma por linha) em {host}:{port} | regras aplicadas a cada lote | atualização a cada 2 s")
+            
+            if st.button("▶️ REPRODUZIR ÚLTIMAS 24 H NO STREAM"):
+                replay_readings(host, port, df[df['timestamp'] > df['timestamp'].max() - PERIODOS_ANALISE["Últimas 24 Horas"]])
+            
+            render_live_windows(ingestor)
+        
+        st.markdown("---")
+    
     # Mapa e Eventos
     col1, col2 = st.columns([2, 1])
     
     with col1:
         st.markdown('<div class="section-title">🗺️ Geolocalização de Ativos - Região Metropolitana de Natal</div>', unsafe_allow_html=True)
         
+        status_medidores = meter_status(asset_registry['medidores'], events_df)
+        contagem_status = status_medidores['status'].value_counts()
+        
+        zoom = st.select_slider("🔍 Zoom do mapa", options=list(range(10, 17)), value=12)
+        tiles = aggregate_tiles(status_medidores, zoom)
+        centro = (status_medidores['lat'].mean(), status_medidores['lon'].mean())
+        
+        st.plotly_chart(build_map_figure(tiles, centro, zoom), use_container_width=True)
+        
         st.markdown(f"""
-        <div style='background: linear-gradient(135deg, #E3F2FD 0%, #BBDEFB 100%); 
-                    padding: 2.5rem; border-radius: 12px; text-align: center; 
-                    box-shadow: 0 4px 12px rgba(0,0,0,0.1); border: 2px solid #90CAF9;'>
-        <h3 style='color: #003D5C; margin-bottom: 1rem;'>🛰️ Sistema GIS Integrado</h3>
-        <p style='font-size: 1.1rem; color: #0277BD; font-weight: 600;'>Alimentadores Monitorados: Natal & Parnamirim</p>
-        <div style='margin-top: 1.5rem; display: flex; justify-content: space-around; flex-wrap: wrap;'>
+        <div style='display: flex; justify-content: space-around; flex-wrap: wrap; text-align: center;'>
             <div style='margin: 0.5rem;'>
-                <div style='font-size: 2rem; font-weight: 700; color: #2E7D32;'>{num_meters - eventos_criticos}</div>
+                <div style='font-size: 2rem; font-weight: 700; color: #2E7D32;'>{contagem_status.get('normal', 0)}</div>
                 <div style='font-size: 0.9rem; color: #546E7A;'>🟢 Medidores Normais</div>
             </div>
             <div style='margin: 0.5rem;'>
-                <div style='font-size: 2rem; font-weight: 700; color: #F57C00;'>{len(events_df[events_df['severidade']=='ALTA']) if not events_df.empty else 0}</div>
+                <div style='font-size: 2rem; font-weight: 700; color: #F57C00;'>{contagem_status.get('alerta', 0)}</div>
                 <div style='font-size: 0.9rem; color: #546E7A;'>🟡 Com Alerta</div>
             </div>
             <div style='margin: 0.5rem;'>
-                <div style='font-size: 2rem; font-weight: 700; color: #C62828;'>{eventos_criticos}</div>
+                <div style='font-size: 2rem; font-weight: 700; color: #C62828;'>{contagem_status.get('crítico', 0)}</div>
                 <div style='font-size: 0.9rem; color: #546E7A;'>🔴 Críticos</div>
             </div>
         </div>
-        <p style='margin-top: 1.5rem; font-size: 0.85rem; color: #546E7A;'>
-        Cobertura: Zona Sul, Zona Leste (Natal) | Centro, Nova Parnamirim (Parnamirim)</p>
-        </div>
+        <p style='margin-top: 0.5rem; font-size: 0.85rem; color: #546E7A; text-align: center;'>
+        {len(tiles):,} células agregadas no servidor | Cobertura: Zona Sul, Zona Leste (Natal) | Centro, Nova Parnamirim (Parnamirim)</p>
         """, unsafe_allow_html=True)
     
     with col2:
         st.markdown("### 🚨 EVENTOS PRIORITÁRIOS")
         
         if not events_df.empty:
-            priority_events = events_df[events_df['severidade'].isin(['CRÍTICA', 'ALTA'])].head(5)
+            priority_events = events_df[events_df['severidade'].isin(['CRÍTICA', 'ALTA'])]
             
-            for _, evt in priority_events.iterrows():
-                if evt['severidade'] == 'CRÍTICA':
-                    badge_class = "badge-critico"
-                elif evt['severidade'] == 'ALTA':
-                    badge_class = "badge-alerta"
-                else:
-                    badge_class = "badge-media"
-                
-                st.markdown(f"""
-                <div class="section-card" style="margin-bottom: 1rem;">
-                    <span class="status-badge {badge_class}">{evt['severidade']}</span>
-                    <h4 style='color: #003D5C; margin: 0.5rem 0;'>{evt['tipo']}</h4>
-                    <p style='margin: 0.3rem 0; font-size: 0.9rem;'><strong>ID:</strong> {evt['id_medidor']}</p>
-                    <p style='margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;'>{evt['regiao']}</p>
-                    <p style='margin: 0.5rem 0; font-size: 0.9rem;'>{evt['descricao']}</p>
-                </div>
-                """, unsafe_allow_html=True)
+            render_card_list(
+                PRIORITY_EVENT_CARD,
+                priority_events.assign(badge_class=priority_events['severidade'].map(BADGE_POR_SEVERIDADE).fillna('badge-media')),
+                key="pagina_eventos_prioritarios",
+                page_size=5
+            )
         else:
             st.success("✅ Sistema operando em condições normais - Nenhum evento prioritário")
     
@@ -731,28 +1117,83 @@ elif page == "📈 Visão Operacional":
     # Balanço Energético
     st.markdown('<div class="section-title">⚡ Balanço Energético por Alimentador (Últimas 24h)</div>', unsafe_allow_html=True)
     
-    last_24h = df[df['timestamp'] >= (datetime.now() - timedelta(hours=24))]
-    
     # Gráfico por alimentador
-    alim_energy = last_24h.groupby(['alimentador', last_24h['timestamp'].dt.hour]).agg({
-        'energia_kwh': 'sum'
-    }).reset_index()
-    
-    fig = px.bar(alim_energy, x='timestamp', y='energia_kwh', color='alimentador',
-                 labels={'timestamp': 'Hora do Dia', 'energia_kwh': 'Energia (kWh)', 'alimentador': 'Alimentador'},
-                 title='Consumo Energético Horário por Alimentador',
-                 color_discrete_sequence=['#00A9CE', '#0088AA', '#006688', '#004466'])
+    alim_energy = datasets['rollups']['energia_horaria']
     
-    fig.update_layout(
-        height=400,
-        margin=dict(l=20, r=20, t=50, b=20),
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(family='Inter', size=12),
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    fig = figure_cache.get_or_build(
+        (data_version, 'energia_alimentador'),
+        lambda: build_feeder_energy_figure(alim_energy)
     )
     
     st.plotly_chart(fig, use_container_width=True)
+    
+    # Previsão D+1: modelos por alimentador em disco, reajustados só quando chegam intervalos novos
+    st.markdown('<div class="section-title">📈 Previsão de Demanda por Alimentador (Próximas 24h)</div>', unsafe_allow_html=True)
+    
+    previsao = datasets['forecast']
+    if previsao['previsao'].empty:
+        st.info("ℹ️ Histórico insuficiente para a previsão - são necessários ao menos 3 dias de leituras")
+    else:
+        picos = previsao['picos']
+        maior = picos.loc[picos['pico_kw'].idxmax()]
+        
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Pico Previsto (Rede)", f"{previsao['previsao'].groupby('timestamp')['previsao_kw'].sum().max() / 1000:.2f} MW")
+        col2.metric("Alimentador Mais Carregado", maior['alimentador'].split(' ')[0], delta=f"{maior['pico_kw']:,.0f} kW às {maior['hora_pico']}", delta_color="off")
+        col3.metric("Média no Pico de AC (12-15h)", f"{picos['media_pico_ac_kw'].sum():,.0f} kW")
+        col4.metric("Horizonte", f"{previsao['previsao']['timestamp'].min().strftime('%d/%m %H:%M')} +24h")
+        
+        fig = figure_cache.get_or_build(
+            (data_version, 'previsao_demanda'),
+            lambda: build_forecast_figure(previsao['historico'], previsao['previsao'])
+        )
+        
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption("Ridge por alimentador: hora do dia, carga de 1 e 2 dias antes e temperatura estimada do dia anterior")
+    
+    # Perdas: medição de fronteira (cabeça/transformador) x energia faturada
+    st.markdown('<div class="section-title">🔌 Perdas Técnicas e Não Técnicas por Alimentador</div>', unsafe_allow_html=True)
+    
+    balanco = datasets['energy_balance']
+    resumo = balanco['resumo']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("ENERGIA INJETADA", f"{resumo['energia_injetada_kwh'].sum() / 1000:,.1f} MWh")
+    with col2:
+        st.metric("ENERGIA FATURADA", f"{resumo['energia_faturada_kwh'].sum() / 1000:,.1f} MWh")
+    with col3:
+        st.metric("PERDA TOTAL", f"{resumo['perda_kwh'].sum() / resumo['energia_injetada_kwh'].sum():.1%}")
+    with col4:
+        st.metric("PNT ESTIMADA", f"{resumo['perda_nao_tecnica_kwh'].sum() / 1000:,.2f} MWh")
+    
+    col1, col2 = st.columns([3, 2])
+    
+    with col1:
+        fig = figure_cache.get_or_build(
+            (data_version, 'perdas_alimentador'),
+            lambda: build_feeder_loss_figure(balanco['alimentadores'])
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        st.markdown("### 🕵️ SUSPEITOS DE PNT")
+        suspeitos = balanco['suspeitos'].head(10)
+        suspeitos = suspeitos.assign(queda=suspeitos['queda'] * 100)
+        st.dataframe(
+            suspeitos[['posicao', 'id_medidor', 'id_transformador', 'queda', 'energia_nao_registrada_kwh', 'score']],
+            column_config={
+                'posicao': '#',
+                'id_medidor': 'Medidor',
+                'id_transformador': 'Transformador',
+                'queda': st.column_config.NumberColumn('Queda', format='%.0f%%'),
+                'energia_nao_registrada_kwh': st.column_config.NumberColumn('kWh não registrado', format='%.0f'),
+                'score': st.column_config.ProgressColumn('Score', min_value=0.0, max_value=1.0),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.caption(f"Ranking por queda de consumo, desvio em relação aos vizinhos do transformador e aumento da perda do transformador | {len(balanco['suspeitos']):,} medidores avaliados")
 
 # PÁGINA 3: Análise Avançada
 elif page == "🔍 Análise Avançada":
@@ -766,22 +1207,34 @@ elif page == "🔍 Análise Avançada":
         selected_meter = st.selectbox("Medidor", sorted(df['id_medidor'].unique()), label_visibility="collapsed")
         
         period = st.selectbox("Período de Análise", 
-                             ["Últimas 24 Horas", "Últimos 7 Dias", "Últimos 30 Dias"],
+                             list(PERIODOS_ANALISE),
                              label_visibility="collapsed")
         
         if st.button("🔄 ATUALIZAR ANÁLISE", use_container_width=True):
             st.rerun()
         
         meter_data = df[df['id_medidor'] == selected_meter]
+        meter_period = meter_data[meter_data['timestamp'] >= meter_data['timestamp'].max() - PERIODOS_ANALISE[period]]
         
         if not meter_data.empty:
+            # Medidores de alimentadores sem cadastro georreferenciado não estão no registro de ativos
+            medidores_geo = asset_registry['medidores'].set_index('id_medidor')
+            if selected_meter in medidores_geo.index:
+                meter_asset = medidores_geo.loc[selected_meter]
+                transformador = meter_asset['id_transformador']
+                coordenadas = f"{meter_asset['lat']:.5f}, {meter_asset['lon']:.5f}"
+            else:
+                transformador = coordenadas = "não georreferenciado"
+            
             st.markdown("---")
             st.markdown("#### 📊 RESUMO")
             st.markdown(f"""
             <div style='font-size: 0.85rem; line-height: 1.8;'>
             <strong>Alimentador:</strong><br>{meter_data['alimentador'].iloc[0]}<br><br>
             <strong>Região:</strong><br>{meter_data['regiao'].iloc[0]}<br><br>
-            <strong>Leituras:</strong><br>{len(meter_data):,}
+            <strong>Leituras:</strong><br>{len(meter_data):,}<br><br>
+            <strong>Transformador:</strong><br>{transformador}<br><br>
+            <strong>Coordenadas:</strong><br>{coordenadas}
             </div>
             """, unsafe_allow_html=True)
     
@@ -802,43 +1255,13 @@ elif page == "🔍 Análise Avançada":
     
     with col1:
         st.markdown('<div class="section-title">📊 Perfil de Tensão (PRODIST Módulo 8)</div>', unsafe_allow_html=True)
-        st.caption("Tensão nominal 127V | Faixa adequada: 117V - 133V | Precário: 110-117V / 133-135V")
-        
-        meter_sorted = meter_data.sort_values('timestamp').tail(200)
-        
-        fig = go.Figure()
+        inferior, superior = (float(lim[0]) for lim in voltage_limits(meter_data.head(1)))
+        st.caption(f"Tensão nominal {nominal_voltage((inferior, superior))}V | "
+                   f"Faixa adequada do perfil do medidor: {inferior:g}V - {superior:g}V")
         
-        # Linha de tensão
-        fig.add_trace(go.Scatter(
-            x=meter_sorted['timestamp'],
-            y=meter_sorted['tensao_v'],
-            mode='lines',
-            name='Tensão Medida',
-            line=dict(color='#00A9CE', width=2.5),
-            fill='tozeroy',
-            fillcolor='rgba(0,169,206,0.1)'
-        ))
-        
-        # Limites PRODIST
-        fig.add_hline(y=133, line_dash="dash", line_color="#F57C00", 
-                     annotation_text="Limite Superior Adequado (133V)",
-                     annotation_position="right")
-        fig.add_hline(y=127, line_dash="dot", line_color="#4CAF50",
-                     annotation_text="Tensão Nominal (127V)",
-                     annotation_position="right")
-        fig.add_hline(y=117, line_dash="dash", line_color="#F57C00",
-                     annotation_text="Limite Inferior Adequado (117V)",
-                     annotation_position="right")
-        
-        fig.update_layout(
-            height=350,
-            margin=dict(l=0, r=0, t=30, b=0),
-            xaxis_title="",
-            yaxis_title="Tensão (V)",
-            showlegend=False,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(family='Inter', size=11)
+        fig = figure_cache.get_or_build(
+            (data_version, get_rule_engine().version, 'perfil_tensao', selected_meter, period),
+            lambda: build_voltage_figure(meter_period, (inferior, superior))
         )
         
         st.plotly_chart(fig, use_container_width=True)
@@ -847,44 +1270,64 @@ elif page == "🔍 Análise Avançada":
         st.markdown('<div class="section-title">⚡ Curva de Carga Diária</div>', unsafe_allow_html=True)
         st.caption("Padrão de consumo por hora do dia - Identificação de picos de demanda")
         
-        hourly_profile = meter_data.groupby('hora').agg({
-            'potencia_kw': ['mean', 'max'],
-            'energia_kwh': 'sum'
-        }).reset_index()
-        hourly_profile.columns = ['hora', 'potencia_media', 'potencia_max', 'energia_total']
-        
-        fig = go.Figure()
-        
-        fig.add_trace(go.Bar(
-            x=hourly_profile['hora'],
-            y=hourly_profile['potencia_media'],
-            name='Potência Média',
-            marker_color='#FFB300',
-            marker_line_color='#FF8F00',
-            marker_line_width=1.5
-        ))
-        
-        fig.add_trace(go.Scatter(
-            x=hourly_profile['hora'],
-            y=hourly_profile['potencia_max'],
-            name='Pico de Demanda',
-            line=dict(color='#C62828', width=3),
-            mode='lines+markers'
-        ))
+        fig = figure_cache.get_or_build(
+            (data_version, 'curva_carga', selected_meter, period),
+            lambda: build_load_curve_figure(meter_period)
+        )
         
-        fig.update_layout(
-            height=350,
-            margin=dict(l=0, r=0, t=30, b=0),
-            xaxis_title="Hora do Dia",
-            yaxis_title="Potência (kW)",
-            showlegend=True,
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(family='Inter', size=11)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    # Segmentação de perfis: todos os medidores em lote, semelhantes via índice k-NN
+    st.markdown("---")
+    st.markdown('<div class="section-title">🧬 Segmentação de Perfis de Carga</div>', unsafe_allow_html=True)
+    st.caption("Perfil diário médio normalizado pela média de cada medidor + nível de consumo | MiniBatchKMeans sobre toda a base")
+    
+    motor = datasets['profiles']
+    perfil_medidor = motor.profile(selected_meter)
+    semelhantes = motor.similar(selected_meter, k=5)
+    
+    col_a, col_b, col_c, col_d = st.columns(4)
+    col_a.metric("Segmento", f"{perfil_medidor['segmento']}")
+    col_b.metric("Medidores no Segmento", f"{(motor.meters['segmento'] == perfil_medidor['segmento']).sum():,}")
+    col_c.metric("Hora de Pico", f"{perfil_medidor['hora_pico']}h")
+    col_d.metric("Potência Média", f"{perfil_medidor['media_kw']:.2f} kW")
+    st.caption(f"{perfil_medidor['descricao']}")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        fig = figure_cache.get_or_build(
+            (data_version, 'perfil_semelhantes', selected_meter),
+            lambda: build_profile_similarity_figure(motor, selected_meter, semelhantes)
         )
         
         st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        st.markdown("#### 👥 MEDIDORES SEMELHANTES")
+        st.dataframe(
+            semelhantes[['id_medidor', 'descricao', 'media_kw', 'hora_pico', 'distancia']],
+            column_config={
+                'id_medidor': 'Medidor',
+                'descricao': 'Segmento',
+                'media_kw': st.column_config.NumberColumn('Potência Média (kW)', format='%.2f'),
+                'hora_pico': 'Hora de Pico',
+                'distancia': st.column_config.NumberColumn('Distância', format='%.3f'),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        st.dataframe(
+            motor.segments[['segmento', 'descricao', 'medidores', 'media_kw']],
+            column_config={
+                'segmento': 'Segmento',
+                'descricao': 'Descrição',
+                'medidores': 'Medidores',
+                'media_kw': st.column_config.NumberColumn('Potência Média (kW)', format='%.2f'),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
 
 # PÁGINA 4: Motor de Eventos
 elif page == "⚡ Motor de Eventos":
@@ -892,53 +1335,80 @@ elif page == "⚡ Motor de Eventos":
     st.markdown('<div class="section-subtitle">Sistema inteligente de detecção baseado em regras determinísticas e algoritmos de análise para geração automática de insights operacionais e comerciais</div>', unsafe_allow_html=True)
     
     if not events_df.empty:
-        # Filtros avançados
+        event_index = datasets['event_index']
+        
+        # Filtros avançados (opções e códigos vêm do índice da versão dos eventos)
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            tipo_filter = st.multiselect("🏷️ Tipo de Evento", events_df['tipo'].unique())
+            tipo_filter = st.multiselect("🏷️ Tipo de Evento", event_index.options['tipo'])
         with col2:
-            sev_filter = st.multiselect("⚠️ Severidade", events_df['severidade'].unique())
+            sev_filter = st.multiselect("⚠️ Severidade", event_index.options['severidade'])
         with col3:
-            dest_filter = st.multiselect("📍 Destino", events_df['destino'].unique())
+            dest_filter = st.multiselect("📍 Destino", event_index.options['destino'])
         with col4:
-            alim_filter = st.multiselect("🔌 Alimentador", events_df['alimentador'].unique())
+            alim_filter = st.multiselect("🔌 Alimentador", event_index.options['alimentador'])
         
         # Aplicar filtros
-        filtered = events_df.copy()
-        if tipo_filter:
-            filtered = filtered[filtered['tipo'].isin(tipo_filter)]
-        if sev_filter:
-            filtered = filtered[filtered['severidade'].isin(sev_filter)]
-        if dest_filter:
-            filtered = filtered[filtered['destino'].isin(dest_filter)]
-        if alim_filter:
-            filtered = filtered[filtered['alimentador'].isin(alim_filter)]
+        filtros = {'tipo': tipo_filter, 'severidade': sev_filter, 'destino': dest_filter, 'alimentador': alim_filter}
+        linhas = event_index.rows(filtros)
+        por_severidade = event_index.counts(linhas, 'severidade')
         
         st.markdown("---")
         
         # Métricas de eventos
         col1, col2, col3, col4 = st.columns(4)
-        col1.metric("Total de Eventos", len(filtered))
-        col2.metric("Críticos", len(filtered[filtered['severidade']=='CRÍTICA']))
-        col3.metric("Altos", len(filtered[filtered['severidade']=='ALTA']))
-        col4.metric("Médios", len(filtered[filtered['severidade']=='MÉDIA']))
+        col1.metric("Total de Eventos", len(linhas))
+        col2.metric("Críticos", por_severidade.get('CRÍTICA', 0))
+        col3.metric("Altos", por_severidade.get('ALTA', 0))
+        col4.metric("Médios", por_severidade.get('MÉDIA', 0))
+        
+        episodes = datasets['episodes']
+        chaves = events_df[['id_medidor', 'tipo']].take(linhas).drop_duplicates()
+        episodes_filtrados = episodes.merge(chaves, on=['id_medidor', 'tipo'])
+        st.caption(f"{len(episodes_filtrados):,} episódios (eventos consecutivos do mesmo medidor e tipo agrupados)")
         
         st.markdown("---")
         
-        # Tabela de eventos
+        # Tabela de eventos: ordenação e paginação no servidor, só a página visível vai ao navegador
+        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+        
+        with col1:
+            ordenar_por = st.selectbox("↕️ Ordenar por", list(SORT_COLUMNS), format_func=SORT_COLUMNS.get)
+        with col2:
+            decrescente = st.checkbox("Decrescente", value=ordenar_por in ('timestamp', 'severidade', 'impacto'))
+        with col3:
+            por_pagina = st.selectbox("Linhas por página", [15, 50, 100])
+        
+        total_paginas = max(1, -(-len(linhas) // por_pagina))
+        with col4:
+            pagina = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+        
         st.dataframe(
-            filtered[['id_evento', 'id_medidor', 'alimentador', 'tipo', 'severidade', 
-                     'valor', 'acao_sugerida', 'destino', 'impacto']],
-            use_container_width=True,
-            height=450
+            event_index.page(filtros, ordenar_por, decrescente, pagina, por_pagina),
+            column_config={
+                'id_evento': 'ID',
+                'timestamp': st.column_config.DatetimeColumn('Data/Hora', format='DD/MM/YYYY HH:mm'),
+                'id_medidor': 'Medidor',
+                'alimentador': 'Alimentador',
+                'tipo': 'Tipo',
+                'severidade': 'Severidade',
+                'valor': 'Valor',
+                'acao_sugerida': 'Ação Sugerida',
+                'destino': 'Destino',
+                'impacto': 'Impacto',
+            },
+            hide_index=True,
+            use_container_width=True
         )
+        inicio_pagina = (pagina - 1) * por_pagina
+        st.caption(f"Página {pagina:,} de {total_paginas:,} | eventos {min(inicio_pagina + 1, len(linhas)):,}"
+                   f"-{min(inicio_pagina + por_pagina, len(linhas)):,} de {len(linhas):,}")
         
-        # Botão de exportação
-        csv = filtered.to_csv(index=False)
+        # Botão de exportação: o CSV só é gerado no clique (em outra thread), não a cada rerun
         st.download_button(
             label="📥 EXPORTAR EVENTOS (CSV)",
-            data=csv,
+            data=lambda eventos=events_df, linhas=linhas: eventos.take(linhas).to_csv(index=False),
             file_name=f"eventos_rn_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
             mime="text/csv",
             use_container_width=False
@@ -966,19 +1436,7 @@ else:
             st.markdown('<div class="section-card">', unsafe_allow_html=True)
             st.markdown("#### 📊 ALIMENTADORES MONITORADOS")
             
-            for alim in df['alimentador'].unique():
-                alim_data = df[df['alimentador'] == alim]
-                carga = alim_data['potencia_kw'].sum() / 1000
-                medidores = alim_data['id_medidor'].nunique()
-                
-                st.markdown(f"""
-                <div style='margin: 1rem 0; padding: 1rem; background: #F5F7FA; border-radius: 8px;'>
-                <strong style='color: #003D5C;'>{alim}</strong><br>
-                <span style='font-size: 0.9rem; color: #546E7A;'>
-                Carga: {carga:.2f} MW | Medidores: {medidores}
-                </span>
-                </div>
-                """, unsafe_allow_html=True)
+            st.markdown(FEEDER_CARD.render(datasets['rollups']['alimentadores']), unsafe_allow_html=True)
             
             st.markdown('</div>', unsafe_allow_html=True)
         
@@ -1002,6 +1460,53 @@ else:
             st.progress(taxa_comunicacao/100)
             
             st.markdown('</div>', unsafe_allow_html=True)
+        
+        st.markdown("---")
+        st.markdown("#### 📍 CONSULTAS ESPACIAIS (R-TREE)")
+        st.caption(f"Ativos georreferenciados: {len(asset_indexes['medidores']):,} medidores | "
+                   f"{len(asset_indexes['transformadores']):,} transformadores | "
+                   f"{len(asset_indexes['alimentadores'])} alimentadores")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            trafos = asset_registry['transformadores']
+            selected_trafo = st.selectbox("Transformador", trafos['id_transformador'])
+            k_vizinhos = st.slider("Medidores mais próximos", 1, 20, 5)
+            
+            trafo = trafos[trafos['id_transformador'] == selected_trafo].iloc[0]
+            inicio = datetime.now()
+            vizinhos = asset_indexes['medidores'].nearest(trafo['lat'], trafo['lon'], k_vizinhos)
+            tempo_ms = (datetime.now() - inicio).total_seconds() * 1000
+            
+            st.dataframe(
+                vizinhos[['id_medidor', 'id_transformador', 'alimentador', 'distancia_m']].round({'distancia_m': 1}),
+                use_container_width=True, hide_index=True
+            )
+            st.caption(f"k-vizinhos em {tempo_ms:.2f} ms")
+        
+        with col2:
+            incidentes = events_df[events_df['severidade'] == 'CRÍTICA'] if not events_df.empty else events_df
+            # Só incidentes com origem georreferenciada (alimentador presente no cadastro)
+            incidentes = incidentes[incidentes['id_medidor'].isin(asset_registry['medidores']['id_medidor'])]
+            
+            if not incidentes.empty:
+                selected_incidente = st.selectbox("Incidente (evento crítico)", incidentes['id_evento'].head(200))
+                raio = st.slider("Raio (m)", 100, 2000, 500, 100)
+                
+                incidente = incidentes[incidentes['id_evento'] == selected_incidente].iloc[0]
+                origem = asset_registry['medidores'].set_index('id_medidor').loc[incidente['id_medidor']]
+                inicio = datetime.now()
+                proximos = events_within(events_df, asset_indexes['medidores'], origem['lat'], origem['lon'], raio)
+                tempo_ms = (datetime.now() - inicio).total_seconds() * 1000
+                
+                st.dataframe(
+                    proximos[['id_evento', 'id_medidor', 'tipo', 'severidade', 'distancia_m']].round({'distancia_m': 1}),
+                    use_container_width=True, hide_index=True
+                )
+                st.caption(f"{len(proximos)} eventos a até {raio} m de {incidente['id_medidor']} em {tempo_ms:.2f} ms")
+            else:
+                st.info("ℹ️ Nenhum incidente crítico para correlação espacial")
     
     with tab2:
         st.markdown("### ⚡ Advanced Distribution Management System (ADMS)")
@@ -1015,26 +1520,12 @@ else:
                 
                 st.markdown("#### 🚨 EVENTOS CRÍTICOS ATIVOS")
                 
-                for i, (_, evt) in enumerate(criticos.head(5).iterrows(), 1):
-                    st.markdown(f"""
-                    <div class="section-card" style="border-left-color: #C62828;">
-                        <div style="display: flex; justify-content: space-between; align-items: center;">
-                            <div>
-                                <h4 style="margin: 0; color: #C62828;">{evt['tipo']}</h4>
-                                <p style="margin: 0.3rem 0;"><strong>{evt['id_medidor']}</strong> | {evt['alimentador']}</p>
-                                <p style="margin: 0.3rem 0; font-size: 0.9rem; color: #546E7A;">{evt['regiao']}</p>
-                            </div>
-                            <div>
-                                <span class="status-badge badge-critico">{evt['severidade']}</span>
-                            </div>
-                        </div>
-                        <p style="margin: 0.8rem 0 0.3rem 0;"><strong>Descrição:</strong> {evt['descricao']}</p>
-                        <p style="margin: 0.3rem 0;"><strong>Ação Sugerida:</strong> {evt['acao_sugerida']}</p>
-                        <p style="margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;">
-                        <strong>Timestamp:</strong> {evt['timestamp'].strftime('%d/%m/%Y %H:%M:%S')}
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                render_card_list(
+                    CRITICAL_EVENT_CARD,
+                    criticos.assign(timestamp_fmt=criticos['timestamp'].dt.strftime('%d/%m/%Y %H:%M:%S')),
+                    key="pagina_eventos_criticos",
+                    page_size=5
+                )
             else:
                 st.success("✅ **SISTEMA NORMAL:** Rede operando em condições adequadas")
         else:
@@ -1045,48 +1536,45 @@ else:
         st.markdown("Integração com ERP para criação automatizada de OS a partir de eventos críticos e de alta prioridade")
         
         if not events_df.empty:
-            os_events = events_df[events_df['severidade'].isin(['CRÍTICA', 'ALTA'])]
+            work_orders = datasets['work_orders']
             
-            if not os_events.empty:
+            if not work_orders.empty:
                 col1, col2, col3, col4 = st.columns(4)
                 
-                num_os = len(os_events)
-                custo_medio = 1200 if 'CRÍTICA' in os_events['severidade'].values else 800
-                custo_total = num_os * custo_medio
+                num_os = len(work_orders)
+                custo_total = work_orders['custo_estimado'].sum()
                 equipes = max(1, num_os // 4)
+                tem_critica = (work_orders['prioridade'] == 'CRÍTICA').any()
                 
                 col1.metric("OS GERADAS", num_os)
                 col2.metric("CUSTO ESTIMADO", f"R$ {custo_total:,.2f}")
                 col3.metric("EQUIPES NECESSÁRIAS", equipes)
-                col4.metric("PRAZO MÉDIO", "4-6h" if 'CRÍTICA' in os_events['severidade'].values else "24-48h")
+                col4.metric("PRAZO MÉDIO", "4-6h" if tem_critica else "24-48h")
+                
+                if st.button("📤 ENVIAR OS AO SAP"):
+                    host, port = get_sap_endpoint()
+                    with st.spinner(f"Enviando {num_os} OS em lotes para {host}:{port}..."):
+                        resultado = dispatch_work_orders(work_orders, host=host, port=port)
+                    
+                    col1, col2, col3, col4 = st.columns(4)
+                    col1.metric("OS CRIADAS", resultado.criadas)
+                    col2.metric("JÁ EXISTENTES", resultado.duplicadas)
+                    col3.metric("FALHAS", resultado.falhas, delta=f"{resultado.retentativas} retentativas", delta_color="off")
+                    col4.metric("VAZÃO", f"{resultado.vazao_os_s:,.0f} OS/s",
+                               delta=f"p95 {resultado.latencia_percentil(95):.0f}ms por lote", delta_color="off")
                 
                 st.markdown("---")
                 st.markdown("#### 📋 ORDENS DE SERVIÇO CRIADAS")
                 
-                for i, (_, evt) in enumerate(os_events.head(8).iterrows(), 1):
-                    os_id = f"OS-RN-{202501000 + i}"
-                    tipo_os = "EMERGENCIAL" if evt['severidade'] == 'CRÍTICA' else "CORRETIVA"
-                    
-                    st.markdown(f"""
-                    <div class="section-card">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 0.8rem;">
-                            <h4 style="margin: 0; color: #003D5C;">{os_id}</h4>
-                            <span class="status-badge {'badge-critico' if evt['severidade']=='CRÍTICA' else 'badge-alerta'}">{tipo_os}</span>
-                        </div>
-                        <p style="margin: 0.3rem 0;"><strong>Tipo de Serviço:</strong> {evt['tipo']}</p>
-                        <p style="margin: 0.3rem 0;"><strong>Medidor:</strong> {evt['id_medidor']}</p>
-                        <p style="margin: 0.3rem 0;"><strong>Local:</strong> {evt['regiao']}</p>
-                        <p style="margin: 0.3rem 0;"><strong>Alimentador:</strong> {evt['alimentador']}</p>
-                        <p style="margin: 0.3rem 0;"><strong>Prioridade:</strong> {evt['severidade']}</p>
-                        <p style="margin: 0.5rem 0 0 0; font-size: 0.9rem; color: #546E7A;">
-                        <strong>Ação:</strong> {evt['acao_sugerida']}
-                        </p>
-                        <p style="margin: 0.3rem 0; font-size: 0.85rem; color: #546E7A;">
-                        <strong>Custo Estimado:</strong> R$ {custo_medio:,.2f} | 
-                        <strong>Criado em:</strong> {datetime.now().strftime('%d/%m/%Y %H:%M')}
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
+                render_card_list(
+                    WORK_ORDER_CARD,
+                    work_orders.assign(
+                        badge_class=work_orders['prioridade'].map(BADGE_POR_SEVERIDADE),
+                        timestamp_fmt=work_orders['timestamp_evento'].dt.strftime('%d/%m/%Y %H:%M')
+                    ),
+                    key="pagina_ordens_servico",
+                    page_size=8
+                )
             else:
                 st.info("ℹ️ Nenhuma ordem de serviço gerada automaticamente no período atual")
         else:
@@ -1103,7 +1591,7 @@ st.markdown(f"""
         </div>
         <div style="text-align: right;">
             <strong>Localização:</strong> Natal, Parnamirim e Rio Grande do Norte | 
-            <strong>Atualizado:</strong> {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}
+            <strong>Atualizado:</strong> {publicado_em.strftime('%d/%m/%Y %H:%M:%S')}
         </div>
     </div>
     <div style="margin-top: 0.8rem; padding-top: 0.8rem; border-top: 1px solid #D5DDE5; font-size: 0.8rem;">
@@ -1112,3 +1600,8 @@ st.markdown(f"""
     </div>
 </div>
 """, unsafe_allow_html=True)
+
+RERUN_SECONDS.observe(time.perf_counter() - inicio_rerun, pagina=page)
+render_system_status(status_sistema, page, publicado_em)
+if os.environ.get('METRICS_FILE'):
+    write_metrics_file(os.environ['METRICS_FILE'])
@@ -0,0 +1,165 @@
+"""
+CPFL LABS | TEMA 3
+Fábrica de dados sintéticos de smart meters (Natal/Parnamirim/RN)
+Geração vetorizada por faixa de medidores (shard), com fluxos aleatórios independentes
+derivados de SeedSequence.spawn: o mesmo seed produz o mesmo dataset, seja qual for o
+número de processos. Para testes de carga, os shards vão direto para Parquet particionado.
+
+Uso:
+    python data_factory.py --medidores 1000000 --dias 90 --seed 42 --saida data/loadtest
+    python data_factory.py --medidores 1000000 --dias 90 --formato rnts   (arquivo compactado, ver readings_archive.py)
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from readings_archive import write_archive
+
+# Alimentadores da região Natal/Parnamirim
+ALIMENTADORES = [
+    'AL-NAT-04 (Ponta Negra)',
+    'AL-NAT-07 (Capim Macio)',
+    'AL-PAR-02 (Parnamirim Centro)',
+    'AL-PAR-05 (Nova Parnamirim)'
+]
+
+REGIOES = [
+    'Zona Sul - Natal',
+    'Zona Leste - Natal',
+    'Centro - Parnamirim',
+    'Cotovelo - Parnamirim'
+]
+
+# Padrão de consumo adaptado ao clima do RN (uso de AC), fator por hora do dia
+FATOR_HORARIO = np.array(
+    [0.5] * 6          # 0-5h   madrugada
+    + [1.8] * 3        # 6-8h   manhã
+    + [1.2] * 3        # 9-11h
+    + [3.2] * 4        # 12-15h pico de calor - uso intenso de AC
+    + [1.2] * 2        # 16-17h
+    + [2.8] * 5        # 18-22h noite - ainda quente
+    + [1.2]            # 23h
+)
+
+COLUNAS = ['id_medidor', 'timestamp', 'tensao_v', 'potencia_kw', 'fator_potencia', 'energia_kwh',
+           'alimentador', 'regiao', 'hora', 'temperatura_estimada']
+
+
+def build_timestamps(days, end_time=None):
+    end_time = end_time or datetime.now()
+    return pd.date_range(start=end_time - timedelta(days=days), end=end_time, freq='15min')
+
+
+def generate_shard(meter_start, meter_stop, timestamps, seed_seq):
+    """Leituras dos medidores [meter_start, meter_stop) em formato longo (medidor x timestamp)"""
+    rng = np.random.default_rng(seed_seq)
+    n_m = meter_stop - meter_start
+    n_t = len(timestamps)
+    forma = (n_m, n_t)
+
+    ids = np.array([f"RN-{39200 + m:05d}" for m in range(meter_start, meter_stop)], dtype=object)
+    alimentador = rng.choice(np.array(ALIMENTADORES, dtype=object), n_m)
+    regiao = rng.choice(np.array(REGIOES, dtype=object), n_m)
+    consumo_base = rng.uniform(2.0, 4.5, n_m)  # kW - perfil residencial RN
+
+    hora = np.asarray(timestamps.hour)
+    pico = (hora >= 12) & (hora <= 15)
+
+    potencia = consumo_base[:, None] * FATOR_HORARIO[hora][None, :] * rng.uniform(0.88, 1.12, forma)
+
+    # Anomalias ocasionais: pico_ac (múltiplos ACs), queda, oscilação
+    anomalia = rng.random(forma) < 0.015
+    tipo_anomalia = rng.integers(0, 3, forma)
+    potencia = np.where(anomalia & (tipo_anomalia == 0), potencia * 4.5, potencia)
+    potencia = np.where(anomalia & (tipo_anomalia == 1), 0.02, potencia)
+    potencia = np.where(anomalia & (tipo_anomalia == 2), potencia * 0.3, potencia)
+
+    # Tensão (127V nominal no RN), subtensões mais frequentes em horário de pico
+    tensao = 127 + rng.normal(0, 2.5, forma)
+    subtensao = (rng.random(forma) < 0.012) & pico[None, :]
+    tensao = np.where(subtensao, rng.uniform(108, 117, forma), tensao)
+
+    # Fator de potência, baixo ocasionalmente por equipamentos
+    fator_pot = rng.uniform(0.87, 0.97, forma)
+    fator_pot = np.where(rng.random(forma) < 0.025, rng.uniform(0.62, 0.75, forma), fator_pot)
+
+    calor = (hora >= 10) & (hora <= 16)
+    temperatura = np.where(calor[None, :], 26 + rng.uniform(-2, 8, forma), 24 + rng.uniform(-2, 4, forma))
+
+    return pd.DataFrame({
+        'id_medidor': np.repeat(ids, n_t),
+        'timestamp': np.tile(timestamps.values, n_m),
+        'tensao_v': tensao.ravel(),
+        'potencia_kw': potencia.ravel(),
+        'fator_potencia': fator_pot.ravel(),
+        'energia_kwh': potencia.ravel() * 0.25,
+        'alimentador': np.repeat(alimentador, n_t),
+        'regiao': np.repeat(regiao, n_t),
+        'hora': np.tile(hora, n_m),
+        'temperatura_estimada': temperatura.ravel(),
+    }, columns=COLUNAS)
+
+
+def shard_ranges(num_meters, shard_size):
+    return [(inicio, min(inicio + shard_size, num_meters + 1))
+            for inicio in range(1, num_meters + 1, shard_size)]
+
+
+def generate_readings(num_meters=50, days=7, seed=None, end_time=None, shard_size=250):
+    """Dataset completo em memória (mesma sequência de shards da geração em disco)"""
+    timestamps = build_timestamps(days, end_time)
+    faixas = shard_ranges(num_meters, shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(faixas))
+    return pd.concat([generate_shard(inicio, fim, timestamps, s) for (inicio, fim), s in zip(faixas, seeds)],
+                     ignore_index=True)
+
+
+def _write_shard(args):
+    numero, inicio, fim, timestamps, seed_seq, saida, formato = args
+    df = generate_shard(inicio, fim, timestamps, seed_seq)
+    pasta = os.path.join(saida, f"shard={numero:05d}")
+    os.makedirs(pasta, exist_ok=True)
+    if formato == 'rnts':
+        write_archive(os.path.join(pasta, 'part-0.rnts'), df)
+    else:
+        df.to_parquet(os.path.join(pasta, 'part-0.parquet'), index=False)
+    return len(df)
+
+
+def write_dataset(saida, num_meters, days, seed, end_time, shard_size=250, workers=None, formato='parquet'):
+    """Gera os shards em um pool de processos e grava Parquet (ou arquivo compactado) particionado por shard"""
+    timestamps = build_timestamps(days, end_time)
+    faixas = shard_ranges(num_meters, shard_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(faixas))
+    tarefas = [(i, inicio, fim, timestamps, s, saida, formato)
+               for i, ((inicio, fim), s) in enumerate(zip(faixas, seeds))]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_write_shard, tarefas))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera dataset sintético reprodutível para teste de carga')
+    parser.add_argument('--medidores', type=int, default=1_000_000)
+    parser.add_argument('--dias', type=int, default=90)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--fim', default=datetime.now().strftime('%Y-%m-%d'),
+                        help='Data/hora final (fixe para reprodutibilidade entre execuções)')
+    parser.add_argument('--shard', type=int, default=250, help='Medidores por shard')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--saida', default='data/loadtest')
+    parser.add_argument('--formato', choices=['parquet', 'rnts'], default='parquet',
+                        help='rnts: delta-of-delta + inteiros escalados (histórico frio)')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    linhas = write_dataset(args.saida, args.medidores, args.dias, args.seed, pd.Timestamp(args.fim),
+                           args.shard, args.workers, args.formato)
+    duracao = time.perf_counter() - inicio
+    print(f"{linhas:,} leituras em {duracao:.1f}s ({linhas / duracao:,.0f} leituras/s) -> {args.saida}")
@@ -0,0 +1,148 @@
+"""
+CPFL LABS | TEMA 3
+Grafo declarativo de datasets derivados
+leituras -> sketches -> qualidade
+leituras -> eventos -> episódios / ordens de serviço / índice da grade; leituras -> agregados
+leituras + ativos -> balanço energético / perdas não técnicas
+leituras -> perfis de carga (segmentos + medidores semelhantes); leituras -> previsão de demanda D+1
+Cada página pede apenas os nós que renderiza; os nós são calculados sob demanda
+e memoizados por versão dos dados no SharedDatasetStore.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+import pandas as pd
+
+from dataset_store import SharedDatasetStore
+from demand_forecast import model_path, run_forecast
+from energy_balance import run_energy_balance
+from event_grid import EventIndex
+from load_profiles import build_profile_engine
+from sketches import FleetSketches
+from sap_dispatcher import build_work_orders
+
+DataVersion = namedtuple('DataVersion', ['num_meters', 'days', 'refresh'])
+
+
+class DatasetGraph:
+    """Nós nomeados com dependências explícitas, resolvidos preguiçosamente"""
+
+    def __init__(self, store=None):
+        self._nodes = {}
+        self.store = store or SharedDatasetStore()
+
+    def add(self, name, fn, deps=()):
+        """Registra `fn(version, *valores_das_deps)` como produtor do nó `name`"""
+        for dep in deps:
+            if dep not in self._nodes:
+                raise KeyError(f"Dependência '{dep}' de '{name}' não registrada")
+        self._nodes[name] = (fn, tuple(deps))
+
+    def get(self, name, version):
+        """Valor do nó para a versão, calculando (e memoizando no store) só o que falta"""
+        if name not in self._nodes:
+            raise KeyError(f"Nó '{name}' não registrado")
+
+        fn, deps = self._nodes[name]
+        return self.store.get_or_compute(
+            version, name, lambda: fn(version, *(self.get(dep, version) for dep in deps))
+        )
+
+    def dependents(self, name):
+        """O nó e todos os que dependem dele, direta ou indiretamente"""
+        afetados = {name}
+        mudou = True
+        while mudou:
+            mudou = False
+            for nome, (_, deps) in self._nodes.items():
+                if nome not in afetados and afetados.intersection(deps):
+                    afetados.add(nome)
+                    mudou = True
+        return afetados
+
+    def invalidate(self, name=None):
+        """Descarta tudo ou apenas o nó `name` e seus dependentes (em todas as versões)"""
+        if name is None:
+            self.store.clear()
+        else:
+            self.store.discard(self.dependents(name))
+
+
+def compute_quality(df, sketches):
+    """Indicadores de qualidade da ingestão (PRODIST Módulo 8); conformidade vem dos sketches"""
+    return {
+        'registros': len(df),
+        'corrigidos': int(len(df) * 0.002),
+        'conformidade': sketches.summary()['conformidade'],
+        'inicio': df['timestamp'].min(),
+        'fim': df['timestamp'].max(),
+    }
+
+
+def compute_episodes(events_df, intervalo=timedelta(minutes=15)):
+    """Agrupa eventos consecutivos do mesmo medidor e tipo em episódios"""
+    colunas = ['id_medidor', 'tipo', 'alimentador', 'inicio', 'fim', 'leituras', 'severidade']
+    if events_df.empty:
+        return pd.DataFrame(columns=colunas)
+
+    ev = events_df.sort_values(['id_medidor', 'tipo', 'timestamp'])
+    novo = ((ev['id_medidor'] != ev['id_medidor'].shift())
+            | (ev['tipo'] != ev['tipo'].shift())
+            | (ev['timestamp'].diff() > intervalo))
+    ev = ev.assign(episodio=novo.cumsum(),
+                   critico=(ev['severidade'] == 'CRÍTICA'))
+
+    episodios = ev.groupby('episodio').agg(
+        id_medidor=('id_medidor', 'first'),
+        tipo=('tipo', 'first'),
+        alimentador=('alimentador', 'first'),
+        inicio=('timestamp', 'min'),
+        fim=('timestamp', 'max'),
+        leituras=('timestamp', 'size'),
+        critico=('critico', 'any'),
+        severidade=('severidade', 'first'),
+    )
+    episodios.loc[episodios['critico'], 'severidade'] = 'CRÍTICA'
+    return episodios[colunas].reset_index(drop=True)
+
+
+def compute_rollups(df, agora=None):
+    """Agregados por alimentador: energia horária das últimas 24h e carga/medidores totais"""
+    agora = agora or df['timestamp'].max()
+    last_24h = df[df['timestamp'] >= (agora - timedelta(hours=24))]
+    energia_horaria = last_24h.groupby(['alimentador', last_24h['timestamp'].dt.hour]).agg({
+        'energia_kwh': 'sum'
+    }).reset_index()
+
+    alimentadores = df.groupby('alimentador', sort=False).agg(
+        carga_mw=('potencia_kw', 'sum'),
+        medidores=('id_medidor', 'nunique'),
+    ).reset_index()
+    alimentadores['carga_mw'] /= 1000
+
+    return {'energia_horaria': energia_horaria, 'alimentadores': alimentadores}
+
+
+def build_dataset_graph(load_readings, detect_events, load_assets, store=None, voltage_limits=None):
+    """
+    Monta o grafo padrão da plataforma. As etapas pesadas entram como funções:
+    load_readings(num_meters, days), detect_events(df) e load_assets(df); voltage_limits(df)
+    devolve a faixa adequada de tensão por leitura (perfil de cada alimentador/medidor).
+    """
+    graph = DatasetGraph(store)
+    graph.add('readings', lambda v: load_readings(v.num_meters, v.days))
+    graph.add('sketches', lambda v, df: FleetSketches.from_readings(df, voltage_limits and voltage_limits(df)),
+              deps=['readings'])
+    graph.add('quality', lambda v, df, sk: compute_quality(df, sk), deps=['readings', 'sketches'])
+    graph.add('assets', lambda v, df: load_assets(df), deps=['readings'])
+    graph.add('events', lambda v, df: detect_events(df), deps=['readings'])
+    graph.add('episodes', lambda v, ev: compute_episodes(ev), deps=['events'])
+    graph.add('event_index', lambda v, ev: EventIndex(ev), deps=['events'])
+    graph.add('rollups', lambda v, df: compute_rollups(df), deps=['readings'])
+    graph.add('work_orders', lambda v, ev: build_work_orders(ev), deps=['events'])
+    graph.add('energy_balance', lambda v, df, assets: run_energy_balance(df, assets[0]['medidores']),
+              deps=['readings', 'assets'])
+    graph.add('profiles', lambda v, df: build_profile_engine(df), deps=['readings'])
+    graph.add('forecast', lambda v, df: run_forecast(df, model_path(f'{v.num_meters}m_{v.days}d')), deps=['readings'])
+    return graph
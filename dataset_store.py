@@ -0,0 +1,123 @@
+"""
+CPFL LABS | TEMA 3
+Store de datasets compartilhado pelo processo
+Todas as sessões do Streamlit leem as mesmas instâncias (somente leitura) de cada versão;
+novas versões são publicadas com troca atômica e cada dataset é calculado uma única vez.
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def dataset_nbytes(value):
+    """Memória aproximada ocupada por um dataset (DataFrame, dict/tupla de DataFrames)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sum(dataset_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(dataset_nbytes(v) for v in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+
+class SharedDatasetStore:
+    """
+    Versões imutáveis de datasets, thread-safe.
+    - get_or_compute: single-flight por (versão, nome) - sessões concorrentes esperam o
+      mesmo cálculo em vez de repeti-lo
+    - bump_generation: "chegaram dados novos"; as próximas leituras usam a nova geração
+      e as versões antigas saem do store (max_versions)
+    - hits/misses/evictions e o tamanho de cada dataset (medido na publicação) alimentam as métricas
+    Os valores são devolvidos por referência: quem lê não deve alterá-los no lugar.
+    """
+
+    def __init__(self, max_versions=2):
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+        self._versions = OrderedDict()
+        self._sizes = {}
+        self._inflight = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return sum(len(datasets) for datasets in self._versions.values())
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+            return self._generation
+
+    def _lookup(self, version, name):
+        datasets = self._versions.get(version)
+        if datasets is not None and name in datasets:
+            self._versions.move_to_end(version)
+            return True, datasets[name]
+        return False, None
+
+    def get_or_compute(self, version, name, compute):
+        with self._lock:
+            encontrado, valor = self._lookup(version, name)
+            if encontrado:
+                self.hits += 1
+                return valor
+            chave_lock = self._inflight.setdefault((version, name), threading.Lock())
+
+        with chave_lock:
+            with self._lock:
+                encontrado, valor = self._lookup(version, name)
+                if encontrado:
+                    self.hits += 1
+                    return valor
+                self.misses += 1
+
+            try:
+                valor = compute()
+            except Exception:
+                with self._lock:
+                    self._inflight.pop((version, name), None)
+                raise
+            nbytes = dataset_nbytes(valor)
+
+            with self._lock:
+                datasets = self._versions.get(version)
+                if datasets is None:
+                    datasets = self._versions[version] = {}
+                    self._sizes[version] = {}
+                    while len(self._versions) > self.max_versions:
+                        antiga, removidos = self._versions.popitem(last=False)
+                        self._sizes.pop(antiga, None)
+                        self.evictions += len(removidos)
+                datasets[name] = valor
+                self._sizes[version][name] = nbytes
+                self._versions.move_to_end(version)
+                self._inflight.pop((version, name), None)
+            return valor
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._sizes.clear()
+
+    def discard(self, names):
+        """Remove os datasets `names` de todas as versões (serão recalculados na próxima leitura)"""
+        with self._lock:
+            for version, datasets in self._versions.items():
+                for name in names:
+                    datasets.pop(name, None)
+                    self._sizes[version].pop(name, None)
+
+    def stats(self):
+        """Tamanho em bytes de cada dataset publicado, por versão"""
+        with self._lock:
+            return {version: dict(sizes) for version, sizes in self._sizes.items()}
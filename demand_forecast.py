@@ -0,0 +1,319 @@
+"""
+CPFL LABS | TEMA 3
+Previsão de demanda por alimentador (próximas 24 h)
+Séries de carga e temperatura de todos os alimentadores em uma grade (alimentador x intervalo de
+15 min); features vetorizadas para todos de uma vez: hora do dia (one-hot), carga defasada de
+1 e 2 dias e temperatura do dia anterior (persistência, na falta de previsão meteorológica),
+também cruzada com o pico de AC (12-15h). Um Ridge do scikit-learn por alimentador, salvo em
+disco (joblib) junto do histórico; novos intervalos atualizam o histórico e só os alimentadores
+alterados são reajustados. A previsão de todos sai de uma única operação com os coeficientes
+empilhados.
+
+Uso (job agendado):
+    python demand_forecast.py --alimentadores 300 --medidores 10000 --dias 28
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import Ridge
+
+MODELOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'modelos')
+MODELOS_PATH = os.path.join(MODELOS_DIR, 'previsao_demanda.joblib')
+
+INTERVALO = pd.Timedelta(minutes=15)
+POR_DIA = 96
+LAGS = (POR_DIA, 2 * POR_DIA)
+HORAS_PICO = (12, 15)
+
+FEATURES = ([f'hora_{h:02d}' for h in range(24)] + [f'carga_lag_{lag}' for lag in LAGS]
+            + ['temperatura_lag_96', 'temperatura_lag_96_pico'])
+
+
+def _grid(readings, alimentadores, tempos):
+    """Carga total (kW) e temperatura média por (alimentador, intervalo); leituras fora da grade são ignoradas"""
+    linha = alimentadores.get_indexer(readings['alimentador'])
+    coluna = tempos.get_indexer(readings['timestamp'].dt.floor(INTERVALO))
+    # Leituras anteriores à janela de histórico (coluna -1) cairiam no intervalo de outro alimentador
+    validos = (linha >= 0) & (coluna >= 0)
+    plano = linha[validos] * len(tempos) + coluna[validos]
+    tamanho = len(alimentadores) * len(tempos)
+    forma = (len(alimentadores), len(tempos))
+
+    carga = np.bincount(plano, weights=readings['potencia_kw'].to_numpy(dtype=float)[validos], minlength=tamanho)
+    temperatura = np.bincount(plano, weights=readings['temperatura_estimada'].to_numpy(dtype=float)[validos],
+                              minlength=tamanho)
+    n = np.bincount(plano, minlength=tamanho)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temperatura = temperatura / n
+    return carga.reshape(forma), temperatura.reshape(forma), (n > 0).reshape(forma)
+
+
+def build_features(carga, temperatura, horas):
+    """
+    Tensor (alimentador x alvo x feature) para os alvos `t` com t-192 >= 0.
+    `carga`/`temperatura`: (n_alimentadores, n_t) alinhados com `horas` (hora de cada intervalo).
+    """
+    inicio = max(LAGS)
+    n_f = carga.shape[0]
+    alvo = slice(inicio, carga.shape[1])
+    hora_alvo = horas[alvo]
+    pico = ((hora_alvo >= HORAS_PICO[0]) & (hora_alvo <= HORAS_PICO[1])).astype(float)
+
+    uma_quente = np.broadcast_to(np.eye(24)[hora_alvo], (n_f, len(hora_alvo), 24))
+    lags = [carga[:, inicio - lag:carga.shape[1] - lag] for lag in LAGS]
+    temp = temperatura[:, inicio - POR_DIA:temperatura.shape[1] - POR_DIA]
+    return np.concatenate([uma_quente, np.stack(lags + [temp, temp * pico], axis=2)], axis=2)
+
+
+class DemandForecaster:
+    """
+    - update(readings): incorpora intervalos novos (ou corrigidos) ao histórico em grade
+    - fit(): reajusta os alimentadores alterados desde o último ajuste
+    - forecast(): próximas 24 h de todos os alimentadores
+    - save()/load(path): modelos + histórico em disco
+    """
+
+    def __init__(self, path=MODELOS_PATH, alpha=1.0, janela_dias=28):
+        self.path = path
+        self.alpha = alpha
+        self.janela_dias = janela_dias
+        self.alimentadores = pd.Index([], dtype=object)
+        self.tempos = pd.DatetimeIndex([])
+        self.carga = np.zeros((0, 0))
+        self.temperatura = np.zeros((0, 0))
+        self.modelos = {}
+        self._alterados = set()
+
+    @classmethod
+    def load(cls, path=MODELOS_PATH, **kwargs):
+        """Estado salvo em `path`, ou um previsor vazio se o arquivo não existir"""
+        if not os.path.exists(path):
+            return cls(path, **kwargs)
+        estado = joblib.load(path)
+        previsor = cls(path, **{k: estado[k] for k in ('alpha', 'janela_dias')})
+        for campo in ('alimentadores', 'tempos', 'carga', 'temperatura', 'modelos'):
+            setattr(previsor, campo, estado[campo])
+        return previsor
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporario = f"{self.path}.tmp"
+        joblib.dump({campo: getattr(self, campo) for campo in
+                     ('alpha', 'janela_dias', 'alimentadores', 'tempos', 'carga', 'temperatura', 'modelos')},
+                    temporario)
+        os.replace(temporario, self.path)
+
+    @property
+    def history_days(self):
+        return len(self.tempos) / POR_DIA
+
+    def matches(self, readings, tolerancia=0.01):
+        """
+        True se as leituras reproduzem a carga guardada nos intervalos em comum (mesma fonte de
+        dados); correções pontuais são toleradas até `tolerancia` das células em comum
+        """
+        if not len(self.tempos) or readings.empty:
+            return True
+        carga, _, presente = _grid(readings, self.alimentadores, self.tempos)
+        comum = presente & ~np.isnan(self.temperatura)
+        if not comum.any():
+            return True
+        diferentes = ~np.isclose(carga[comum], self.carga[comum], rtol=1e-6, atol=1e-6)
+        return diferentes.mean() <= tolerancia
+
+    def update(self, readings):
+        """Sobrescreve os intervalos presentes em `readings`; retorna quantos intervalos são novos"""
+        if readings.empty:
+            return 0
+        alimentadores = self.alimentadores.append(pd.Index(readings['alimentador'].unique())).unique().sort_values()
+        intervalos = readings['timestamp'].dt.floor(INTERVALO)
+        inicio = min(intervalos.min(), self.tempos[0]) if len(self.tempos) else intervalos.min()
+        fim = max(intervalos.max(), self.tempos[-1]) if len(self.tempos) else intervalos.max()
+        tempos = pd.date_range(inicio, fim, freq=INTERVALO)[-self.janela_dias * POR_DIA:]
+        novos = len(tempos.difference(self.tempos))
+
+        carga = np.zeros((len(alimentadores), len(tempos)))
+        temperatura = np.full((len(alimentadores), len(tempos)), np.nan)
+        if len(self.tempos):
+            linhas = alimentadores.get_indexer(self.alimentadores)
+            colunas = tempos.get_indexer(self.tempos)
+            manter = colunas >= 0
+            carga[np.ix_(linhas, colunas[manter])] = self.carga[:, manter]
+            temperatura[np.ix_(linhas, colunas[manter])] = self.temperatura[:, manter]
+
+        lote_carga, lote_temperatura, presente = _grid(readings, alimentadores, tempos)
+        carga[presente] = lote_carga[presente]
+        temperatura[presente] = lote_temperatura[presente]
+        self._alterados |= set(alimentadores[presente.any(axis=1)])
+
+        self.alimentadores, self.tempos, self.carga, self.temperatura = alimentadores, tempos, carga, temperatura
+        return novos
+
+    def _temperatura_preenchida(self):
+        """Lacunas de temperatura preenchidas com a média do alimentador na mesma hora"""
+        temperatura = self.temperatura.copy()
+        if np.isnan(temperatura).any():
+            horas = self.tempos.hour.to_numpy()
+            for h in np.unique(horas):
+                bloco = temperatura[:, horas == h]
+                contagem = (~np.isnan(bloco)).sum(axis=1, keepdims=True)
+                media = np.where(contagem > 0, np.nansum(bloco, axis=1, keepdims=True) / np.maximum(contagem, 1), 25.0)
+                temperatura[:, horas == h] = np.where(np.isnan(bloco), media, bloco)
+        return temperatura
+
+    def fit(self, todos=False):
+        """Ajusta os alimentadores alterados (ou todos); retorna quantos modelos foram ajustados"""
+        if len(self.tempos) <= max(LAGS) + POR_DIA:
+            return 0
+        X = build_features(self.carga, self._temperatura_preenchida(), self.tempos.hour.to_numpy())
+        y = self.carga[:, max(LAGS):]
+        ajustar = self.alimentadores if todos else [a for a in self.alimentadores
+                                                     if a in self._alterados or a not in self.modelos]
+        for alimentador in ajustar:
+            i = self.alimentadores.get_loc(alimentador)
+            self.modelos[alimentador] = Ridge(alpha=self.alpha).fit(X[i], y[i])
+        self._alterados.clear()
+        return len(ajustar)
+
+    def forecast(self):
+        """Próximas 24 h (96 intervalos) de todos os alimentadores com modelo, em formato longo"""
+        alimentadores = [a for a in self.alimentadores if a in self.modelos]
+        if not alimentadores or len(self.tempos) < max(LAGS):
+            return pd.DataFrame(columns=['alimentador', 'timestamp', 'previsao_kw'])
+
+        linhas = self.alimentadores.get_indexer(alimentadores)
+        futuro = pd.date_range(self.tempos[-1] + INTERVALO, periods=POR_DIA, freq=INTERVALO)
+        horas = np.concatenate([self.tempos.hour.to_numpy()[-max(LAGS):], futuro.hour.to_numpy()])
+        carga = np.concatenate([self.carga[linhas, -max(LAGS):], np.zeros((len(linhas), POR_DIA))], axis=1)
+        temperatura = self._temperatura_preenchida()[linhas, -max(LAGS):]
+        temperatura = np.concatenate([temperatura, np.zeros((len(linhas), POR_DIA))], axis=1)
+
+        X = build_features(carga, temperatura, horas)
+        coeficientes = np.stack([self.modelos[a].coef_ for a in alimentadores])
+        interceptos = np.array([self.modelos[a].intercept_ for a in alimentadores])
+        previsao = np.einsum('ftp,fp->ft', X, coeficientes) + interceptos[:, None]
+
+        return pd.DataFrame({
+            'alimentador': np.repeat(np.array(alimentadores, dtype=object), POR_DIA),
+            'timestamp': np.tile(futuro.values, len(alimentadores)),
+            'previsao_kw': np.maximum(previsao, 0).ravel(),
+        })
+
+    def history(self, dias=2):
+        """Carga observada dos últimos `dias` em formato longo (para gráficos)"""
+        n = min(len(self.tempos), dias * POR_DIA)
+        return pd.DataFrame({
+            'alimentador': np.repeat(np.asarray(self.alimentadores, dtype=object), n),
+            'timestamp': np.tile(self.tempos[-n:].values, len(self.alimentadores)),
+            'carga_kw': self.carga[:, -n:].ravel(),
+        })
+
+
+def peak_summary(previsao):
+    """Pico previsto por alimentador e a carga média na janela de AC (12-15h)"""
+    if previsao.empty:
+        return pd.DataFrame(columns=['alimentador', 'pico_kw', 'hora_pico', 'media_pico_ac_kw'])
+    hora = previsao['timestamp'].dt.hour
+    pico = previsao.loc[previsao.groupby('alimentador')['previsao_kw'].idxmax()]
+    janela_ac = previsao[(hora >= HORAS_PICO[0]) & (hora <= HORAS_PICO[1])].groupby('alimentador')['previsao_kw'].mean()
+    return pd.DataFrame({
+        'alimentador': pico['alimentador'].to_numpy(),
+        'pico_kw': pico['previsao_kw'].to_numpy(),
+        'hora_pico': pico['timestamp'].dt.strftime('%H:%M').to_numpy(),
+        'media_pico_ac_kw': janela_ac.reindex(pico['alimentador']).to_numpy(),
+    })
+
+
+def model_path(chave):
+    """Arquivo de modelos de uma configuração estável da base (ex.: frota e dias de histórico)"""
+    return os.path.join(MODELOS_DIR, f'previsao_demanda_{chave}.joblib')
+
+
+def remove_superseded(path):
+    """Apaga arquivos antigos da mesma configuração (um por geração, de versões anteriores do nó)"""
+    base, extensao = os.path.splitext(path)
+    for antigo in glob.glob(glob.escape(base) + '_r*' + extensao):
+        os.remove(antigo)
+
+
+def run_forecast(readings, path=MODELOS_PATH):
+    """
+    Nó 'forecast' do grafo: carrega do disco, incorpora as leituras, reajusta o que mudou e prevê.
+    Se as leituras não reproduzem o histórico salvo (base regenerada), recomeça do zero.
+    """
+    previsor = DemandForecaster.load(path)
+    if not previsor.matches(readings):
+        previsor = DemandForecaster(path)
+    previsor.update(readings)
+    if previsor.fit():
+        previsor.save()
+        remove_superseded(path)
+    previsao = previsor.forecast()
+    return {'previsao': previsao, 'historico': previsor.history(), 'picos': peak_summary(previsao)}
+
+
+if __name__ == '__main__':
+    from data_factory import build_timestamps, generate_shard, shard_ranges
+
+    parser = argparse.ArgumentParser(description='Job agendado de previsão de demanda (D+1) por alimentador')
+    parser.add_argument('--alimentadores', type=int, default=300)
+    parser.add_argument('--medidores', type=int, default=10_000)
+    parser.add_argument('--dias', type=int, default=28)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', default=os.path.join('data', 'previsao'))
+    args = parser.parse_args()
+
+    # Medidores redistribuídos em N alimentadores sintéticos; cada shard já sai agregado por
+    # (alimentador, intervalo) - o previsor aceita leituras ou cargas já agregadas
+    timestamps = build_timestamps(args.dias, pd.Timestamp.now().floor('15min'))
+    faixas = shard_ranges(args.medidores, 1000)
+    seeds = np.random.SeedSequence(args.seed).spawn(len(faixas))
+    codigos = np.random.default_rng(args.seed).integers(0, args.alimentadores, args.medidores + 1)
+    partes = []
+    for (a, b), s in zip(faixas, seeds):
+        shard = generate_shard(a, b, timestamps, s)
+        shard['alimentador'] = pd.Series(codigos[np.repeat(np.arange(a, b), len(timestamps))]).map('AL-SIM-{:03d}'.format).to_numpy()
+        partes.append(shard.groupby(['alimentador', 'timestamp']).agg(
+            potencia_kw=('potencia_kw', 'sum'), temperatura_soma=('temperatura_estimada', 'sum'),
+            leituras=('temperatura_estimada', 'size')))
+    leituras = pd.concat(partes).groupby(level=[0, 1]).sum().reset_index()
+    leituras['temperatura_estimada'] = leituras['temperatura_soma'] / leituras['leituras']
+
+    ultimo_dia = leituras['timestamp'] > leituras['timestamp'].max() - pd.Timedelta(days=1)
+    caminho = os.path.join(args.saida, 'previsao_demanda.joblib')
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+    # Carga inicial: tudo menos o último dia; previsão do último dia para medir o erro
+    inicio = time.perf_counter()
+    previsor = DemandForecaster(caminho)
+    previsor.update(leituras[~ultimo_dia])
+    ajustados = previsor.fit()
+    previsao = previsor.forecast()
+    previsor.save()
+    inicial = time.perf_counter() - inicio
+
+    real = leituras[ultimo_dia].groupby(['alimentador', 'timestamp'])['potencia_kw'].sum().rename('real_kw')
+    comparacao = previsao.join(real, on=['alimentador', 'timestamp']).dropna()
+    mape = (comparacao['previsao_kw'] - comparacao['real_kw']).abs().sum() / comparacao['real_kw'].sum() * 100
+
+    # Atualização incremental: chega o último dia, recarrega do disco, reajusta e prevê D+1
+    inicio = time.perf_counter()
+    previsor = DemandForecaster.load(caminho)
+    novos = previsor.update(leituras[ultimo_dia])
+    reajustados = previsor.fit()
+    previsao = previsor.forecast()
+    previsor.save()
+    incremental = time.perf_counter() - inicio
+
+    print(f"{leituras['leituras'].sum():,} leituras | {len(previsor.alimentadores)} alimentadores | {previsor.history_days:.0f} dias de histórico")
+    print(f"ajuste inicial de {ajustados} modelos + previsão: {inicial:.2f}s | erro (WAPE) no último dia: {mape:.1f}%")
+    print(f"incremental ({novos} intervalos novos): {reajustados} modelos reajustados + previsão em {incremental:.2f}s")
+    previsao.to_parquet(os.path.join(args.saida, 'previsao_24h.parquet'), index=False)
+    print(peak_summary(previsao).head(8).round(1).to_string(index=False))
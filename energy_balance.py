@@ -0,0 +1,320 @@
+"""
+CPFL LABS | TEMA 3
+Balanço energético e perdas não técnicas (PNT) por alimentador e transformador
+Medição de fronteira (cabeça do alimentador, medidor do transformador) x energia faturada
+dos clientes, por intervalo de 15 min. As somas agrupadas são feitas com bincount sobre
+códigos (transformador, intervalo) - um mês de todos os alimentadores em um único lote.
+
+Uso (job mensal):
+    python energy_balance.py --medidores 20000 --dias 30 --seed 42 --saida data/balanco
+    python energy_balance.py --entrada data/loadtest --saida data/balanco
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_factory import generate_readings
+from spatial_index import build_asset_registry
+
+# Pesos do score de PNT: queda de consumo, desvio em relação aos vizinhos, aumento da perda do transformador
+PESOS_PNT = {'queda': 0.45, 'desvio': 0.30, 'perda_trafo': 0.25}
+
+
+def _janelas(n_t):
+    """Máscaras por intervalo: terço inicial (referência) e terço final (recente)"""
+    posicao = np.arange(n_t)
+    return posicao < n_t // 3, posicao >= n_t - n_t // 3
+
+
+def _codes(valores, categorias):
+    """Posição de cada valor em `categorias` (-1 se ausente); fatoriza antes para buscar só os distintos"""
+    codigos, distintos = pd.factorize(valores)
+    return pd.Index(categorias).get_indexer(distintos).astype(np.int64)[codigos]
+
+
+def _timestamps(frame):
+    return np.sort(pd.unique(frame['timestamp'].to_numpy()))
+
+
+def _grid_sum(linha, coluna, pesos, n_linhas, n_colunas):
+    """Soma de `pesos` por (linha, coluna) em uma matriz densa; códigos -1 são ignorados"""
+    validos = (linha >= 0) & (coluna >= 0)
+    plano = linha[validos] * n_colunas + coluna[validos]
+    return np.bincount(plano, weights=pesos[validos], minlength=n_linhas * n_colunas).reshape(n_linhas, n_colunas)
+
+
+def _topology(medidores):
+    """Transformadores, alimentadores e o mapeamento transformador -> alimentador"""
+    trafos = medidores[['id_transformador', 'alimentador']].drop_duplicates('id_transformador').reset_index(drop=True)
+    alimentadores = pd.Index(sorted(trafos['alimentador'].unique()))
+    trafo_alim = _codes(trafos['alimentador'], alimentadores)
+    uma_quente = np.zeros((len(alimentadores), len(trafos)))
+    uma_quente[trafo_alim, np.arange(len(trafos))] = 1.0
+    return trafos, alimentadores, uma_quente
+
+
+def _long_frame(nomes, nome_coluna, tempos, colunas):
+    """Matrizes (ponto x intervalo) em formato longo, com ids categóricos"""
+    n, n_t = len(nomes), len(tempos)
+    dados = {
+        nome_coluna: pd.Categorical.from_codes(np.repeat(np.arange(n), n_t), categories=pd.Index(nomes)),
+        'timestamp': np.tile(np.asarray(tempos), n),
+    }
+    dados.update({nome: matriz.ravel() for nome, matriz in colunas.items()})
+    return pd.DataFrame(dados)
+
+
+def simulate_boundary_readings(readings, medidores, seed=0, taxa_fraude=0.03, perda_trafo=(0.02, 0.045),
+                               perda_mt=(0.025, 0.04), erro_medicao=0.005):
+    """
+    Cenário sintético de fronteira a partir das leituras dos clientes (tratadas como consumo real):
+    uma fração dos medidores passa a registrar só parte do consumo a partir de uma data no terço
+    central do período (fraude/desvio); transformadores e cabeças de alimentador medem o consumo
+    real acrescido das perdas técnicas. Retorna dict com 'clientes' (leituras registradas),
+    'transformadores', 'alimentadores' (energia medida por intervalo) e 'fraudes' (gabarito).
+    """
+    rng = np.random.default_rng(seed)
+    ids = medidores['id_medidor'].to_numpy()
+    tempos = _timestamps(readings)
+    n_t = len(tempos)
+
+    fraude = rng.random(len(ids)) < taxa_fraude
+    inicio = tempos[rng.integers(n_t // 3, max(2 * n_t // 3, n_t // 3 + 1), len(ids))]
+    fator = rng.uniform(0.3, 0.6, len(ids))
+
+    m = _codes(readings['id_medidor'], ids)
+    t = np.searchsorted(tempos, readings['timestamp'].to_numpy())
+    conhecido = m >= 0
+    adulterado = conhecido & fraude[np.where(conhecido, m, 0)] & (readings['timestamp'].to_numpy() >= inicio[m])
+    fator_linha = np.where(adulterado, fator[m], 1.0)
+
+    clientes = readings.assign(energia_kwh=readings['energia_kwh'] * fator_linha,
+                               potencia_kw=readings['potencia_kw'] * fator_linha)
+
+    trafos, alimentadores, uma_quente = _topology(medidores)
+    trafo_medidor = _codes(medidores['id_transformador'], trafos['id_transformador'])
+    linha_trafo = np.where(conhecido, trafo_medidor[np.where(conhecido, m, 0)], -1)
+    real = _grid_sum(linha_trafo, t, readings['energia_kwh'].to_numpy(), len(trafos), n_t)
+
+    saida_trafo = real * (1 + rng.uniform(*perda_trafo, len(trafos)))[:, None]
+    cabeca = (uma_quente @ saida_trafo) * (1 + rng.uniform(*perda_mt, len(alimentadores)))[:, None]
+    ruido = lambda forma: 1 + rng.normal(0, erro_medicao, forma)
+
+    return {
+        'clientes': clientes,
+        'transformadores': _long_frame(trafos['id_transformador'], 'id_transformador', tempos,
+                                       {'energia_kwh': saida_trafo * ruido(saida_trafo.shape)}),
+        'alimentadores': _long_frame(alimentadores, 'alimentador', tempos,
+                                     {'energia_kwh': cabeca * ruido(cabeca.shape)}),
+        'fraudes': pd.DataFrame({'id_medidor': ids[fraude], 'inicio': inicio[fraude],
+                                 'fator_registro': fator[fraude]}),
+    }
+
+
+def compute_energy_balance(clientes, medidores, transformadores, alimentadores):
+    """
+    Perdas por intervalo: transformador (medido - clientes) e alimentador (cabeça - transformadores
+    = MT, transformadores - clientes = BT). A perda do terço inicial é tomada como técnica; o
+    excedente é a perda não técnica estimada. Retorna dict com DataFrames por intervalo
+    ('transformadores', 'alimentadores') e resumos do período ('resumo_transformadores', 'resumo').
+    """
+    tempos = _timestamps(clientes)
+    n_t = len(tempos)
+    trafos, nomes_alim, uma_quente = _topology(medidores)
+    n_tr = len(trafos)
+
+    # Clientes -> transformador x intervalo (junção pelo código do medidor)
+    trafo_medidor = np.append(_codes(medidores['id_transformador'], trafos['id_transformador']), -1)
+    m = _codes(clientes['id_medidor'], medidores['id_medidor'])
+    t_cli = np.searchsorted(tempos, clientes['timestamp'].to_numpy())
+    faturado = _grid_sum(trafo_medidor[m], t_cli, clientes['energia_kwh'].to_numpy(), n_tr, n_t)
+
+    def medicao(frame, coluna, categorias):
+        linha = _codes(frame[coluna], categorias)
+        t = np.searchsorted(tempos, frame['timestamp'].to_numpy())
+        t = np.where((t < n_t) & (tempos[np.minimum(t, n_t - 1)] == frame['timestamp'].to_numpy()), t, -1)
+        return _grid_sum(linha, t, frame['energia_kwh'].to_numpy(), len(categorias), n_t)
+
+    medido_trafo = medicao(transformadores, 'id_transformador', trafos['id_transformador'])
+    injetado = medicao(alimentadores, 'alimentador', nomes_alim)
+
+    perda_trafo = medido_trafo - faturado
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perda_trafo_pct = np.where(medido_trafo > 0, perda_trafo / medido_trafo, np.nan)
+
+    trafos_alim = uma_quente @ medido_trafo
+    faturado_alim = uma_quente @ faturado
+    perda_total = injetado - faturado_alim
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perda_pct = np.where(injetado > 0, perda_total / injetado, np.nan)
+
+    base, recente = _janelas(n_t)
+
+    def razao(num, den, mascara):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return num[:, mascara].sum(axis=1) / den[:, mascara].sum(axis=1)
+
+    # Perda técnica: percentual do período de referência aplicado à energia de cada intervalo
+    tecnica_pct_alim = np.nan_to_num(razao(perda_total, injetado, base))
+    perda_nao_tecnica = np.clip(perda_total - tecnica_pct_alim[:, None] * injetado, 0, None)
+
+    resumo_transformadores = trafos.assign(
+        energia_medida_kwh=medido_trafo.sum(axis=1),
+        energia_faturada_kwh=faturado.sum(axis=1),
+        perda_kwh=perda_trafo.sum(axis=1),
+        perda_pct_base=razao(perda_trafo, medido_trafo, base),
+        perda_pct_recente=razao(perda_trafo, medido_trafo, recente),
+    )
+    resumo_transformadores['perda_pct'] = resumo_transformadores['perda_kwh'] / resumo_transformadores['energia_medida_kwh']
+
+    resumo = pd.DataFrame({
+        'alimentador': nomes_alim,
+        'energia_injetada_kwh': injetado.sum(axis=1),
+        'energia_faturada_kwh': faturado_alim.sum(axis=1),
+        'perda_mt_kwh': (injetado - trafos_alim).sum(axis=1),
+        'perda_bt_kwh': (trafos_alim - faturado_alim).sum(axis=1),
+        'perda_kwh': perda_total.sum(axis=1),
+        'perda_tecnica_pct': tecnica_pct_alim,
+        'perda_nao_tecnica_kwh': perda_nao_tecnica.sum(axis=1),
+    })
+    resumo['perda_pct'] = resumo['perda_kwh'] / resumo['energia_injetada_kwh']
+
+    return {
+        'transformadores': _long_frame(trafos['id_transformador'], 'id_transformador', tempos, {
+            'energia_medida_kwh': medido_trafo,
+            'energia_faturada_kwh': faturado,
+            'perda_kwh': perda_trafo,
+            'perda_pct': perda_trafo_pct,
+        }),
+        'alimentadores': _long_frame(nomes_alim, 'alimentador', tempos, {
+            'energia_injetada_kwh': injetado,
+            'energia_transformadores_kwh': trafos_alim,
+            'energia_faturada_kwh': faturado_alim,
+            'perda_mt_kwh': injetado - trafos_alim,
+            'perda_bt_kwh': trafos_alim - faturado_alim,
+            'perda_kwh': perda_total,
+            'perda_pct': perda_pct,
+            'perda_nao_tecnica_kwh': perda_nao_tecnica,
+        }),
+        'resumo_transformadores': resumo_transformadores,
+        'resumo': resumo,
+    }
+
+
+def rank_ntl_suspects(clientes, medidores, balanco, top=None):
+    """
+    Ranking de medidores suspeitos de PNT. Atributos por medidor:
+    - queda: 1 - consumo médio recente / consumo médio de referência
+    - desvio: z robusto (mediana/MAD) da razão recente/referência entre os vizinhos do transformador
+    - aumento_perda_trafo: variação do percentual de perda do transformador entre as janelas
+    """
+    ids = medidores['id_medidor'].to_numpy()
+    tempos = _timestamps(clientes)
+    base, recente = _janelas(len(tempos))
+
+    m = _codes(clientes['id_medidor'], ids)
+    t = np.searchsorted(tempos, clientes['timestamp'].to_numpy())
+    validos = m >= 0
+    m, t = m[validos], t[validos]
+    energia = clientes['energia_kwh'].to_numpy()[validos]
+
+    def media(mascara):
+        linhas = mascara[t]
+        soma = np.bincount(m[linhas], weights=energia[linhas], minlength=len(ids))
+        n = np.bincount(m[linhas], minlength=len(ids))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return soma / n, n
+
+    media_base, _ = media(base)
+    media_recente, n_recente = media(recente)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        razao = media_recente / media_base
+
+    atributos = medidores[['id_medidor', 'id_transformador', 'alimentador']].assign(
+        consumo_base_kwh=media_base,
+        consumo_recente_kwh=media_recente,
+        razao=razao,
+    )
+    por_trafo = atributos.groupby('id_transformador')['razao']
+    mediana = por_trafo.transform('median')
+    mad = (atributos['razao'] - mediana).abs().groupby(atributos['id_transformador']).transform('median')
+    atributos['queda'] = (1 - atributos['razao']).clip(0, 1)
+    atributos['desvio'] = (atributos['razao'] - mediana) / (1.4826 * mad + 0.01)
+
+    perda = balanco['resumo_transformadores'].set_index('id_transformador')
+    atributos['aumento_perda_trafo'] = (
+        atributos['id_transformador'].map(perda['perda_pct_recente'] - perda['perda_pct_base']).to_numpy()
+    )
+    atributos['energia_nao_registrada_kwh'] = ((media_base - media_recente).clip(0) * n_recente)
+
+    atributos['score'] = (
+        PESOS_PNT['queda'] * atributos['queda']
+        + PESOS_PNT['desvio'] * (-atributos['desvio'] / 4).clip(0, 1)
+        + PESOS_PNT['perda_trafo'] * (atributos['aumento_perda_trafo'] / 0.10).clip(0, 1)
+    ).fillna(0)
+
+    ranking = atributos.sort_values('score', ascending=False, kind='stable').reset_index(drop=True)
+    ranking.insert(0, 'posicao', np.arange(1, len(ranking) + 1))
+    return ranking if top is None else ranking.head(top)
+
+
+def run_energy_balance(readings, medidores, seed=0):
+    """Cenário de fronteira + balanço + ranking de PNT (nó 'energy_balance' do grafo)"""
+    fronteira = simulate_boundary_readings(readings, medidores, seed=seed)
+    balanco = compute_energy_balance(fronteira['clientes'], medidores,
+                                     fronteira['transformadores'], fronteira['alimentadores'])
+    balanco['suspeitos'] = rank_ntl_suspects(fronteira['clientes'], medidores, balanco)
+    balanco['fraudes'] = fronteira['fraudes']
+    return balanco
+
+
+def _read_dataset(pasta):
+    arquivos = sorted(glob.glob(os.path.join(pasta, 'shard=*', '*.parquet')))
+    if not arquivos:
+        raise FileNotFoundError(f"Nenhum shard Parquet em {pasta}")
+    colunas = ['id_medidor', 'timestamp', 'energia_kwh', 'potencia_kw', 'alimentador', 'regiao']
+    return pd.concat([pd.read_parquet(a, columns=colunas) for a in arquivos], ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Balanço energético e ranking de PNT (job mensal em lote)')
+    parser.add_argument('--entrada', help='Dataset Parquet particionado (data_factory.py); sem ele, gera em memória')
+    parser.add_argument('--medidores', type=int, default=20_000)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--top', type=int, default=100)
+    parser.add_argument('--saida', default='data/balanco')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    if args.entrada:
+        leituras = _read_dataset(args.entrada)
+    else:
+        leituras = generate_readings(args.medidores, args.dias, seed=args.seed, end_time=pd.Timestamp('2024-01-31'))
+    carga = time.perf_counter() - inicio
+
+    medidores = build_asset_registry(leituras[['id_medidor', 'alimentador', 'regiao']].drop_duplicates('id_medidor'))['medidores']
+    fronteira = simulate_boundary_readings(leituras, medidores, seed=args.seed)
+
+    inicio = time.perf_counter()
+    balanco = compute_energy_balance(fronteira['clientes'], medidores,
+                                     fronteira['transformadores'], fronteira['alimentadores'])
+    ranking = rank_ntl_suspects(fronteira['clientes'], medidores, balanco)
+    duracao = time.perf_counter() - inicio
+
+    os.makedirs(args.saida, exist_ok=True)
+    balanco['alimentadores'].to_parquet(os.path.join(args.saida, 'perdas_alimentadores.parquet'), index=False)
+    balanco['resumo_transformadores'].to_parquet(os.path.join(args.saida, 'perdas_transformadores.parquet'), index=False)
+    ranking.head(args.top).to_parquet(os.path.join(args.saida, 'suspeitos_pnt.parquet'), index=False)
+
+    acertos = ranking.head(args.top)['id_medidor'].isin(fronteira['fraudes']['id_medidor']).mean()
+    print(f"{len(leituras):,} leituras carregadas em {carga:.1f}s; balanço + ranking em {duracao:.1f}s "
+          f"({len(leituras) / duracao:,.0f} leituras/s)")
+    print(balanco['resumo'][['alimentador', 'energia_injetada_kwh', 'perda_pct', 'perda_nao_tecnica_kwh']]
+          .to_string(index=False))
+    print(f"Precisão no top {args.top}: {acertos:.0%} ({len(fronteira['fraudes'])} fraudes simuladas) -> {args.saida}")
@@ -0,0 +1,133 @@
+"""
+CPFL LABS | TEMA 3
+Grade de eventos paginada no servidor
+Índice montado uma vez por versão dos eventos: códigos categóricos das colunas de filtro,
+postos de ordenação por coluna e uma tabela Arrow. Cada rerun filtra por códigos (máscara
+guardada por combinação de filtros), percorre a ordem já calculada e envia ao navegador apenas
+a página visível (Arrow `take`), com os totais vindos do índice - o payload não cresce com o
+número de eventos filtrados.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+FILTER_COLUMNS = ['tipo', 'severidade', 'destino', 'alimentador']
+
+GRID_COLUMNS = ['id_evento', 'timestamp', 'id_medidor', 'alimentador', 'tipo', 'severidade',
+                'valor', 'acao_sugerida', 'destino', 'impacto']
+
+# Ordenação por gravidade/impacto (e não alfabética)
+ORDEM_SEVERIDADE = ['BAIXA', 'MÉDIA', 'ALTA', 'CRÍTICA']
+ORDEM_IMPACTO = ['BAIXO', 'MÉDIO', 'ALTO', 'CRÍTICO']
+
+SORT_COLUMNS = {
+    'id_evento': 'ID do Evento',
+    'timestamp': 'Data/Hora',
+    'severidade': 'Severidade',
+    'impacto': 'Impacto',
+    'tipo': 'Tipo',
+    'alimentador': 'Alimentador',
+    'id_medidor': 'Medidor',
+}
+
+
+def _rank(coluna, ordem=None):
+    """Posto inteiro de cada linha (empates com o mesmo posto); `ordem` fixa a sequência das categorias"""
+    if ordem is not None:
+        extras = sorted(set(coluna.dropna().unique()) - set(ordem))
+        return pd.Categorical(coluna, categories=list(ordem) + extras).codes.astype(np.int64)
+    return pd.factorize(coluna, sort=True)[0].astype(np.int64)
+
+
+class EventIndex:
+    """
+    - rows(filtros): posições (na ordem original) dos eventos que passam nos filtros
+    - page(filtros, ordenar_por, decrescente, pagina, por_pagina): fatia Arrow da página
+    - counts(linhas, coluna): totais por categoria via bincount dos códigos
+    Máscaras e posições ficam em um LRU por combinação de filtros (compartilhado pelas sessões).
+    """
+
+    def __init__(self, events, max_filtros=64):
+        self.events = events.reset_index(drop=True)
+        self._codes = {}
+        self.options = {}
+        for coluna in FILTER_COLUMNS:
+            codigos, categorias = pd.factorize(self.events[coluna], sort=True)
+            self._codes[coluna] = codigos
+            self.options[coluna] = list(categorias)
+
+        self._ranks = {
+            coluna: _rank(self.events[coluna], {'severidade': ORDEM_SEVERIDADE, 'impacto': ORDEM_IMPACTO}.get(coluna))
+            for coluna in SORT_COLUMNS
+        }
+        self._orders = {}
+        self.max_filtros = max_filtros
+        self._filtrados = OrderedDict()
+        self._lock = threading.Lock()
+        self.table = pa.Table.from_pandas(self.events[GRID_COLUMNS], preserve_index=False)
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            filtrados = sum(m.nbytes + l.nbytes for m, l in self._filtrados.values())
+        return (self.table.nbytes + sum(c.nbytes for c in self._codes.values())
+                + sum(r.nbytes for r in self._ranks.values()) + sum(o.nbytes for o in self._orders.values())
+                + filtrados)
+
+    def _mask(self, filtros):
+        mascara = np.ones(len(self.events), dtype=bool)
+        for coluna, valores in (filtros or {}).items():
+            if valores:
+                posicoes = [self.options[coluna].index(v) for v in valores if v in self.options[coluna]]
+                mascara &= np.isin(self._codes[coluna], posicoes)
+        return mascara
+
+    def _filtered(self, filtros):
+        """(máscara, posições) dos filtros - calculadas na primeira vez e guardadas no LRU"""
+        chave = tuple((coluna, tuple(sorted(valores))) for coluna, valores in sorted((filtros or {}).items()) if valores)
+        with self._lock:
+            if chave in self._filtrados:
+                self._filtrados.move_to_end(chave)
+                return self._filtrados[chave]
+
+        mascara = self._mask(filtros)
+        resultado = (mascara, np.flatnonzero(mascara))
+        for array in resultado:
+            array.flags.writeable = False  # compartilhados entre sessões
+
+        with self._lock:
+            self._filtrados[chave] = resultado
+            while len(self._filtrados) > self.max_filtros:
+                self._filtrados.popitem(last=False)
+        return resultado
+
+    def order(self, coluna, decrescente=False):
+        """Permutação estável por `coluna` (calculada na primeira vez e guardada)"""
+        chave = (coluna, decrescente)
+        if chave not in self._orders:
+            posto = self._ranks[coluna]
+            self._orders[chave] = np.argsort(-posto if decrescente else posto, kind='stable')
+        return self._orders[chave]
+
+    def rows(self, filtros=None):
+        return self._filtered(filtros)[1]
+
+    def counts(self, linhas, coluna):
+        """{categoria: eventos} entre as `linhas`"""
+        contagem = np.bincount(self._codes[coluna][linhas], minlength=len(self.options[coluna]))
+        return dict(zip(self.options[coluna], contagem.tolist()))
+
+    def page(self, filtros=None, ordenar_por='id_evento', decrescente=False, pagina=1, por_pagina=15):
+        """Tabela Arrow só com a página pedida dos eventos filtrados, na ordem escolhida"""
+        mascara = self._filtered(filtros)[0]
+        ordem = self.order(ordenar_por, decrescente)
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        visiveis = ordem[mascara[ordem]][inicio:inicio + por_pagina]
+        return self.table.take(pa.array(visiveis, type=pa.int64()))
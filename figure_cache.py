@@ -0,0 +1,48 @@
+"""
+CPFL LABS | TEMA 3
+Cache LRU de figuras Plotly compartilhado pelo processo
+Chave: (versão dos dados, tipo de gráfico, parâmetros da visão - medidor, período...).
+Um acerto devolve a figura já construída e validada, sem refazer agregações nem traços.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class FigureCache:
+    """LRU limitado por número de entradas, thread-safe, com contadores de acerto/falta/despejo"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._figs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._figs)
+
+    def get_or_build(self, key, build):
+        """Figura para `key`; em caso de falta chama `build()` e guarda o resultado"""
+        with self._lock:
+            fig = self._figs.get(key)
+            if fig is not None:
+                self._figs.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+
+        fig = build()
+
+        with self._lock:
+            self._figs[key] = fig
+            self._figs.move_to_end(key)
+            while len(self._figs) > self.max_entries:
+                self._figs.popitem(last=False)
+                self.evictions += 1
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._figs.clear()
@@ -0,0 +1,69 @@
+"""
+CPFL LABS | TEMA 3
+Renderização em lote de listas de cards HTML (eventos, alimentadores, OS)
+O template é compilado uma vez; a lista inteira é montada com operações de string
+sobre as colunas do DataFrame e enviada ao navegador em um único st.markdown.
+"""
+
+import math
+from string import Formatter
+
+import pandas as pd
+import streamlit as st
+
+_ESCAPES = [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;')]
+
+
+def _escape(series):
+    texto = series.astype(str)
+    for original, escape in _ESCAPES:
+        texto = texto.str.replace(original, escape, regex=False)
+    return texto
+
+
+class CardTemplate:
+    """
+    Template de card com campos `{coluna}` ou `{coluna:formato}`.
+    As linhas são compactadas (sem indentação nem linhas em branco) para que o
+    Markdown do Streamlit trate o bloco todo como HTML.
+    """
+
+    def __init__(self, template):
+        compacto = ' '.join(linha.strip() for linha in template.strip().splitlines() if linha.strip())
+        self._parts = [(literal, campo, formato)
+                       for literal, campo, formato, _ in Formatter().parse(compacto)]
+        self.fields = [campo for _, campo, _ in self._parts if campo]
+
+    def render(self, frame):
+        """HTML de todos os cards do frame, concatenados"""
+        if frame.empty:
+            return ''
+
+        html = pd.Series('', index=frame.index, dtype=object)
+        for literal, campo, formato in self._parts:
+            if literal:
+                html = html + literal
+            if campo:
+                valores = frame[campo]
+                if formato:
+                    valores = valores.map(('{:' + formato + '}').format)
+                html = html + _escape(valores)
+        return ''.join(html.tolist())
+
+
+def render_card_list(template, frame, key, page_size=5):
+    """Renderiza `frame` paginado em um único bloco HTML; retorna o trecho exibido"""
+    total = len(frame)
+    paginas = max(1, math.ceil(total / page_size))
+
+    pagina = 1
+    if paginas > 1:
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1, key=key)
+
+    inicio = (pagina - 1) * page_size
+    trecho = frame.iloc[inicio:inicio + page_size]
+
+    st.markdown(template.render(trecho), unsafe_allow_html=True)
+    if paginas > 1:
+        st.caption(f"Exibindo {inicio + 1}-{inicio + len(trecho)} de {total:,} | Página {pagina} de {paginas}")
+    return trecho
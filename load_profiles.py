@@ -0,0 +1,178 @@
+"""
+CPFL LABS | TEMA 3
+Segmentação de perfis de carga e busca de medidores semelhantes
+Matriz de perfil diário (24 ou 96 pontos) de todos os medidores em uma única passada
+(bincount por medidor x faixa do dia), normalizada pela média de cada medidor (forma da curva)
+e acrescida do nível de consumo. Segmentação com MiniBatchKMeans; "medidores semelhantes"
+com índice k-NN (NearestNeighbors) sobre a mesma matriz.
+
+Uso (lote de segmentação):
+    python load_profiles.py --medidores 100000 --dias 7 --saida data/perfis
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+# Peso do nível de consumo (log da média padronizado) em relação aos pontos da forma
+PESO_NIVEL = 1.0
+
+
+def profile_sums(readings, pontos=24):
+    """Somas e contagens de potência por (medidor, faixa do dia) - mescláveis entre lotes"""
+    medidor, ids = pd.factorize(readings['id_medidor'])
+    ts = readings['timestamp']
+    por_hora = pontos // 24
+    faixa = ts.dt.hour.to_numpy() * por_hora + ts.dt.minute.to_numpy() // (60 // por_hora)
+    plano = medidor * pontos + faixa
+    tamanho = len(ids) * pontos
+    soma = np.bincount(plano, weights=readings['potencia_kw'].to_numpy(dtype=float), minlength=tamanho)
+    n = np.bincount(plano, minlength=tamanho)
+    return pd.Index(ids), soma.reshape(-1, pontos), n.reshape(-1, pontos)
+
+
+def build_profile_matrix(ids, soma, n):
+    """Perfis médios (kW), forma normalizada pela média do medidor e nível de consumo"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        perfil = soma / n
+    perfil = np.where(np.isfinite(perfil), perfil, np.nanmean(np.where(n > 0, perfil, np.nan), axis=1, keepdims=True))
+    media = perfil.mean(axis=1)
+    forma = (perfil / np.where(media > 0, media, 1)[:, None]).astype(np.float32)
+    return pd.DataFrame({'id_medidor': ids, 'media_kw': media,
+                         'variacao': forma.std(axis=1), 'hora_pico': forma.argmax(axis=1) * 24 // forma.shape[1]}), forma, perfil
+
+
+def describe_cluster(centro_forma, media_kw, media_geral_kw):
+    """Rótulo legível de um segmento a partir do centro (forma) e do nível médio"""
+    pontos = len(centro_forma)
+    hora_pico = int(centro_forma.argmax()) * 24 // pontos
+    variacao = float(centro_forma.std())
+    if variacao < 0.15:
+        forma = "Perfil plano"
+    elif 11 <= hora_pico <= 16:
+        forma = "Pico diurno (AC)"
+    elif 17 <= hora_pico <= 23:
+        forma = "Pico noturno"
+    else:
+        forma = "Pico matutino"
+    nivel = "alto consumo" if media_kw > 1.15 * media_geral_kw else "baixo consumo" if media_kw < 0.85 * media_geral_kw else "consumo médio"
+    return f"{forma} - {nivel}"
+
+
+class ProfileEngine:
+    """Segmentos (MiniBatchKMeans) + índice k-NN sobre as features de perfil de todos os medidores"""
+
+    def __init__(self, n_clusters=6, batch_size=4096, seed=0):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.seed = seed
+
+    def _features(self, forma, media_kw):
+        nivel = np.log(np.maximum(media_kw, 1e-3))
+        nivel = (nivel - self._nivel_media) / (self._nivel_desvio or 1.0)
+        return np.hstack([forma, PESO_NIVEL * nivel[:, None].astype(np.float32)])
+
+    def fit(self, ids, soma, n):
+        self.meters, self.forma, self.perfil_kw = build_profile_matrix(ids, soma, n)
+        nivel = np.log(np.maximum(self.meters['media_kw'].to_numpy(), 1e-3))
+        self._nivel_media, self._nivel_desvio = float(nivel.mean()), float(nivel.std())
+        self.features = self._features(self.forma, self.meters['media_kw'].to_numpy())
+
+        k = max(1, min(self.n_clusters, len(self.meters)))
+        self.kmeans = MiniBatchKMeans(n_clusters=k, batch_size=self.batch_size, n_init=3, random_state=self.seed)
+        self.meters['segmento'] = self.kmeans.fit_predict(self.features)
+
+        media_geral = self.meters['media_kw'].mean()
+        por_segmento = self.meters.groupby('segmento').agg(medidores=('id_medidor', 'size'), media_kw=('media_kw', 'mean'))
+        centros = self.kmeans.cluster_centers_[:, :self.forma.shape[1]]
+        por_segmento['descricao'] = [describe_cluster(centros[s], por_segmento.loc[s, 'media_kw'], media_geral)
+                                     for s in por_segmento.index]
+        self.segments = por_segmento.reset_index()
+        self.meters['descricao'] = self.meters['segmento'].map(self.segments.set_index('segmento')['descricao'])
+
+        self.knn = NearestNeighbors(algorithm='kd_tree').fit(self.features)
+        self._posicao = pd.Index(self.meters['id_medidor'])
+        return self
+
+    @property
+    def nbytes(self):
+        return (self.features.nbytes + self.forma.nbytes + self.perfil_kw.nbytes
+                + int(self.meters.memory_usage(index=True, deep=True).sum()))
+
+    @property
+    def centers(self):
+        """Forma média de cada segmento (linhas) - para gráficos"""
+        return self.kmeans.cluster_centers_[:, :self.forma.shape[1]]
+
+    def index_of(self, id_medidor):
+        """Posição do medidor nas matrizes do motor (KeyError se não foi segmentado)"""
+        return self._posicao.get_loc(id_medidor)
+
+    def profile(self, id_medidor):
+        """Linha do medidor: média, variação, hora de pico, segmento e descrição"""
+        return self.meters.iloc[self.index_of(id_medidor)]
+
+    def shape(self, id_medidor):
+        """Forma normalizada do perfil diário do medidor"""
+        return self.forma[self.index_of(id_medidor)]
+
+    def similar(self, id_medidor, k=5):
+        """Os k medidores mais parecidos (forma + nível), excluindo o próprio"""
+        posicao = self.index_of(id_medidor)
+        k = min(k, len(self.meters) - 1)
+        if k <= 0:
+            return self.meters.iloc[:0].assign(distancia=[])
+        distancias, vizinhos = self.knn.kneighbors(self.features[posicao:posicao + 1], n_neighbors=k + 1)
+        manter = vizinhos[0] != posicao
+        return self.meters.iloc[vizinhos[0][manter][:k]].assign(distancia=distancias[0][manter][:k])
+
+
+def build_profile_engine(readings, pontos=24, n_clusters=6):
+    """Motor ajustado às leituras (nó 'profiles' do grafo)"""
+    ids, soma, n = profile_sums(readings, pontos)
+    return ProfileEngine(n_clusters=min(n_clusters, max(1, len(ids) // 5))).fit(ids, soma, n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Segmentação em lote dos perfis de carga de toda a base')
+    parser.add_argument('--medidores', type=int, default=100_000)
+    parser.add_argument('--dias', type=int, default=7)
+    parser.add_argument('--pontos', type=int, choices=[24, 96], default=24)
+    parser.add_argument('--segmentos', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', default='data/perfis')
+    args = parser.parse_args()
+
+    from data_factory import build_timestamps, generate_shard, shard_ranges
+
+    # Somas por shard: os medidores não se repetem entre shards, então basta concatenar
+    inicio = time.perf_counter()
+    timestamps = build_timestamps(args.dias, pd.Timestamp('2024-01-31'))
+    faixas = shard_ranges(args.medidores, 250)
+    seeds = np.random.SeedSequence(args.seed).spawn(len(faixas))
+    partes = [profile_sums(generate_shard(a, b, timestamps, s), args.pontos) for (a, b), s in zip(faixas, seeds)]
+    ids = pd.Index(np.concatenate([p[0] for p in partes]))
+    soma = np.vstack([p[1] for p in partes])
+    n = np.vstack([p[2] for p in partes])
+    leitura = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    motor = ProfileEngine(n_clusters=args.segmentos, seed=args.seed).fit(ids, soma, n)
+    ajuste = time.perf_counter() - inicio
+
+    amostra = motor.meters['id_medidor'].sample(200, replace=True, random_state=0)
+    inicio = time.perf_counter()
+    for id_medidor in amostra:
+        motor.similar(id_medidor, k=10)
+    consulta = (time.perf_counter() - inicio) / len(amostra) * 1000
+
+    os.makedirs(args.saida, exist_ok=True)
+    motor.meters.to_parquet(os.path.join(args.saida, 'segmentos_medidores.parquet'), index=False)
+    print(f"{len(ids):,} medidores x {args.pontos} pontos: matriz em {leitura:.1f}s (inclui geração), "
+          f"segmentação + índice k-NN em {ajuste:.1f}s | consulta de semelhantes: {consulta:.2f} ms")
+    print(motor.segments.to_string(index=False))
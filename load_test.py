@@ -0,0 +1,273 @@
+"""
+CPFL LABS | TEMA 3
+Teste de carga do app com sessões concorrentes (Streamlit AppTest)
+Cada usuário simulado é uma sessão AppTest própria, em sua thread, no mesmo processo - como no
+servidor do Streamlit, as sessões compartilham os recursos de st.cache_resource (grafo de
+datasets, cache de figuras, pré-cálculo). Cada cenário roda em um processo novo: começa com os
+caches frios e a memória medida é só a dele, independente da ordem dos cenários. Os usuários navegam pelas cinco páginas, aplicam
+filtros no Motor de Eventos, trocam de medidor na Análise Avançada e clicam em ATUALIZAR DADOS.
+Relatório: latência de rerun por página (p50/p95/p99), vazão e memória do processo em função
+do número de usuários, do tamanho da frota e do histórico (dias).
+
+Uso:
+    python load_test.py --usuarios 1,5,10,20 --medidores 50,100 --dias 7,30 --acoes 20
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import threading
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit
+from streamlit import config
+from streamlit.logger import set_log_level
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, local_script_runner
+
+from metrics import process_resident_memory_bytes
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Hackathon_Radix_Maravalley_app.py')
+
+# _enable_concurrent_sessions substitui internos privados do Streamlit, validados nesta versão
+STREAMLIT_TESTADO = '1.66.0'
+
+PAGINAS = [
+    "📊 Ingestão & Qualidade",
+    "📈 Visão Operacional",
+    "🔍 Análise Avançada",
+    "⚡ Motor de Eventos",
+    "🔧 Integrações Corporativas",
+]
+
+
+def _enable_concurrent_sessions():
+    """
+    O AppTest roda uma sessão por vez; para várias sessões em threads, como no servidor:
+    - um único ScriptCache (o script é compilado uma vez; o AppTest cria um por rerun e
+      compilações concorrentes quebram no CPython 3.11)
+    - cada rerun instala um Runtime simulado global e o remove ao final: as sessões ainda em
+      execução seguem usando o último instalado (gerenciadores equivalentes)
+    Depende de internos privados (local_script_runner.ScriptCache, Runtime._instance) do
+    Streamlit STREAMLIT_TESTADO; outra versão pode exigir revisar estes ajustes.
+    """
+    if streamlit.__version__ != STREAMLIT_TESTADO:
+        warnings.warn(f"Teste de carga validado com Streamlit {STREAMLIT_TESTADO}; instalado {streamlit.__version__} - "
+                      "os ajustes de sessões concorrentes podem não se aplicar", RuntimeWarning, stacklevel=2)
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+    ultimo = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            ultimo[:] = [cls._instance]
+        if not ultimo:
+            raise RuntimeError("Runtime hasn't been created!")
+        return ultimo[0]
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(ultimo))
+    config.set_option('global.appTest', True)
+
+
+# Peso de cada ação no roteiro aleatório de um operador
+ACOES = {'pagina': 0.5, 'filtro': 0.2, 'medidor': 0.2, 'atualizar': 0.1}
+
+
+def _widget(elementos, rotulo):
+    return next((w for w in elementos if w.label == rotulo), None)
+
+
+class SimulatedSession:
+    """Um operador: sessão AppTest + roteiro aleatório reprodutível (seed)"""
+
+    def __init__(self, sessao, num_meters, num_days, seed, timeout=300):
+        self.sessao = sessao
+        self.num_meters = num_meters
+        self.num_days = num_days
+        self.rng = random.Random(seed)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.pagina = PAGINAS[0]
+        self.amostras = []
+        self.falha = None
+
+    def _run(self, acao):
+        inicio = time.perf_counter()
+        self.at.run()
+        self.amostras.append({
+            'sessao': self.sessao,
+            'pagina': self.pagina,
+            'acao': acao,
+            'segundos': time.perf_counter() - inicio,
+            'erro': bool(self.at.exception),
+            'fim': time.time(),
+        })
+
+    def interrupt(self, exc):
+        """Exceção no roteiro (ex.: widget ausente após erro na página): vira uma amostra com erro"""
+        self.falha = ''.join(traceback.format_exception_only(type(exc), exc)).strip()
+        self.amostras.append({
+            'sessao': self.sessao,
+            'pagina': self.pagina,
+            'acao': 'interrompida',
+            'segundos': np.nan,
+            'erro': True,
+            'fim': time.time(),
+        })
+
+    def open(self):
+        self._run('abrir')
+        self.at.sidebar.slider[0].set_value(self.num_meters)
+        self.at.sidebar.slider[1].set_value(self.num_days)
+        self._run('frota')
+        # Uma volta por todas as páginas: toda configuração (frota x histórico) passa por cada uma
+        for pagina in PAGINAS[1:]:
+            self.pagina = pagina
+            self.at.sidebar.radio[0].set_value(pagina)
+            self._run('pagina')
+
+    def step(self):
+        acao = self.rng.choices(list(ACOES), weights=list(ACOES.values()))[0]
+
+        if acao == 'filtro' and self.pagina == "⚡ Motor de Eventos" and self.at.multiselect:
+            filtro = self.rng.choice(list(self.at.multiselect))
+            filtro.set_value(self.rng.sample(filtro.options, k=self.rng.randint(0, min(2, len(filtro.options)))))
+        elif acao == 'medidor' and self.pagina == "🔍 Análise Avançada" and _widget(self.at.selectbox, "Medidor"):
+            medidor = _widget(self.at.selectbox, "Medidor")
+            medidor.set_value(self.rng.choice(medidor.options))
+        elif acao == 'atualizar' and _widget(self.at.sidebar.button, "🔄 ATUALIZAR DADOS"):
+            _widget(self.at.sidebar.button, "🔄 ATUALIZAR DADOS").click()
+        else:
+            # Filtro/medidor fora da página certa: o operador navega até ela
+            destino = {'filtro': "⚡ Motor de Eventos", 'medidor': "🔍 Análise Avançada"}.get(acao)
+            acao = 'pagina'
+            self.pagina = destino or self.rng.choice(PAGINAS)
+            self.at.sidebar.radio[0].set_value(self.pagina)
+        self._run(acao)
+
+
+def run_scenario(usuarios, num_meters, num_days, acoes, seed=0, pausa_s=0.0):
+    """N sessões concorrentes, cada uma com `acoes` passos; devolve (amostras, resumo do cenário)"""
+    sessoes = [SimulatedSession(i, num_meters, num_days, seed * 1000 + i) for i in range(usuarios)]
+    largada = threading.Barrier(usuarios)
+    memoria = [process_resident_memory_bytes()]
+    ativo = threading.Event()
+    ativo.set()
+
+    def amostrar_memoria():
+        while ativo.is_set():
+            memoria.append(process_resident_memory_bytes())
+            time.sleep(0.2)
+
+    def usuario(sessao):
+        largada.wait()
+        try:
+            sessao.open()
+            for _ in range(acoes):
+                if pausa_s:
+                    time.sleep(sessao.rng.uniform(0, 2 * pausa_s))
+                sessao.step()
+        except Exception as exc:
+            sessao.interrupt(exc)
+
+    monitor = threading.Thread(target=amostrar_memoria, daemon=True)
+    monitor.start()
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=usuario, args=(s,), name=f'usuario-{s.sessao}') for s in sessoes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+    ativo.clear()
+    monitor.join()
+
+    amostras = pd.DataFrame([a for s in sessoes for a in s.amostras]).assign(
+        usuarios=usuarios, medidores=num_meters, dias=num_days)
+    return amostras, {
+        'usuarios': usuarios,
+        'medidores': num_meters,
+        'dias': num_days,
+        'reruns': len(amostras),
+        'duracao_s': duracao,
+        'reruns_por_s': len(amostras) / duracao,
+        'p95_s': amostras['segundos'].quantile(0.95),
+        'erros': int(amostras['erro'].sum()),
+        'sessoes_interrompidas': sum(s.falha is not None for s in sessoes),
+        'falhas': ' | '.join(f"sessão {s.sessao}: {s.falha}" for s in sessoes if s.falha),
+        'memoria_pico_mb': max(memoria) / 1e6,
+    }
+
+
+def _scenario_process(usuarios, num_meters, num_days, acoes, seed, pausa_s):
+    """Corpo do processo de um cenário: ajustes de sessões concorrentes + run_scenario"""
+    _enable_concurrent_sessions()
+    set_log_level('error')
+    return run_scenario(usuarios, num_meters, num_days, acoes, seed, pausa_s)
+
+
+def run_isolated_scenario(usuarios, num_meters, num_days, acoes, seed=0, pausa_s=0.0):
+    """run_scenario em um processo novo (spawn): caches de st.cache_resource e memória zerados"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_scenario_process, usuarios, num_meters, num_days, acoes, seed, pausa_s).result()
+
+
+def latency_table(amostras):
+    """Percentis de latência por cenário e página"""
+    return amostras.groupby(['usuarios', 'medidores', 'dias', 'pagina'], sort=False)['segundos'].agg(
+        reruns='size',
+        p50=lambda s: s.quantile(0.50),
+        p95=lambda s: s.quantile(0.95),
+        p99=lambda s: s.quantile(0.99),
+        maximo='max',
+    ).reset_index()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Teste de carga do app com sessões concorrentes (AppTest)')
+    parser.add_argument('--usuarios', default='1,5,10', help='lista de níveis de concorrência')
+    parser.add_argument('--medidores', default='50,100', help='lista de tamanhos de frota (slider: 10-100)')
+    parser.add_argument('--dias', default='7,30', help='lista de históricos em dias (slider: 1-30); >28 passa da '
+                                                     'janela do previsor de demanda')
+    parser.add_argument('--acoes', type=int, default=15, help='ações por usuário')
+    parser.add_argument('--pausa', type=float, default=0.0, help='tempo médio de reflexão entre ações (s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', default=os.path.join('data', 'loadtest_app'))
+    args = parser.parse_args()
+
+    # Porta própria: não disputar o endpoint de métricas com um app em execução (herdada pelos processos)
+    os.environ.setdefault('METRICS_PORT', '0')
+
+    todas, cenarios = [], []
+    for num_meters in [int(m) for m in args.medidores.split(',')]:
+        for num_days in [int(d) for d in args.dias.split(',')]:
+            for usuarios in [int(u) for u in args.usuarios.split(',')]:
+                amostras, resumo = run_isolated_scenario(usuarios, num_meters, num_days, args.acoes, args.seed, args.pausa)
+                todas.append(amostras)
+                cenarios.append(resumo)
+                print(f"{usuarios:>3} usuários x {num_meters:>3} medidores x {num_days:>2} dias: {resumo['reruns']:>4} reruns em "
+                      f"{resumo['duracao_s']:.1f}s ({resumo['reruns_por_s']:.1f}/s) | p95 {resumo['p95_s'] * 1000:,.0f} ms | "
+                      f"memória {resumo['memoria_pico_mb']:,.0f} MB | erros {resumo['erros']}")
+                if resumo['sessoes_interrompidas']:
+                    print(f"    {resumo['sessoes_interrompidas']} sessão(ões) interrompida(s): {resumo['falhas']}")
+
+    amostras = pd.concat(todas, ignore_index=True)
+    por_pagina = latency_table(amostras)
+    os.makedirs(args.saida, exist_ok=True)
+    amostras.to_csv(os.path.join(args.saida, 'amostras.csv'), index=False)
+    por_pagina.to_csv(os.path.join(args.saida, 'latencia_por_pagina.csv'), index=False)
+    pd.DataFrame(cenarios).to_csv(os.path.join(args.saida, 'cenarios.csv'), index=False)
+
+    with pd.option_context('display.width', 160):
+        print()
+        print(por_pagina.assign(**{c: por_pagina[c] * 1000 for c in ['p50', 'p95', 'p99', 'maximo']})
+              .round(0).to_string(index=False))
+    print(f"\nResultados em {args.saida}/ (latências em ms)")
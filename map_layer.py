@@ -0,0 +1,112 @@
+"""
+CPFL LABS | TEMA 3
+Camada de mapa agregada no servidor para frotas grandes de medidores
+Agrupa o status dos medidores (normal/alerta/crítico) em células de grade conforme o zoom
+e envia ao navegador apenas os agregados, renderizados com traços WebGL do Plotly.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+STATUS_CORES = {'normal': '#2E7D32', 'alerta': '#F57C00', 'crítico': '#C62828'}
+STATUS_ORDEM = ['normal', 'alerta', 'crítico']
+
+# Plotly >= 5.24 traz os traços MapLibre (sem token); versões anteriores usam mapbox
+_USA_MAPLIBRE = hasattr(go, 'Scattermap')
+
+
+def meter_status(meters, events_df):
+    """Status por medidor a partir da pior severidade dos seus eventos"""
+    status = pd.Series('normal', index=meters['id_medidor'].to_numpy())
+    if not events_df.empty:
+        alerta = events_df.loc[events_df['severidade'] == 'ALTA', 'id_medidor'].unique()
+        critico = events_df.loc[events_df['severidade'] == 'CRÍTICA', 'id_medidor'].unique()
+        status[status.index.isin(alerta)] = 'alerta'
+        status[status.index.isin(critico)] = 'crítico'
+    return meters.assign(status=status.to_numpy())
+
+
+def cell_size_deg(zoom, celulas_por_tile=8):
+    """Lado da célula em graus: 1/N do tile web-mercator no zoom atual"""
+    return 360.0 / (2 ** zoom) / celulas_por_tile
+
+
+def aggregate_tiles(meters, zoom, bounds=None, celulas_por_tile=8):
+    """
+    Agrega medidores (lat, lon, status) em células de grade no zoom informado.
+    `bounds` = (min_lat, min_lon, max_lat, max_lon) restringe ao viewport.
+    Retorna uma linha por célula com centro, contagens por status e status dominante.
+    """
+    lat = meters['lat'].to_numpy(dtype=float)
+    lon = meters['lon'].to_numpy(dtype=float)
+    codigos = pd.Categorical(meters['status'], categories=STATUS_ORDEM).codes
+
+    if bounds is not None:
+        min_lat, min_lon, max_lat, max_lon = bounds
+        dentro = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        lat, lon, codigos = lat[dentro], lon[dentro], codigos[dentro]
+
+    colunas = ['lat', 'lon', 'total'] + STATUS_ORDEM + ['status']
+    if len(lat) == 0:
+        return pd.DataFrame(columns=colunas)
+
+    celula = cell_size_deg(zoom, celulas_por_tile)
+    iy = np.floor(lat / celula).astype(np.int64)
+    ix = np.floor(lon / celula).astype(np.int64)
+    ix -= ix.min()
+    chaves, inverso = np.unique((iy - iy.min()) * (ix.max() + 1) + ix, return_inverse=True)
+    n = len(chaves)
+
+    k = len(STATUS_ORDEM)
+    contagens = np.bincount(inverso * k + codigos, minlength=n * k).reshape(n, k)
+
+    # Centro da célula = centróide dos medidores (melhor que o centro geométrico em zoom baixo)
+    total = contagens.sum(axis=1)
+    tiles = pd.DataFrame({
+        'lat': np.bincount(inverso, weights=lat, minlength=n) / total,
+        'lon': np.bincount(inverso, weights=lon, minlength=n) / total,
+        'total': total,
+    })
+    for i, nome in enumerate(STATUS_ORDEM):
+        tiles[nome] = contagens[:, i]
+
+    pior = np.where(contagens[:, 2] > 0, 2, np.where(contagens[:, 1] > 0, 1, 0))
+    tiles['status'] = np.asarray(STATUS_ORDEM, dtype=object)[pior]
+    return tiles[colunas]
+
+
+def build_map_figure(tiles, center, zoom, height=450):
+    """Figura WebGL com um traço por status (legenda clicável) e tamanho ~ raiz da contagem"""
+    Scatter = go.Scattermap if _USA_MAPLIBRE else go.Scattermapbox
+    fig = go.Figure()
+
+    tamanho_max = max(int(tiles['total'].max()), 1) if not tiles.empty else 1
+    for nome in STATUS_ORDEM:
+        grupo = tiles[tiles['status'] == nome]
+        if grupo.empty:
+            continue
+        fig.add_trace(Scatter(
+            lat=grupo['lat'],
+            lon=grupo['lon'],
+            mode='markers',
+            name=nome.capitalize(),
+            marker=dict(
+                size=8 + 30 * np.sqrt(grupo['total'] / tamanho_max),
+                color=STATUS_CORES[nome],
+                opacity=0.75,
+            ),
+            customdata=grupo[['total'] + STATUS_ORDEM].to_numpy(),
+            hovertemplate=('<b>%{customdata[0]} medidores</b><br>'
+                           '🟢 %{customdata[1]} | 🟡 %{customdata[2]} | 🔴 %{customdata[3]}<extra></extra>'),
+        ))
+
+    mapa = dict(style='open-street-map', center=dict(lat=center[0], lon=center[1]), zoom=zoom)
+    fig.update_layout(
+        height=height,
+        margin=dict(l=0, r=0, t=0, b=0),
+        legend=dict(orientation="h", yanchor="bottom", y=0.01, xanchor="left", x=0.01),
+        font=dict(family='Inter', size=11),
+        **({'map': mapa} if _USA_MAPLIBRE else {'mapbox': mapa})
+    )
+    return fig
@@ -0,0 +1,348 @@
+"""
+CPFL LABS | TEMA 3
+Métricas de runtime no formato texto do Prometheus (0.0.4)
+Registro único por processo (contadores, gauges, histogramas com labels e coletores
+avaliados na hora da coleta), exposto em http://host:porta/metrics ou gravado em arquivo.
+"""
+
+import bisect
+import math
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(valor):
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(float(valor))
+
+
+class _Metric:
+    tipo = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple((n, str(labels[n])) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.tipo}"]
+
+
+class Counter(_Metric):
+    tipo = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value, **labels):
+        """Espelha um contador mantido por outro objeto (usado pelos coletores)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def total(self):
+        return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, v) for key, v in self._values.items()]
+
+
+class Gauge(Counter):
+    tipo = 'gauge'
+
+    set = Counter.set_total
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    tipo = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            serie = self._series.get(key)
+            if serie is None:
+                serie = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][bisect.bisect_left(self.buckets, value)] += 1
+            serie[1] += value
+            serie[2] += 1
+
+    def time(self, **labels):
+        """Context manager que observa a duração do bloco"""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        serie = self._series.get(self._key(labels))
+        return serie[2] if serie else 0
+
+    def quantile(self, q, **labels):
+        """Estimativa do quantil por interpolação linear dentro do bucket (como histogram_quantile)"""
+        with self._lock:
+            serie = self._series.get(self._key(labels))
+            if not serie or serie[2] == 0:
+                return None
+            contagens = list(serie[0])
+            total = serie[2]
+
+        alvo = q * total
+        acumulado = 0
+        limite_inferior = 0.0
+        for i, n in enumerate(contagens):
+            if acumulado + n >= alvo and n > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                return limite_inferior + (self.buckets[i] - limite_inferior) * (alvo - acumulado) / n
+            acumulado += n
+            if i < len(self.buckets):
+                limite_inferior = self.buckets[i]
+        return self.buckets[-1]
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(s[0]), s[1], s[2]) for key, s in self._series.items()}
+        saida = []
+        for key, (contagens, soma, total) in series.items():
+            acumulado = 0
+            for limite, n in zip(self.buckets + (math.inf,), contagens):
+                acumulado += n
+                saida.append((f"{self.name}_bucket", key + (('le', _format_value(limite)),), acumulado))
+            saida.append((f"{self.name}_sum", key, soma))
+            saida.append((f"{self.name}_count", key, total))
+        return saida
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duracao = time.perf_counter() - self.inicio
+        self.histogram.observe(self.duracao, **self.labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metrica = self._metrics.get(name)
+            if metrica is None:
+                metrica = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metrica, cls):
+                raise ValueError(f"Métrica '{name}' já registrada como {metrica.tipo}")
+            return metrica
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        """`collector()` é chamado a cada coleta (útil para ler contadores de outros objetos)"""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def collect(self):
+        """Atualiza as métricas espelhadas pelos coletores"""
+        for collector in list(self._collectors):
+            collector()
+
+    def expose(self):
+        """Todas as métricas no formato texto do Prometheus"""
+        self.collect()
+
+        linhas = []
+        with self._lock:
+            metricas = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metrica in metricas:
+            linhas.extend(metrica.header())
+            for nome, labels, valor in metrica.samples():
+                linhas.append(f"{nome}{_format_labels(labels)} {_format_value(valor)}")
+        return '\n'.join(linhas) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# Métricas do dashboard (compartilhadas por app, grafo de datasets e integrações)
+RERUN_SECONDS = REGISTRY.histogram(
+    'smartmeter_rerun_duration_seconds', 'Duração de cada execução do script do Streamlit por página', ['pagina'])
+DETECTION_SECONDS = REGISTRY.histogram(
+    'smartmeter_event_detection_duration_seconds', 'Duração da detecção de eventos sobre as leituras')
+EVENTS_DETECTED = REGISTRY.gauge(
+    'smartmeter_events_detected', 'Eventos encontrados na última detecção')
+ROWS_INGESTED = REGISTRY.counter(
+    'smartmeter_rows_ingested_total', 'Leituras de medidores carregadas')
+INGEST_ROWS_PER_SECOND = REGISTRY.gauge(
+    'smartmeter_ingest_rows_per_second', 'Vazão da última carga de leituras')
+CACHE_HITS = REGISTRY.counter('smartmeter_cache_hits_total', 'Acertos de cache', ['cache'])
+CACHE_MISSES = REGISTRY.counter('smartmeter_cache_misses_total', 'Faltas de cache', ['cache'])
+CACHE_EVICTIONS = REGISTRY.counter('smartmeter_cache_evictions_total', 'Despejos de cache', ['cache'])
+CACHE_ENTRIES = REGISTRY.gauge('smartmeter_cache_entries', 'Entradas atualmente em cache', ['cache'])
+DATASET_BYTES = REGISTRY.gauge(
+    'smartmeter_dataset_bytes', 'Memória dos datasets publicados (soma das versões em cache)', ['dataset'])
+OUTBOUND_QUEUE_DEPTH = REGISTRY.gauge(
+    'smartmeter_outbound_queue_depth', 'Lotes aguardando envio por integração', ['integracao'])
+OUTBOUND_ORDERS = REGISTRY.counter(
+    'smartmeter_outbound_orders_total', 'Ordens enviadas por integração e resultado', ['integracao', 'status'])
+OUTBOUND_RETRIES = REGISTRY.counter(
+    'smartmeter_outbound_retries_total', 'Retentativas de envio por integração', ['integracao'])
+PROCESS_MEMORY_BYTES = REGISTRY.gauge(
+    'smartmeter_process_resident_memory_bytes', 'Memória residente do processo')
+PRECOMPUTE_SECONDS = REGISTRY.histogram(
+    'smartmeter_precompute_duration_seconds', 'Duração de cada ciclo do pré-cálculo em segundo plano',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+PRECOMPUTE_FAILURES = REGISTRY.counter(
+    'smartmeter_precompute_failures_total', 'Configurações cujo pré-cálculo falhou (versão anterior mantida)')
+DATA_PUBLISHED_TIMESTAMP = REGISTRY.gauge(
+    'smartmeter_data_published_timestamp_seconds', 'Horário da última versão publicada por configuração',
+    ['medidores', 'dias'])
+STREAM_READINGS = REGISTRY.counter(
+    'smartmeter_stream_readings_total', 'Leituras recebidas pela ingestão em streaming')
+STREAM_EVENTS = REGISTRY.counter(
+    'smartmeter_stream_events_total', 'Eventos detectados pela ingestão em streaming')
+STREAM_BATCH_SECONDS = REGISTRY.histogram(
+    'smartmeter_stream_batch_duration_seconds', 'Regras + atualização das janelas por lote do streaming')
+STREAM_LAG_SECONDS = REGISTRY.gauge(
+    'smartmeter_stream_lag_seconds', 'Recebimento da leitura mais antiga do último lote até as janelas publicadas')
+STREAM_REJECTED = REGISTRY.counter(
+    'smartmeter_stream_rejected_lines_total', 'Linhas descartadas pela ingestão em streaming (malformadas ou incompletas)')
+STREAM_CONNECTIONS = REGISTRY.gauge(
+    'smartmeter_stream_connections', 'Produtores conectados ao socket de ingestão')
+
+
+def process_resident_memory_bytes():
+    """RSS atual do processo (Linux); pico de RSS nas demais plataformas"""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+REGISTRY.register_collector(lambda: PROCESS_MEMORY_BYTES.set(process_resident_memory_bytes()))
+
+
+def track_cache(nome, cache, registry=REGISTRY):
+    """Exporta os contadores hits/misses/evictions de um cache (FigureCache, SharedDatasetStore...)"""
+    def coletar():
+        CACHE_HITS.set_total(cache.hits, cache=nome)
+        CACHE_MISSES.set_total(cache.misses, cache=nome)
+        CACHE_EVICTIONS.set_total(cache.evictions, cache=nome)
+        CACHE_ENTRIES.set(len(cache), cache=nome)
+    registry.register_collector(coletar)
+
+
+def track_dataset_store(store, registry=REGISTRY):
+    """Exporta o tamanho de cada dataset do store e seus contadores de cache"""
+    def coletar():
+        por_dataset = {}
+        for datasets in store.stats().values():
+            for nome, nbytes in datasets.items():
+                por_dataset[nome] = por_dataset.get(nome, 0) + nbytes
+        DATASET_BYTES.clear()
+        for nome, nbytes in por_dataset.items():
+            DATASET_BYTES.set(nbytes, dataset=nome)
+    track_cache('datasets', store, registry)
+    registry.register_collector(coletar)
+
+
+def cache_hit_ratio():
+    """Fração de acertos somando todos os caches exportados (None sem acessos)"""
+    acertos, faltas = CACHE_HITS.total(), CACHE_MISSES.total()
+    return acertos / (acertos + faltas) if acertos + faltas else None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = self.server.registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+def start_metrics_server(port=9464, host='127.0.0.1', registry=REGISTRY):
+    """Endpoint /metrics em thread daemon (só local por padrão; `host` para expor ao Prometheus)"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+def write_metrics_file(path, registry=REGISTRY):
+    """
+    Grava as métricas atomicamente (para o textfile collector do node_exporter). Cada chamada usa
+    um temporário próprio no mesmo diretório: reruns concorrentes não disputam o mesmo arquivo
+    """
+    fh = tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=os.path.dirname(path) or '.',
+                                     prefix=f".{os.path.basename(path)}.", suffix='.tmp', delete=False)
+    try:
+        with fh:
+            fh.write(registry.expose())
+        os.replace(fh.name, path)
+    except BaseException:
+        if os.path.exists(fh.name):
+            os.remove(fh.name)
+        raise
@@ -0,0 +1,114 @@
+"""
+CPFL LABS | TEMA 3
+Pré-cálculo em segundo plano dos datasets derivados (stale-while-revalidate)
+Uma thread recalcula o grafo a cada 15 min (alinhado ao lote do MDM) em uma nova geração
+e só então a publica, de uma vez, para cada configuração (medidores, dias) em uso.
+As páginas sempre leem a última geração completa; nenhum operador espera por recálculo.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from dataset_graph import DataVersion
+from metrics import DATA_PUBLISHED_TIMESTAMP, PRECOMPUTE_FAILURES, PRECOMPUTE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PrecomputeScheduler:
+    """
+    - version(num_meters, days): versão publicada + horário da publicação; a primeira
+      consulta de uma configuração nova usa a geração atual (calculada pela própria página)
+    - request_refresh(): antecipa o próximo ciclo (botão ATUALIZAR DADOS)
+    - as configurações consultadas mais recentemente (max_warm) entram em todo ciclo
+    """
+
+    def __init__(self, graph, datasets, interval_s=900, max_warm=4, warm=()):
+        self.graph = graph
+        self.datasets = list(datasets)
+        self.interval_s = interval_s
+        self.max_warm = max_warm
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._warm = OrderedDict((chave, None) for chave in warm)
+        self._published = {}
+        self._thread = None
+        self.running = False
+        self.cycles = 0
+        self.last_duration_s = None
+        self.next_run = None
+
+    def start(self):
+        """Inicia a thread; o primeiro ciclo roda imediatamente (aquece as configurações iniciais)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='precompute', daemon=True)
+            self._thread.start()
+        return self
+
+    def next_boundary(self, agora=None):
+        """Próximo múltiplo de `interval_s` no relógio (ex.: :00, :15, :30, :45)"""
+        agora = time.time() if agora is None else agora
+        return (agora // self.interval_s + 1) * self.interval_s
+
+    def request_refresh(self):
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            self.next_run = self.next_boundary()
+            self._wake.wait(max(self.next_run - time.time(), 0))
+            self._wake.clear()
+
+    def run_once(self):
+        """Calcula todos os datasets em uma nova geração e publica cada configuração concluída"""
+        with self._lock:
+            chaves = list(self._warm)
+        if not chaves:
+            return
+
+        self.running = True
+        inicio = time.perf_counter()
+        geracao = self.graph.store.bump_generation()
+        try:
+            for num_meters, days in chaves:
+                versao = DataVersion(num_meters, days, geracao)
+                try:
+                    for nome in self.datasets:
+                        self.graph.get(nome, versao)
+                except Exception:
+                    PRECOMPUTE_FAILURES.inc()
+                    logger.exception("Falha no pré-cálculo de %s; mantendo a versão anterior", versao)
+                    continue
+                self._publish((num_meters, days), geracao)
+        finally:
+            self.running = False
+            self.cycles += 1
+            self.last_duration_s = time.perf_counter() - inicio
+            PRECOMPUTE_SECONDS.observe(self.last_duration_s)
+
+    def _publish(self, chave, geracao):
+        publicado_em = datetime.now()
+        with self._lock:
+            self._published[chave] = (geracao, publicado_em)
+        DATA_PUBLISHED_TIMESTAMP.set(publicado_em.timestamp(), medidores=chave[0], dias=chave[1])
+
+    def version(self, num_meters, days):
+        """(DataVersion publicada, horário da publicação) da configuração"""
+        chave = (num_meters, days)
+        with self._lock:
+            self._warm[chave] = None
+            self._warm.move_to_end(chave)
+            while len(self._warm) > self.max_warm:
+                self._warm.popitem(last=False)
+            publicado = self._published.get(chave)
+
+        if publicado is None:
+            # Configuração nova: a página calcula a geração atual (ou aguarda o ciclo em andamento)
+            geracao = self.graph.store.generation
+            self._publish(chave, geracao)
+            publicado = (geracao, datetime.now())
+        return DataVersion(num_meters, days, publicado[0]), publicado[1]
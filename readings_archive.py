@@ -0,0 +1,262 @@
+"""
+CPFL LABS | TEMA 3
+Arquivo compactado de leituras históricas (15 min)
+Cada medidor é dividido em blocos de até `block_size` leituras. Dentro do bloco:
+- timestamp: delta-of-delta (zero para a série regular de 15 min -> 0 bits por leitura)
+- tensao_v, potencia_kw, fator_potencia: inteiro escalado (precisão fixa por coluna) + delta
+Os resíduos passam por zigzag e empacotamento de bits com a largura mínima do bloco.
+O índice de blocos (medidor, início, fim, offset) fica no cabeçalho: uma consulta de um
+medidor/período lê e decodifica apenas os blocos que toca.
+
+Uso:
+    python readings_archive.py --medidores 2000 --dias 30 --saida data/arquivo/leituras.rnts
+    python data_factory.py --medidores 100000 --dias 90 --formato rnts   (um arquivo por shard)
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'RNTSARC1'
+
+# Fator de escala por coluna: valor armazenado = round(valor * escala)
+ESCALAS = {'tensao_v': 100, 'potencia_kw': 1000, 'fator_potencia': 10000}
+
+ATRIBUTOS_MEDIDOR = ['alimentador', 'regiao']
+
+_INDICE_DTYPE = np.dtype([('medidor', '<i4'), ('inicio', '<i8'), ('fim', '<i8'),
+                          ('n', '<i4'), ('offset', '<i8'), ('nbytes', '<i4')])
+
+
+def _zigzag(d):
+    return ((d << 1) ^ (d >> 63)).view(np.uint64)
+
+
+def _unzigzag(z):
+    return (z >> np.uint64(1)).view(np.int64) ^ -(z & np.uint64(1)).view(np.int64)
+
+
+def _bit_width(z):
+    return int(z.max()).bit_length() if len(z) else 0
+
+
+def _pack(z, largura):
+    """Empacota inteiros sem sinal usando `largura` bits cada"""
+    if largura == 0 or len(z) == 0:
+        return b''
+    bits = np.unpackbits(z.astype('>u8').view(np.uint8).reshape(-1, 8), axis=1)[:, 64 - largura:]
+    return np.packbits(bits.ravel()).tobytes()
+
+
+def _unpack(buf, pos, n, largura):
+    """Inverso de _pack; retorna (valores uint64, nova posição)"""
+    if largura == 0 or n == 0:
+        return np.zeros(n, dtype=np.uint64), pos
+    nbytes = (n * largura + 7) // 8
+    bits = np.unpackbits(np.frombuffer(buf, np.uint8, nbytes, pos))[:n * largura].reshape(n, largura)
+    cheio = np.zeros((n, 64), dtype=np.uint8)
+    cheio[:, 64 - largura:] = bits
+    return np.packbits(cheio, axis=1).view('>u8').ravel().astype(np.uint64), pos + nbytes
+
+
+def _encode_timestamps(t):
+    d = np.diff(t)
+    d0 = int(d[0]) if len(d) else 0
+    z = _zigzag(np.diff(d))
+    largura = _bit_width(z)
+    return struct.pack('<qqB', int(t[0]), d0, largura) + _pack(z, largura)
+
+
+def _decode_timestamps(buf, pos, n):
+    t0, d0, largura = struct.unpack_from('<qqB', buf, pos)
+    z, pos = _unpack(buf, pos + 17, max(n - 2, 0), largura)
+    deltas = np.concatenate([[d0], d0 + np.cumsum(_unzigzag(z))]) if n > 1 else np.zeros(0, dtype=np.int64)
+    return t0 + np.concatenate([[0], np.cumsum(deltas)]).astype(np.int64), pos
+
+
+def _encode_values(q):
+    z = _zigzag(np.diff(q))
+    largura = _bit_width(z)
+    return struct.pack('<qB', int(q[0]), largura) + _pack(z, largura)
+
+
+def _decode_values(buf, pos, n):
+    q0, largura = struct.unpack_from('<qB', buf, pos)
+    z, pos = _unpack(buf, pos + 9, n - 1, largura)
+    return q0 + np.concatenate([[0], np.cumsum(_unzigzag(z))]), pos
+
+
+def write_archive(path, readings, escalas=ESCALAS, block_size=1024):
+    """
+    Grava as leituras (id_medidor, timestamp + colunas de `escalas`) no formato compactado.
+    Os valores são arredondados para a precisão da escala (ex.: 0,01 V). Retorna estatísticas.
+    """
+    colunas = list(escalas)
+    if readings[colunas].isna().any().any():
+        raise ValueError("Leituras com valores ausentes não podem ser arquivadas")
+
+    df = readings.sort_values(['id_medidor', 'timestamp'], kind='stable')
+    codigos, medidores = pd.factorize(df['id_medidor'], sort=True)
+    tempos = df['timestamp'].to_numpy().astype('datetime64[ns]').view(np.int64)
+    quantizados = {c: np.rint(df[c].to_numpy(dtype=float) * escalas[c]).astype(np.int64) for c in colunas}
+
+    atributos = {}
+    primeira = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+    for attr in ATRIBUTOS_MEDIDOR:
+        if attr in df.columns:
+            atributos[attr] = df[attr].to_numpy()[primeira].tolist()
+
+    limites = np.r_[primeira, len(df)]
+    indice, payloads, offset = [], [], 0
+    for m, (a, b) in enumerate(zip(limites[:-1], limites[1:])):
+        for inicio in range(a, b, block_size):
+            fim = min(inicio + block_size, b)
+            bloco = _encode_timestamps(tempos[inicio:fim]) + b''.join(
+                _encode_values(quantizados[c][inicio:fim]) for c in colunas)
+            indice.append((m, tempos[inicio], tempos[fim - 1], fim - inicio, offset, len(bloco)))
+            payloads.append(bloco)
+            offset += len(bloco)
+
+    cabecalho = json.dumps({
+        'escalas': escalas,
+        'block_size': block_size,
+        'n_blocos': len(indice),
+        'medidores': [str(m) for m in medidores],
+        'atributos': atributos,
+    }).encode('utf-8')
+
+    temporario = f"{path}.tmp"
+    with open(temporario, 'wb') as fh:
+        fh.write(MAGIC + struct.pack('<Q', len(cabecalho)) + cabecalho)
+        fh.write(np.array(indice, dtype=_INDICE_DTYPE).tobytes())
+        for bloco in payloads:
+            fh.write(bloco)
+    os.replace(temporario, path)
+
+    return {'leituras': len(df), 'blocos': len(indice), 'bytes': os.path.getsize(path),
+            'bytes_float64': len(df) * 8 * (len(colunas) + 1)}
+
+
+class ReadingsArchive:
+    """Leitor com índice de blocos em memória e payload mapeado (só as páginas usadas são lidas)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} não é um arquivo de leituras compactado")
+            (tamanho,) = struct.unpack('<Q', fh.read(8))
+            cabecalho = json.loads(fh.read(tamanho))
+            self.index = np.frombuffer(fh.read(cabecalho['n_blocos'] * _INDICE_DTYPE.itemsize), dtype=_INDICE_DTYPE)
+            inicio_payload = fh.tell()
+
+        self.escalas = cabecalho['escalas']
+        self.columns = list(self.escalas)
+        self.block_size = cabecalho['block_size']
+        self.meters = pd.Index(cabecalho['medidores'])
+        self.meter_attributes = cabecalho['atributos']
+        self._payload = np.memmap(path, dtype=np.uint8, mode='r', offset=inicio_payload)
+
+    def __len__(self):
+        return int(self.index['n'].sum())
+
+    def blocks_for(self, id_medidor=None, inicio=None, fim=None):
+        """Posições no índice dos blocos que cobrem o medidor/período"""
+        mascara = np.ones(len(self.index), dtype=bool)
+        if id_medidor is not None:
+            ids = [id_medidor] if isinstance(id_medidor, str) else list(id_medidor)
+            mascara &= np.isin(self.index['medidor'], self.meters.get_indexer(ids))
+        if inicio is not None:
+            mascara &= self.index['fim'] >= pd.Timestamp(inicio).value
+        if fim is not None:
+            mascara &= self.index['inicio'] <= pd.Timestamp(fim).value
+        return np.flatnonzero(mascara)
+
+    def decode_block(self, posicao, colunas=None):
+        """Arrays NumPy de um bloco: 'medidor' (código), 'timestamp' (datetime64) e as colunas"""
+        colunas = self.columns if colunas is None else colunas
+        meta = self.index[posicao]
+        n = int(meta['n'])
+        buf = self._payload[meta['offset']:meta['offset'] + meta['nbytes']]
+
+        t, pos = _decode_timestamps(buf, 0, n)
+        saida = {'medidor': np.full(n, meta['medidor'], dtype=np.int32), 'timestamp': t.view('datetime64[ns]')}
+        for coluna in self.columns:
+            q, pos = _decode_values(buf, pos, n)
+            if coluna in colunas:
+                saida[coluna] = q / self.escalas[coluna]
+        return saida
+
+    def read_arrays(self, id_medidor=None, inicio=None, fim=None, colunas=None):
+        """Arrays concatenados dos blocos selecionados, recortados exatamente ao período"""
+        colunas = self.columns if colunas is None else colunas
+        blocos = [self.decode_block(p, colunas) for p in self.blocks_for(id_medidor, inicio, fim)]
+        if not blocos:
+            return {'medidor': np.zeros(0, dtype=np.int32), 'timestamp': np.zeros(0, dtype='datetime64[ns]'),
+                    **{c: np.zeros(0) for c in colunas}}
+
+        arrays = {k: np.concatenate([b[k] for b in blocos]) for k in blocos[0]}
+        recorte = np.ones(len(arrays['timestamp']), dtype=bool)
+        if inicio is not None:
+            recorte &= arrays['timestamp'] >= np.datetime64(pd.Timestamp(inicio).value, 'ns')
+        if fim is not None:
+            recorte &= arrays['timestamp'] <= np.datetime64(pd.Timestamp(fim).value, 'ns')
+        return {k: v[recorte] for k, v in arrays.items()}
+
+    def read(self, id_medidor=None, inicio=None, fim=None, colunas=None):
+        """Leituras como DataFrame (id_medidor, timestamp, colunas e atributos do medidor como categóricos)"""
+        arrays = self.read_arrays(id_medidor, inicio, fim, colunas)
+        medidor = arrays.pop('medidor')
+        df = pd.DataFrame({'id_medidor': pd.Categorical.from_codes(medidor, categories=self.meters), **arrays})
+        for attr, valores in self.meter_attributes.items():
+            codigos, categorias = pd.factorize(np.asarray(valores, dtype=object))
+            df[attr] = pd.Categorical.from_codes(codigos[medidor], categories=categorias)
+        return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compacta leituras sintéticas e mede taxa de compressão e leitura')
+    parser.add_argument('--medidores', type=int, default=2000)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bloco', type=int, default=1024, help='Leituras por bloco')
+    parser.add_argument('--saida', default='data/arquivo/leituras.rnts')
+    args = parser.parse_args()
+
+    from data_factory import generate_readings  # data_factory importa este módulo (--formato rnts)
+
+    leituras = generate_readings(args.medidores, args.dias, seed=args.seed, end_time=pd.Timestamp('2024-01-31'))
+    os.makedirs(os.path.dirname(args.saida) or '.', exist_ok=True)
+
+    inicio = time.perf_counter()
+    stats = write_archive(args.saida, leituras, block_size=args.bloco)
+    escrita = time.perf_counter() - inicio
+
+    parquet = f"{args.saida}.parquet"
+    leituras[['id_medidor', 'timestamp', *ESCALAS]].to_parquet(parquet, index=False)
+    bytes_parquet = os.path.getsize(parquet)
+    os.remove(parquet)
+
+    arquivo = ReadingsArchive(args.saida)
+    inicio = time.perf_counter()
+    completo = arquivo.read()
+    leitura = time.perf_counter() - inicio
+
+    alvo = arquivo.meters[len(arquivo.meters) // 2]
+    fim = leituras['timestamp'].max()
+    inicio = time.perf_counter()
+    um_dia = arquivo.read(alvo, fim - pd.Timedelta(days=1), fim)
+    consulta = time.perf_counter() - inicio
+
+    ordenadas = leituras.sort_values(['id_medidor', 'timestamp'])
+    erro = max(float(np.abs(completo[c].to_numpy() - ordenadas[c].to_numpy()).max()) for c in ESCALAS)
+    print(f"{stats['leituras']:,} leituras, {stats['blocos']:,} blocos: {stats['bytes'] / 1e6:,.1f} MB "
+          f"(float64: {stats['bytes_float64'] / 1e6:,.1f} MB, {stats['bytes_float64'] / stats['bytes']:.1f}x | "
+          f"Parquet: {bytes_parquet / 1e6:,.1f} MB, {bytes_parquet / stats['bytes']:.1f}x)")
+    print(f"Escrita {escrita:.1f}s | leitura completa {leitura:.2f}s ({stats['leituras'] / leitura:,.0f} leituras/s) | "
+          f"1 medidor x 24h: {len(um_dia)} leituras em {consulta * 1000:.1f} ms | erro máx. de quantização {erro:.4g}")
@@ -0,0 +1,240 @@
+"""
+CPFL LABS | TEMA 3
+Motor de regras configurável (regras_eventos.json)
+As regras são compiladas uma vez em expressões vetorizadas (numexpr, se instalado, ou NumPy);
+os limites de cada perfil (residencial 127V, 220V, comercial...) chegam a cada leitura por
+junção com a classe do medidor/alimentador. O arquivo é recarregado quando alterado.
+"""
+
+import ast
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from string import Formatter
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regras_eventos.json')
+
+# Colunas numéricas das leituras disponíveis nas condições e textos das regras
+READING_COLUMNS = ['tensao_v', 'potencia_kw', 'fator_potencia', 'energia_kwh', 'hora', 'temperatura_estimada']
+
+EVENT_COLUMNS = ['id_evento', 'id_medidor', 'timestamp', 'alimentador', 'regiao', 'tipo', 'severidade',
+                 'valor', 'descricao', 'acao_sugerida', 'destino', 'impacto']
+
+_NOS_PERMITIDOS = (
+    ast.Expression, ast.Compare, ast.BinOp, ast.UnaryOp, ast.Name, ast.Load, ast.Constant,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+    ast.BitAnd, ast.BitOr, ast.Invert, ast.USub, ast.Add, ast.Sub, ast.Mult, ast.Div,
+)
+
+
+class RuleConfigError(ValueError):
+    """Arquivo de regras inválido"""
+
+
+class CompiledExpression:
+    """
+    Condição vetorizada, ex.: "(tensao_v < limite_subtensao) & (hora >= 12)".
+    Só aceita comparações, aritmética e &, |, ~ sobre nomes conhecidos e números.
+    """
+
+    def __init__(self, texto, nomes_validos):
+        self.texto = texto
+        try:
+            arvore = ast.parse(texto, mode='eval')
+        except SyntaxError as exc:
+            raise RuleConfigError(f"Expressão inválida '{texto}': {exc.msg}") from exc
+
+        for no in ast.walk(arvore):
+            if not isinstance(no, _NOS_PERMITIDOS):
+                raise RuleConfigError(f"Construção não permitida em '{texto}': {type(no).__name__}")
+            if isinstance(no, ast.Constant) and not isinstance(no.value, (int, float)):
+                raise RuleConfigError(f"Constante não numérica em '{texto}'")
+            if isinstance(no, ast.Name) and no.id not in nomes_validos:
+                raise RuleConfigError(f"Nome desconhecido '{no.id}' em '{texto}'")
+
+        self.names = sorted({no.id for no in ast.walk(arvore) if isinstance(no, ast.Name)})
+        self._code = compile(arvore, f"<regra: {texto}>", 'eval')
+
+    def evaluate(self, ns):
+        if numexpr is not None:
+            return numexpr.evaluate(self.texto, local_dict={n: ns[n] for n in self.names})
+        return eval(self._code, {'__builtins__': {}}, {n: ns[n] for n in self.names})
+
+
+class CompiledTemplate:
+    """Texto com campos {nome:formato} formatado em lote para as linhas de um evento"""
+
+    def __init__(self, texto, nomes_validos):
+        self._parts = []
+        for literal, campo, formato, _ in Formatter().parse(texto):
+            if campo and campo not in nomes_validos:
+                raise RuleConfigError(f"Campo desconhecido '{campo}' em '{texto}'")
+            self._parts.append((literal, campo, '{:' + formato + '}' if formato else '{}'))
+
+    def render(self, ns, n):
+        resultado = np.full(n, '', dtype=object)
+        for literal, campo, formato in self._parts:
+            if literal:
+                resultado = resultado + literal
+            if campo:
+                resultado = resultado + np.array([formato.format(v) for v in ns[campo].tolist()], dtype=object)
+        return resultado
+
+
+@dataclass
+class CompiledRule:
+    tipo: str
+    condicao: CompiledExpression
+    severidade: str
+    valor: CompiledTemplate
+    descricao: CompiledTemplate
+    acao_sugerida: str
+    destino: str
+    impacto: str
+    escalonamento: list = field(default_factory=list)
+
+
+class RuleEngine:
+    """Regras + perfis de limites compilados a partir do arquivo de configuração"""
+
+    def __init__(self, path=RULES_PATH):
+        self.path = path
+        self.version = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding='utf-8') as fh:
+            config = json.load(fh)
+
+        perfis = config.get('perfis') or {}
+        if not perfis:
+            raise RuleConfigError("Nenhum perfil de limites definido")
+        params = sorted({p for limites in perfis.values() for p in limites})
+        faltando = [(nome, p) for nome, limites in perfis.items() for p in params if p not in limites]
+        if faltando:
+            raise RuleConfigError(f"Perfis sem todos os limites: {faltando[:5]}")
+
+        classes = config.get('classes') or {}
+        padrao = classes.get('padrao', next(iter(perfis)))
+        for perfil in [padrao, *classes.get('alimentadores', {}).values(), *classes.get('medidores', {}).values()]:
+            if perfil not in perfis:
+                raise RuleConfigError(f"Perfil '{perfil}' não definido")
+
+        nomes = set(READING_COLUMNS) | set(params)
+        regras = []
+        for regra in config.get('regras', []):
+            try:
+                regras.append(CompiledRule(
+                    tipo=regra['tipo'],
+                    condicao=CompiledExpression(regra['condicao'], nomes),
+                    severidade=regra['severidade'],
+                    valor=CompiledTemplate(regra.get('valor', ''), nomes),
+                    descricao=CompiledTemplate(regra.get('descricao', ''), nomes),
+                    acao_sugerida=regra.get('acao_sugerida', ''),
+                    destino=regra.get('destino', 'Operação'),
+                    impacto=regra.get('impacto', 'MÉDIO'),
+                    escalonamento=[(CompiledExpression(e['condicao'], nomes), e['severidade'])
+                                   for e in regra.get('escalonamento', [])],
+                ))
+            except KeyError as exc:
+                raise RuleConfigError(f"Regra sem o campo obrigatório {exc}") from exc
+
+        nomes_perfis = list(perfis)
+        with self._lock:
+            self.params = params
+            self.profile_names = nomes_perfis
+            self.thresholds = np.array([[perfis[nome][p] for p in params] for nome in nomes_perfis], dtype=float)
+            self._perfil_idx = {nome: i for i, nome in enumerate(nomes_perfis)}
+            self._padrao = self._perfil_idx[padrao]
+            self._por_alimentador = {k: self._perfil_idx[v] for k, v in classes.get('alimentadores', {}).items()}
+            self._por_medidor = {k: self._perfil_idx[v] for k, v in classes.get('medidores', {}).items()}
+            self.rules = regras
+            self._mtime = mtime
+            self.version += 1
+
+    def reload_if_changed(self):
+        """Recarrega se o arquivo mudou; True quando há nova versão das regras"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self.load()
+        return True
+
+    def _profile_codes(self, coluna, mapa):
+        """Índice do perfil por linha (-1 sem override) via códigos categóricos"""
+        categorias = pd.Categorical(coluna)
+        por_categoria = np.array([mapa.get(c, -1) for c in categorias.categories] + [-1], dtype=np.int64)
+        return por_categoria[categorias.codes]
+
+    def thresholds_for(self, df):
+        """Limites por leitura: override do medidor > do alimentador > perfil padrão"""
+        perfil = np.full(len(df), self._padrao, dtype=np.int64)
+        if self._por_alimentador:
+            alim = self._profile_codes(df['alimentador'], self._por_alimentador)
+            perfil = np.where(alim >= 0, alim, perfil)
+        if self._por_medidor:
+            medidor = self._profile_codes(df['id_medidor'], self._por_medidor)
+            perfil = np.where(medidor >= 0, medidor, perfil)
+        tabela = self.thresholds[perfil]
+        return {p: tabela[:, j] for j, p in enumerate(self.params)}
+
+    def voltage_limits(self, df):
+        """Faixa adequada de tensão por leitura (limite_subtensao, limite_sobretensao) do perfil de cada medidor"""
+        with self._lock:
+            limites = self.thresholds_for(df)
+        return limites['limite_subtensao'], limites['limite_sobretensao']
+
+    def detect(self, df):
+        """Eventos de todas as regras sobre as leituras (ordem: leitura, depois regra)"""
+        with self._lock:
+            regras = list(self.rules)
+            ns = {c: df[c].to_numpy() for c in READING_COLUMNS if c in df.columns}
+            ns.update(self.thresholds_for(df))
+
+        partes = []
+        for ordem, regra in enumerate(regras):
+            linhas = np.flatnonzero(regra.condicao.evaluate(ns))
+            if len(linhas) == 0:
+                continue
+
+            sub = {k: v[linhas] for k, v in ns.items()}
+            severidade = np.full(len(linhas), regra.severidade, dtype=object)
+            for expr, nivel in regra.escalonamento:
+                severidade[expr.evaluate(sub)] = nivel
+
+            partes.append(pd.DataFrame({
+                '_linha': linhas,
+                '_regra': ordem,
+                'tipo': regra.tipo,
+                'severidade': severidade,
+                'valor': regra.valor.render(sub, len(linhas)),
+                'descricao': regra.descricao.render(sub, len(linhas)),
+                'acao_sugerida': regra.acao_sugerida,
+                'destino': regra.destino,
+                'impacto': regra.impacto,
+            }))
+
+        if not partes:
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+
+        eventos = pd.concat(partes, ignore_index=True).sort_values(['_linha', '_regra'], kind='stable')
+        linhas = eventos['_linha'].to_numpy()
+        for coluna in ['id_medidor', 'timestamp', 'alimentador', 'regiao']:
+            eventos[coluna] = df[coluna].to_numpy()[linhas]
+        eventos['id_evento'] = pd.Series(np.arange(1, len(eventos) + 1)).map('EVT-RN-{:06d}'.format).to_numpy()
+        return eventos[EVENT_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,307 @@
+"""
+CPFL LABS | TEMA 3
+Despachante assíncrono de Ordens de Serviço para o SAP PM
+Converte eventos CRÍTICA/ALTA em OS e envia em lotes (fila asyncio, pool de conexões,
+retentativas com backoff e chave de idempotência derivada do evento).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from metrics import OUTBOUND_ORDERS, OUTBOUND_QUEUE_DEPTH, OUTBOUND_RETRIES
+from sap_stub import ROTA_ORDENS, start_stub_server
+
+SEVERIDADES_OS = ['CRÍTICA', 'ALTA']
+CUSTO_POR_SEVERIDADE = {'CRÍTICA': 1200.0, 'ALTA': 800.0}
+TIPO_OS_POR_SEVERIDADE = {'CRÍTICA': 'EMERGENCIAL', 'ALTA': 'CORRETIVA'}
+CAMPOS_RESULTADO = {'chave_idempotencia', 'id_os', 'status'}
+
+logger = logging.getLogger(__name__)
+
+
+def idempotency_key(id_medidor, timestamp, tipo):
+    """Chave estável do evento: mesma leitura + mesmo tipo -> mesma OS"""
+    bruto = f"{id_medidor}|{pd.Timestamp(timestamp).isoformat()}|{tipo}"
+    return hashlib.sha256(bruto.encode('utf-8')).hexdigest()[:32]
+
+
+def build_work_orders(events_df):
+    """Gera o lote de OS (IDs determinísticos) a partir dos eventos CRÍTICA/ALTA"""
+    colunas = ['id_os', 'chave_idempotencia', 'tipo_os', 'tipo_servico', 'id_medidor', 'alimentador',
+               'regiao', 'prioridade', 'acao', 'custo_estimado', 'timestamp_evento']
+    if events_df.empty:
+        return pd.DataFrame(columns=colunas)
+
+    eventos = events_df[events_df['severidade'].isin(SEVERIDADES_OS)]
+    chaves = [idempotency_key(m, ts, t) for m, ts, t in
+              zip(eventos['id_medidor'], eventos['timestamp'], eventos['tipo'])]
+
+    ordens = pd.DataFrame({
+        # 64 bits da chave (16 hex): colisão desprezível mesmo com milhões de OS
+        'id_os': [f"OS-RN-{c[:16].upper()}" for c in chaves],
+        'chave_idempotencia': chaves,
+        'tipo_os': eventos['severidade'].map(TIPO_OS_POR_SEVERIDADE).values,
+        'tipo_servico': eventos['tipo'].values,
+        'id_medidor': eventos['id_medidor'].values,
+        'alimentador': eventos['alimentador'].values,
+        'regiao': eventos['regiao'].values,
+        'prioridade': eventos['severidade'].values,
+        'acao': eventos['acao_sugerida'].values,
+        'custo_estimado': eventos['severidade'].map(CUSTO_POR_SEVERIDADE).values,
+        'timestamp_evento': eventos['timestamp'].values,
+    }, columns=colunas)
+
+    return ordens.drop_duplicates('chave_idempotencia').reset_index(drop=True)
+
+
+def _orders_payload(ordens):
+    registros = ordens.to_dict('records')
+    for registro in registros:
+        registro['timestamp_evento'] = pd.Timestamp(registro['timestamp_evento']).isoformat()
+    return registros
+
+
+@dataclass
+class DispatchResult:
+    criadas: int = 0
+    duplicadas: int = 0
+    falhas: int = 0
+    retentativas: int = 0
+    duracao_s: float = 0.0
+    latencias_ms: list = field(default_factory=list)
+    ids_os: dict = field(default_factory=dict)
+
+    @property
+    def total(self):
+        return self.criadas + self.duplicadas + self.falhas
+
+    @property
+    def vazao_os_s(self):
+        return (self.criadas + self.duplicadas) / self.duracao_s if self.duracao_s else 0.0
+
+    def latencia_percentil(self, q):
+        return float(np.percentile(self.latencias_ms, q)) if self.latencias_ms else 0.0
+
+
+class SAPRequestError(Exception):
+    """Falha HTTP/rede ao falar com o SAP (retentável)"""
+
+
+class _ConnectionPool:
+    """Pool de conexões HTTP/1.1 keep-alive sobre streams asyncio"""
+
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self._livres = asyncio.LifoQueue()
+        self._vagas = asyncio.Semaphore(size)
+
+    async def acquire(self):
+        await self._vagas.acquire()
+        if not self._livres.empty():
+            return self._livres.get_nowait()
+        try:
+            return await asyncio.open_connection(self.host, self.port)
+        except OSError:
+            self._vagas.release()
+            raise
+
+    def release(self, conexao, reutilizar=True):
+        if reutilizar:
+            self._livres.put_nowait(conexao)
+        else:
+            conexao[1].close()
+        self._vagas.release()
+
+    async def close(self):
+        while not self._livres.empty():
+            _, writer = self._livres.get_nowait()
+            writer.close()
+
+
+def _parse_response(resposta):
+    """Corpo de um 2xx: {'resultados': [{chave_idempotencia, id_os, status}, ...]}; fora disso, SAPRequestError"""
+    try:
+        corpo = json.loads(resposta)
+    except ValueError as exc:
+        raise SAPRequestError(f"resposta não é JSON: {exc}") from exc
+    resultados = corpo.get('resultados') if isinstance(corpo, dict) else None
+    if not isinstance(resultados, list) or not all(isinstance(r, dict) and CAMPOS_RESULTADO <= r.keys()
+                                                   for r in resultados):
+        raise SAPRequestError(f"resposta fora do formato esperado: {resposta[:200]!r}")
+    return corpo
+
+
+class SAPDispatcher:
+    """Envia OS em lotes para o SAP com concorrência limitada e idempotência"""
+
+    def __init__(self, host='127.0.0.1', port=8765, path=ROTA_ORDENS, pool_size=8, batch_size=50,
+                 max_retries=4, backoff_base=0.2, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+
+    async def _post(self, pool, payload):
+        corpo = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        chave_lote = hashlib.sha256(
+            '|'.join(o['chave_idempotencia'] for o in payload['ordens']).encode('utf-8')).hexdigest()[:32]
+        requisicao = (
+            f"POST {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            f"Idempotency-Key: {chave_lote}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        ).encode('ascii') + corpo
+
+        conexao = await pool.acquire()
+        reader, writer = conexao
+        try:
+            writer.write(requisicao)
+            await writer.drain()
+
+            linha_status = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not linha_status:
+                raise SAPRequestError('conexão encerrada pelo servidor')
+            status = int(linha_status.split()[1])
+
+            cabecalhos = {}
+            while True:
+                linha = await asyncio.wait_for(reader.readline(), self.timeout)
+                if linha in (b'\r\n', b'\n', b''):
+                    break
+                nome, _, valor = linha.decode('latin-1').partition(':')
+                cabecalhos[nome.strip().lower()] = valor.strip()
+
+            resposta = await asyncio.wait_for(
+                reader.readexactly(int(cabecalhos.get('content-length', 0))), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as exc:
+            pool.release(conexao, reutilizar=False)
+            raise SAPRequestError(str(exc) or type(exc).__name__) from exc
+
+        pool.release(conexao, reutilizar=cabecalhos.get('connection', '').lower() != 'close')
+
+        if status == 429 or status >= 500:
+            raise SAPRequestError(f"HTTP {status}")
+        if status >= 400:
+            raise ValueError(f"SAP rejeitou o lote: HTTP {status} {resposta[:200]!r}")
+        return _parse_response(resposta)
+
+    async def _worker(self, pool, fila, resultado):
+        while True:
+            lote = await fila.get()
+            OUTBOUND_QUEUE_DEPTH.set(fila.qsize(), integracao='sap')
+            try:
+                for tentativa in range(self.max_retries + 1):
+                    inicio = time.perf_counter()
+                    try:
+                        resposta = await self._post(pool, {'ordens': lote})
+                    except SAPRequestError:
+                        if tentativa == self.max_retries:
+                            resultado.falhas += len(lote)
+                            break
+                        resultado.retentativas += 1
+                        OUTBOUND_RETRIES.inc(integracao='sap')
+                        atraso = self.backoff_base * (2 ** tentativa)
+                        await asyncio.sleep(atraso * random.uniform(0.5, 1.5))
+                        continue
+                    except ValueError:
+                        resultado.falhas += len(lote)
+                        break
+
+                    resultado.latencias_ms.append((time.perf_counter() - inicio) * 1000)
+                    for item in resposta['resultados']:
+                        resultado.ids_os[item['chave_idempotencia']] = item['id_os']
+                        if item['status'] == 'CRIADA':
+                            resultado.criadas += 1
+                        else:
+                            resultado.duplicadas += 1
+                    break
+            except Exception:
+                # Falha inesperada: o lote conta como falha e o worker segue (senão fila.join() não retorna)
+                resultado.falhas += len(lote)
+                logger.exception("Falha inesperada ao enviar lote de %d OS ao SAP", len(lote))
+            finally:
+                fila.task_done()
+
+    async def dispatch(self, ordens):
+        """Envia o DataFrame de OS (build_work_orders) e retorna o DispatchResult"""
+        registros = _orders_payload(ordens)
+        resultado = DispatchResult()
+        pool = _ConnectionPool(self.host, self.port, self.pool_size)
+        fila = asyncio.Queue()
+
+        for i in range(0, len(registros), self.batch_size):
+            fila.put_nowait(registros[i:i + self.batch_size])
+        OUTBOUND_QUEUE_DEPTH.set(fila.qsize(), integracao='sap')
+
+        inicio = time.perf_counter()
+        workers = [asyncio.create_task(self._worker(pool, fila, resultado)) for _ in range(self.pool_size)]
+        try:
+            await fila.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await pool.close()
+            OUTBOUND_QUEUE_DEPTH.set(fila.qsize(), integracao='sap')
+        resultado.duracao_s = time.perf_counter() - inicio
+        for status, n in [('criada', resultado.criadas), ('duplicada', resultado.duplicadas),
+                          ('falha', resultado.falhas)]:
+            OUTBOUND_ORDERS.inc(n, integracao='sap', status=status)
+        return resultado
+
+
+def dispatch_work_orders(ordens, host='127.0.0.1', port=8765, **kwargs):
+    """Versão síncrona de SAPDispatcher.dispatch (para uso no Streamlit/scripts)"""
+    return asyncio.run(SAPDispatcher(host, port, **kwargs).dispatch(ordens))
+
+
+def _synthetic_events(n, seed=0):
+    rng = np.random.default_rng(seed)
+    severidade = rng.choice(SEVERIDADES_OS, n)
+    return pd.DataFrame({
+        'id_medidor': [f"RN-{39200 + i:05d}" for i in rng.integers(1, 100_000, n)],
+        'timestamp': pd.Timestamp('2026-01-01') + pd.to_timedelta(rng.integers(0, 96 * 30, n) * 15, unit='min'),
+        'alimentador': 'AL-NAT-04 (Ponta Negra)',
+        'regiao': 'Zona Sul - Natal',
+        'tipo': np.where(severidade == 'CRÍTICA', 'INTERRUPÇÃO', 'SUBTENSÃO'),
+        'severidade': severidade,
+        'acao_sugerida': 'Despachar equipe',
+    })
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark de criação de OS contra o stub local do SAP')
+    parser.add_argument('--eventos', type=int, default=5000)
+    parser.add_argument('--pool', type=int, default=8)
+    parser.add_argument('--lote', type=int, default=50)
+    parser.add_argument('--latencia-ms', type=float, default=5.0)
+    parser.add_argument('--taxa-falha', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = start_stub_server(latencia_ms=args.latencia_ms, taxa_falha=args.taxa_falha)
+    porta = server.server_address[1]
+    ordens = build_work_orders(_synthetic_events(args.eventos))
+
+    for rodada in ('inicial', 'reexecução'):
+        r = dispatch_work_orders(ordens, port=porta, pool_size=args.pool, batch_size=args.lote)
+        print(f"[{rodada}] OS: {r.total} | criadas {r.criadas} | duplicadas {r.duplicadas} | falhas {r.falhas} | "
+              f"retentativas {r.retentativas} | {r.vazao_os_s:,.0f} OS/s | "
+              f"lote p50 {r.latencia_percentil(50):.1f}ms p95 {r.latencia_percentil(95):.1f}ms")
+
+    server.shutdown()
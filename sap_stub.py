@@ -0,0 +1,104 @@
+"""
+CPFL LABS | TEMA 3
+Stub HTTP local do SAP PM para criação de Ordens de Serviço
+Permite medir vazão e latência da criação de OS sem o ERP real.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROTA_ORDENS = '/sap/pm/ordens'
+
+
+class SAPStubHandler(BaseHTTPRequestHandler):
+    """Recebe lotes de OS e responde como o SAP PM (idempotente por chave)"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._responder(404, {'erro': 'rota inexistente'})
+            return
+        self._responder(200, {'status': 'ok', 'ordens': len(self.server.ordens)})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        corpo = self.rfile.read(tamanho)
+
+        if self.path != ROTA_ORDENS:
+            self._responder(404, {'erro': 'rota inexistente'})
+            return
+
+        server = self.server
+        if server.latencia_ms:
+            time.sleep(server.latencia_ms / 1000)
+        if server.taxa_falha and random.random() < server.taxa_falha:
+            self._responder(503, {'erro': 'SAP indisponível (simulado)'})
+            return
+
+        try:
+            ordens = json.loads(corpo)['ordens']
+        except (ValueError, KeyError):
+            self._responder(400, {'erro': 'payload inválido'})
+            return
+
+        resultados = []
+        with server.lock:
+            for ordem in ordens:
+                chave = ordem['chave_idempotencia']
+                if chave in server.ordens:
+                    resultados.append({'chave_idempotencia': chave, 'id_os': server.ordens[chave]['id_os'],
+                                       'status': 'DUPLICADA'})
+                else:
+                    server.ordens[chave] = ordem
+                    resultados.append({'chave_idempotencia': chave, 'id_os': ordem['id_os'],
+                                       'status': 'CRIADA'})
+
+        self._responder(201, {'resultados': resultados})
+
+
+def start_stub_server(host='127.0.0.1', port=0, latencia_ms=0.0, taxa_falha=0.0):
+    """Sobe o stub em thread daemon e retorna o servidor (porta em server.server_address)"""
+    server = ThreadingHTTPServer((host, port), SAPStubHandler)
+    server.daemon_threads = True
+    server.ordens = {}
+    server.lock = threading.Lock()
+    server.latencia_ms = latencia_ms
+    server.taxa_falha = taxa_falha
+
+    thread = threading.Thread(target=server.serve_forever, name='sap-stub', daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub local do SAP PM (Ordens de Serviço)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latencia-ms', type=float, default=0.0)
+    parser.add_argument('--taxa-falha', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_stub_server(args.host, args.port, args.latencia_ms, args.taxa_falha)
+    print(f"SAP stub em http://{args.host}:{server.server_address[1]}{ROTA_ORDENS}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,295 @@
+"""
+CPFL LABS | TEMA 3
+Sketches mescláveis para estatísticas da frota
+Mantidos na ingestão por partição (alimentador, região, hora):
+- quantis: histograma em buckets logarítmicos (estilo DDSketch, erro relativo fixo) - a mescla
+  é uma soma de contagens, exata e vetorizada
+- medidores distintos (total e com violação de tensão): HyperLogLog - a mescla é o máximo
+  dos registradores
+- somas e contagens para médias, carga total e conformidade
+Qualquer janela/alimentador/região é respondida mesclando partições, sem reler as leituras.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# Faixa adequada de tensão (PRODIST Módulo 8, 127V nominal) - usada quando não chegam os limites
+# por leitura (perfil de cada alimentador/medidor, ver RuleEngine.voltage_limits)
+FAIXA_ADEQUADA = (117, 133)
+
+CHAVES_PARTICAO = ['alimentador', 'regiao', 'hora']
+SOMAS = ['tensao_v', 'potencia_kw', 'temperatura_estimada']
+
+
+class LogBuckets:
+    """Buckets (γ^(i-1), γ^i] com γ = (1+α)/(1-α): qualquer quantil com erro relativo ≤ α"""
+
+    def __init__(self, alpha, min_value, max_value):
+        self.alpha = alpha
+        self.min_value = min_value
+        self._log_gamma = np.log((1 + alpha) / (1 - alpha))
+        self._offset = int(np.floor(np.log(min_value) / self._log_gamma))
+        self.n = int(np.ceil(np.log(max_value) / self._log_gamma)) - self._offset + 1
+
+    def index(self, values):
+        i = np.ceil(np.log(np.maximum(values, self.min_value)) / self._log_gamma).astype(np.int64) - self._offset
+        return np.clip(i, 0, self.n - 1)
+
+    def value(self, index):
+        return 2 * np.exp((np.asarray(index) + self._offset) * self._log_gamma) / (1 + np.exp(self._log_gamma))
+
+    def quantiles(self, counts, qs):
+        """Quantis `qs` (0-1) de um vetor de contagens (ou matriz: um vetor por linha)"""
+        counts = np.atleast_2d(counts)
+        acumulado = np.cumsum(counts, axis=1)
+        total = acumulado[:, -1:]
+        alvo = np.asarray(qs, dtype=float)[None, :] * np.maximum(total - 1, 0)
+        indices = np.array([np.searchsorted(linha, a, side='right') for linha, a in zip(acumulado, alvo)])
+        resultado = np.where(total > 0, self.value(np.minimum(indices, self.n - 1)), np.nan)
+        return resultado
+
+
+BUCKETS = {
+    # Cobre todos os perfis de regras_eventos.json (127V e 220V: 202-231V adequada, 191V crítica)
+    'tensao_v': LogBuckets(alpha=0.002, min_value=80.0, max_value=300.0),
+    'potencia_kw': LogBuckets(alpha=0.01, min_value=0.01, max_value=100.0),
+}
+
+
+def _bit_length(x):
+    """bit_length exato de uint64 (frexp é exato para as metades de 32 bits)"""
+    alto = (x >> np.uint64(32)).astype(np.float64)
+    baixo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(alto > 0, 32 + np.frexp(alto)[1], np.frexp(baixo)[1])
+
+
+class HyperLogLog:
+    """Registradores (2^p por partição, uint8) e estimativa com correção para cardinalidades pequenas"""
+
+    def __init__(self, p=10):
+        self.p = p
+        self.m = 1 << p
+
+    def hash_positions(self, ids):
+        """(registrador, rank) de cada id"""
+        h = pd.util.hash_array(np.asarray(ids, dtype=object))
+        registrador = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        resto = h << np.uint64(self.p)
+        rank = np.where(resto == 0, 64 - self.p + 1, 64 - _bit_length(resto) + 1)
+        return registrador, rank.astype(np.uint8)
+
+    def estimate(self, registers):
+        registers = np.atleast_2d(registers)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimativa = alpha * self.m ** 2 / np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+        zeros = (registers == 0).sum(axis=1)
+        linear = self.m * np.log(self.m / np.maximum(zeros, 1))
+        return np.where((estimativa <= 2.5 * self.m) & (zeros > 0), linear, estimativa)
+
+
+HLL = HyperLogLog(p=10)
+
+
+class FleetSketches:
+    """Sketches por partição (alimentador, região, hora); imutável - ingest/merge devolvem novas instâncias"""
+
+    def __init__(self, keys, counts, sums, quantiles, registers):
+        self.keys = keys
+        self.counts = counts
+        self.sums = sums
+        self.quantile_counts = quantiles
+        self.registers = registers
+
+    @property
+    def nbytes(self):
+        arrays = [self.counts, *self.sums.values(), *self.quantile_counts.values(), *self.registers.values()]
+        return int(sum(a.nbytes for a in arrays)) + int(self.keys.memory_usage(deep=True).sum())
+
+    @classmethod
+    def empty(cls):
+        keys = pd.DataFrame({'alimentador': pd.Series(dtype=object), 'regiao': pd.Series(dtype=object),
+                             'hora': pd.Series(dtype='datetime64[ns]')})
+        return cls(keys, np.zeros(0, dtype=np.int64),
+                   {c: np.zeros(0) for c in SOMAS + ['conformes']},
+                   {c: np.zeros((0, b.n), dtype=np.int32) for c, b in BUCKETS.items()},
+                   {nome: np.zeros((0, HLL.m), dtype=np.uint8) for nome in ['medidores', 'violacoes']})
+
+    @classmethod
+    def from_readings(cls, df, limites=None):
+        """
+        Sketches de um lote de leituras (uma única passada vetorizada).
+        `limites`: (inferior, superior) da faixa adequada por leitura; sem eles, FAIXA_ADEQUADA.
+        """
+        if df.empty:
+            return cls.empty()
+
+        hora = df['timestamp'].dt.floor('h')
+        codigos = [pd.factorize(df[c]) for c in ['alimentador', 'regiao']] + [pd.factorize(hora)]
+        combinado = np.zeros(len(df), dtype=np.int64)
+        for cod, uniq in codigos:
+            combinado = combinado * len(uniq) + cod
+        p, uniq_comb = pd.factorize(combinado)
+        n_p = len(uniq_comb)
+
+        partes, resto = [], uniq_comb
+        for cod, uniq in reversed(codigos):
+            partes.append(np.asarray(uniq)[resto % len(uniq)])
+            resto = resto // len(uniq)
+        keys = pd.DataFrame(dict(zip(CHAVES_PARTICAO, reversed(partes))))
+
+        counts = np.bincount(p, minlength=n_p)
+        sums = {c: np.bincount(p, weights=df[c].to_numpy(dtype=float), minlength=n_p) for c in SOMAS}
+        tensao = df['tensao_v'].to_numpy(dtype=float)
+        inferior, superior = FAIXA_ADEQUADA if limites is None else limites
+        adequada = (tensao >= inferior) & (tensao <= superior)
+        sums['conformes'] = np.bincount(p, weights=adequada, minlength=n_p)
+
+        quantiles = {}
+        for coluna, buckets in BUCKETS.items():
+            plano = p * buckets.n + buckets.index(df[coluna].to_numpy(dtype=float))
+            quantiles[coluna] = np.bincount(plano, minlength=n_p * buckets.n).reshape(n_p, buckets.n).astype(np.int32)
+
+        # HLL: um hash por medidor distinto; um par (partição, medidor) por atualização de registrador
+        medidor, ids = pd.factorize(df['id_medidor'])
+        registrador, rank = HLL.hash_positions(ids)
+        registers = {}
+        for nome, mascara in [('medidores', None), ('violacoes', ~adequada)]:
+            pares = p.astype(np.int64) * len(ids) + medidor
+            pares = pd.unique(pares if mascara is None else pares[mascara])
+            part, med = pares // len(ids), pares % len(ids)
+            regs = np.zeros(n_p * HLL.m, dtype=np.uint8)
+            np.maximum.at(regs, part * HLL.m + registrador[med], rank[med])
+            registers[nome] = regs.reshape(n_p, HLL.m)
+
+        return cls(keys, counts, sums, quantiles, registers)
+
+    def merge(self, other):
+        """União de dois conjuntos de sketches (partições iguais são mescladas)"""
+        if len(self.keys) == 0 or len(other.keys) == 0:
+            return other if len(self.keys) == 0 else self
+
+        todas = pd.concat([self.keys, other.keys], ignore_index=True)
+        codigo, _ = pd.factorize(pd.MultiIndex.from_frame(todas))
+        n_p = codigo.max() + 1 if len(codigo) else 0
+        lados = [(self, codigo[:len(self.keys)]), (other, codigo[len(self.keys):])]
+
+        keys = todas.groupby(codigo, sort=True).first().reset_index(drop=True)
+        counts = np.zeros(n_p, dtype=np.int64)
+        sums = {c: np.zeros(n_p) for c in self.sums}
+        quantiles = {c: np.zeros((n_p, b.n), dtype=np.int32) for c, b in BUCKETS.items()}
+        registers = {c: np.zeros((n_p, HLL.m), dtype=np.uint8) for c in self.registers}
+        for sk, idx in lados:
+            counts[idx] += sk.counts
+            for c in sums:
+                sums[c][idx] += sk.sums[c]
+            for c in quantiles:
+                quantiles[c][idx] += sk.quantile_counts[c]
+            for c in registers:
+                registers[c][idx] = np.maximum(registers[c][idx], sk.registers[c])
+        return FleetSketches(keys, counts, sums, quantiles, registers)
+
+    def ingest(self, df, limites=None):
+        return self.merge(FleetSketches.from_readings(df, limites))
+
+    def select(self, inicio=None, fim=None, alimentador=None, regiao=None):
+        """Máscara das partições da janela (granularidade de hora) e filtros"""
+        mascara = np.ones(len(self.keys), dtype=bool)
+        if inicio is not None:
+            mascara &= (self.keys['hora'] >= pd.Timestamp(inicio).floor('h')).to_numpy()
+        if fim is not None:
+            mascara &= (self.keys['hora'] <= pd.Timestamp(fim)).to_numpy()
+        for coluna, valor in [('alimentador', alimentador), ('regiao', regiao)]:
+            if valor is not None:
+                valores = [valor] if isinstance(valor, str) else list(valor)
+                mascara &= self.keys[coluna].isin(valores).to_numpy()
+        return mascara
+
+    def summary(self, **filtros):
+        """KPIs da frota: leituras, médias, carga somada, conformidade e medidores distintos"""
+        m = self.select(**filtros)
+        n = int(self.counts[m].sum())
+        soma = {c: float(v[m].sum()) for c, v in self.sums.items()}
+        distintos = {nome: float(HLL.estimate(regs[m].max(axis=0, initial=0))[0])
+                     for nome, regs in self.registers.items()}
+        return {
+            'leituras': n,
+            'tensao_media': soma['tensao_v'] / n if n else np.nan,
+            'potencia_total_kw': soma['potencia_kw'],
+            'temperatura_media': soma['temperatura_estimada'] / n if n else np.nan,
+            'conformidade': soma['conformes'] / n * 100 if n else np.nan,
+            'medidores': distintos['medidores'],
+            'medidores_violacao': distintos['violacoes'],
+        }
+
+    def quantiles(self, coluna, qs, **filtros):
+        m = self.select(**filtros)
+        return BUCKETS[coluna].quantiles(self.quantile_counts[coluna][m].sum(axis=0), qs)[0]
+
+    def quantiles_by(self, coluna, qs, by, **filtros):
+        """Quantis por grupo; `by` aceita alimentador, regiao, hora, dia e hora_dia"""
+        m = self.select(**filtros)
+        chaves = self.keys[m].reset_index(drop=True)
+        derivadas = {'dia': lambda k: k['hora'].dt.floor('D'), 'hora_dia': lambda k: k['hora'].dt.hour}
+        grupos = pd.DataFrame({g: derivadas[g](chaves) if g in derivadas else chaves[g] for g in by})
+        if grupos.empty:
+            return pd.DataFrame(columns=[*by, *[f"p{q * 100:g}" for q in qs]])
+
+        codigo, _ = pd.factorize(pd.MultiIndex.from_frame(grupos), sort=True)
+        ordem = np.argsort(codigo, kind='stable')
+        inicios = np.flatnonzero(np.r_[True, np.diff(codigo[ordem]) != 0])
+        contagens = np.add.reduceat(self.quantile_counts[coluna][m][ordem], inicios, axis=0)
+
+        resultado = grupos.iloc[ordem[inicios]].reset_index(drop=True)
+        valores = BUCKETS[coluna].quantiles(contagens, qs)
+        for j, q in enumerate(qs):
+            resultado[f"p{q * 100:g}"] = valores[:, j]
+        return resultado
+
+
+if __name__ == '__main__':
+    from data_factory import build_timestamps, generate_shard, shard_ranges
+
+    parser = argparse.ArgumentParser(description='Constrói sketches shard a shard e mede o tempo das consultas')
+    parser.add_argument('--medidores', type=int, default=5000)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    timestamps = build_timestamps(args.dias, pd.Timestamp('2024-01-31'))
+    faixas = shard_ranges(args.medidores, 250)
+    seeds = np.random.SeedSequence(args.seed).spawn(len(faixas))
+
+    inicio = time.perf_counter()
+    sketches, amostra, linhas = FleetSketches.empty(), [], 0
+    for (a, b), s in zip(faixas, seeds):
+        lote = generate_shard(a, b, timestamps, s)
+        sketches = sketches.ingest(lote)
+        amostra.append(lote['tensao_v'].to_numpy())
+        linhas += len(lote)
+    ingestao = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    p = sketches.quantiles('tensao_v', [0.01, 0.5, 0.99])
+    resumo = sketches.summary()
+    por_hora = sketches.quantiles_by('tensao_v', [0.01, 0.99], by=['alimentador', 'hora_dia'])
+    consulta = (time.perf_counter() - inicio) * 1000
+
+    exato = np.quantile(np.concatenate(amostra), [0.01, 0.5, 0.99])
+
+    # Conferência com os quantis exatos, também para um perfil 220V (mesmas leituras em escala)
+    alpha = BUCKETS['tensao_v'].alpha
+    lote_220 = lote.assign(tensao_v=lote['tensao_v'] * 220 / 127)
+    p_220 = FleetSketches.from_readings(lote_220).quantiles('tensao_v', [0.01, 0.5, 0.99])
+    exato_220 = np.quantile(lote_220['tensao_v'], [0.01, 0.5, 0.99])
+    for nome, aproximado, referencia in [('127V', p, exato), ('220V', p_220, exato_220)]:
+        erro = np.abs(aproximado / referencia - 1).max()
+        assert erro <= 2 * alpha, f"quantis de tensão {nome} fora da tolerância: {aproximado} x {referencia}"
+
+    print(f"{linhas:,} leituras, {len(sketches.keys):,} partições ({sketches.nbytes / 1e6:.1f} MB) em {ingestao:.1f}s")
+    print(f"Consultas da frota ({args.dias} dias) em {consulta:.1f} ms | p1/p50/p99 tensão: "
+          f"{np.round(p, 2)} (exato {np.round(exato, 2)}) | medidores ≈ {resumo['medidores']:,.0f}, "
+          f"com violação ≈ {resumo['medidores_violacao']:,.0f} | {len(por_hora)} grupos alimentador x hora")
+    print(f"Perfil 220V: p1/p50/p99 {np.round(p_220, 2)} (exato {np.round(exato_220, 2)})")
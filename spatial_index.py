@@ -0,0 +1,170 @@
+"""
+CPFL LABS | TEMA 3
+Cadastro georreferenciado de ativos (alimentadores, transformadores, medidores)
+e índice espacial R-tree (libspatialindex) para consultas por janela, raio e k-vizinhos.
+"""
+
+import numpy as np
+import pandas as pd
+from rtree import index
+
+RAIO_TERRA_M = 6_371_008.8
+
+# Coordenadas aproximadas das cabeças dos alimentadores (subestações) - Natal/Parnamirim
+FEEDER_LOCATIONS = {
+    'AL-NAT-04 (Ponta Negra)': (-5.8790, -35.1780),
+    'AL-NAT-07 (Capim Macio)': (-5.8600, -35.1980),
+    'AL-PAR-02 (Parnamirim Centro)': (-5.9160, -35.2630),
+    'AL-PAR-05 (Nova Parnamirim)': (-5.8650, -35.2140),
+}
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distância geodésica em metros (vetorizada)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(a))
+
+
+def build_asset_registry(meters, medidores_por_trafo=12, dispersao_trafo_m=1500, dispersao_medidor_m=80, seed=0):
+    """
+    Posiciona transformadores em torno da cabeça de cada alimentador e medidores em torno do
+    seu transformador. `meters` precisa das colunas id_medidor, alimentador e regiao.
+    Retorna dict com DataFrames 'alimentadores', 'transformadores' e 'medidores'.
+    """
+    rng = np.random.default_rng(seed)
+    metro_em_grau = np.degrees(1 / RAIO_TERRA_M)
+
+    alimentadores = pd.DataFrame(
+        [(nome, lat, lon) for nome, (lat, lon) in FEEDER_LOCATIONS.items()],
+        columns=['alimentador', 'lat', 'lon']
+    )
+
+    medidores = (meters[['id_medidor', 'alimentador', 'regiao']]
+                 .drop_duplicates('id_medidor')
+                 .sort_values(['alimentador', 'id_medidor'])
+                 .reset_index(drop=True))
+
+    # Transformadores: um a cada N medidores do alimentador
+    pos_no_alim = medidores.groupby('alimentador').cumcount().to_numpy()
+    trafo_seq = pos_no_alim // medidores_por_trafo
+    sigla = medidores['alimentador'].str.extract(r'^AL-(\w+-\d+)')[0].fillna('XX')
+    medidores['id_transformador'] = 'TR-' + sigla + '-' + pd.Series(trafo_seq + 1).map('{:03d}'.format)
+
+    transformadores = medidores[['id_transformador', 'alimentador']].drop_duplicates('id_transformador').reset_index(drop=True)
+    centro = transformadores['alimentador'].map(FEEDER_LOCATIONS)
+    centro_lat = np.array([c[0] if isinstance(c, tuple) else np.nan for c in centro])
+    centro_lon = np.array([c[1] if isinstance(c, tuple) else np.nan for c in centro])
+    escala = dispersao_trafo_m * metro_em_grau
+    transformadores['lat'] = centro_lat + rng.normal(0, escala, len(transformadores))
+    transformadores['lon'] = centro_lon + rng.normal(0, escala, len(transformadores)) / np.cos(np.radians(centro_lat))
+
+    trafo_pos = transformadores.set_index('id_transformador')[['lat', 'lon']]
+    base = trafo_pos.loc[medidores['id_transformador']].to_numpy()
+    escala = dispersao_medidor_m * metro_em_grau
+    medidores['lat'] = base[:, 0] + rng.normal(0, escala, len(medidores))
+    medidores['lon'] = base[:, 1] + rng.normal(0, escala, len(medidores)) / np.cos(np.radians(base[:, 0]))
+
+    return {
+        'alimentadores': alimentadores,
+        'transformadores': transformadores.dropna(subset=['lat', 'lon']).reset_index(drop=True),
+        'medidores': medidores.dropna(subset=['lat', 'lon']).reset_index(drop=True),
+    }
+
+
+class AssetSpatialIndex:
+    """
+    Índice R-tree sobre pontos (lat/lon) de um DataFrame de ativos.
+    Os pontos são projetados em metros (equirretangular local) para que raio e
+    k-vizinhos usem distâncias coerentes; o resultado final usa haversine.
+    """
+
+    def __init__(self, assets, id_col):
+        self.assets = assets.reset_index(drop=True)
+        self.id_col = id_col
+        self._lat = self.assets['lat'].to_numpy(dtype=float)
+        self._lon = self.assets['lon'].to_numpy(dtype=float)
+        self._ids = self.assets[id_col].to_numpy()
+        self._cos_lat0 = np.cos(np.radians(np.mean(self._lat))) if len(self._lat) else 1.0
+
+        x, y = self._project(self._lat, self._lon)
+        # Carga em lote (STR bulk loading) - muito mais rápida que inserções individuais
+        stream = ((i, (x[i], y[i], x[i], y[i]), None) for i in range(len(x)))
+        self._idx = index.Index(stream) if len(x) else index.Index()
+
+    def __len__(self):
+        return len(self.assets)
+
+    def _project(self, lat, lon):
+        lat = np.radians(np.asarray(lat, dtype=float))
+        lon = np.radians(np.asarray(lon, dtype=float))
+        return RAIO_TERRA_M * lon * self._cos_lat0, RAIO_TERRA_M * lat
+
+    def _query_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        x0, y0 = self._project(min_lat, min_lon)
+        x1, y1 = self._project(max_lat, max_lon)
+        return np.fromiter(self._idx.intersection((x0, y0, x1, y1)), dtype=np.int64)
+
+    def _query_radius(self, lat, lon, raio_m):
+        x, y = self._project(lat, lon)
+        candidatos = np.fromiter(self._idx.intersection((x - raio_m, y - raio_m, x + raio_m, y + raio_m)),
+                                 dtype=np.int64)
+        distancias = haversine_m(lat, lon, self._lat[candidatos], self._lon[candidatos])
+        dentro = distancias <= raio_m
+        ordem = np.argsort(distancias[dentro], kind='stable')
+        return candidatos[dentro][ordem], distancias[dentro][ordem]
+
+    def _query_nearest(self, lat, lon, k):
+        x, y = self._project(lat, lon)
+        candidatos = np.fromiter(self._idx.nearest((x, y, x, y), k), dtype=np.int64)
+        distancias = haversine_m(lat, lon, self._lat[candidatos], self._lon[candidatos])
+        ordem = np.argsort(distancias, kind='stable')[:k]
+        return candidatos[ordem], distancias[ordem]
+
+    def _frame(self, posicoes, distancias=None):
+        resultado = self.assets.iloc[posicoes].copy()
+        if distancias is not None:
+            resultado['distancia_m'] = distancias
+        return resultado
+
+    # Consultas que devolvem apenas IDs (caminho rápido para mapas e correlação de eventos)
+    def bbox_ids(self, min_lat, min_lon, max_lat, max_lon):
+        return self._ids[self._query_bbox(min_lat, min_lon, max_lat, max_lon)]
+
+    def radius_ids(self, lat, lon, raio_m):
+        posicoes, distancias = self._query_radius(lat, lon, raio_m)
+        return self._ids[posicoes], distancias
+
+    def nearest_ids(self, lat, lon, k=10):
+        posicoes, distancias = self._query_nearest(lat, lon, k)
+        return self._ids[posicoes], distancias
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Ativos dentro da janela (ex.: viewport do mapa)"""
+        return self._frame(self._query_bbox(min_lat, min_lon, max_lat, max_lon))
+
+    def radius(self, lat, lon, raio_m):
+        """Ativos a até `raio_m` metros do ponto, ordenados por distância"""
+        return self._frame(*self._query_radius(lat, lon, raio_m))
+
+    def nearest(self, lat, lon, k=10):
+        """Os k ativos mais próximos do ponto, ordenados por distância"""
+        return self._frame(*self._query_nearest(lat, lon, k))
+
+
+def build_asset_indexes(registry):
+    """Um índice por classe de ativo do cadastro"""
+    return {
+        'medidores': AssetSpatialIndex(registry['medidores'], 'id_medidor'),
+        'transformadores': AssetSpatialIndex(registry['transformadores'], 'id_transformador'),
+        'alimentadores': AssetSpatialIndex(registry['alimentadores'], 'alimentador'),
+    }
+
+
+def events_within(events_df, meter_index, lat, lon, raio_m=500):
+    """Eventos de medidores a até `raio_m` metros de um ponto (ex.: incidente)"""
+    ids, distancias = meter_index.radius_ids(lat, lon, raio_m)
+    proximos = pd.DataFrame({'id_medidor': ids, 'distancia_m': distancias})
+    if events_df.empty or proximos.empty:
+        return events_df.iloc[0:0].assign(distancia_m=np.array([], dtype=float))
+    return events_df.merge(proximos, on='id_medidor').sort_values(['distancia_m', 'timestamp'])
@@ -0,0 +1,405 @@
+"""
+CPFL LABS | TEMA 3
+Ingestão em streaming (modo ao vivo)
+Serviço asyncio que consome leituras de um socket TCP local (uma leitura JSON por linha, no lugar
+do barramento de mensagens do MDM), aplica as regras de eventos a cada lote e mantém janelas
+deslizantes por alimentador (15 min / 1 h / 24 h) em buffers circulares de 1 minuto.
+A Visão Operacional lê as janelas direto da memória: um evento chega à tela em segundos,
+sem recálculo do grafo de datasets.
+
+Uso:
+    python streaming.py --medidores 100000 --ciclos 4              (benchmark com serviço local)
+    python streaming.py --produtor --porta 9470 --medidores 5000   (envia para o app em execução)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_factory import ALIMENTADORES
+from metrics import (STREAM_BATCH_SECONDS, STREAM_CONNECTIONS, STREAM_EVENTS, STREAM_LAG_SECONDS, STREAM_READINGS,
+                     STREAM_REJECTED)
+from sketches import FAIXA_ADEQUADA
+
+logger = logging.getLogger(__name__)
+
+JANELAS = {'15 min': 15 * 60, '1 h': 60 * 60, '24 h': 24 * 60 * 60}
+
+# Somas mantidas por (alimentador, minuto); mínimo/máximo de tensão ficam em buffers próprios
+CAMPOS = ['leituras', 'potencia_kw', 'energia_kwh', 'tensao_v', 'violacoes', 'eventos', 'criticos']
+
+# Lotes entregues ao worker de regras e ainda não concluídos, antes de pausar a leitura dos sockets
+LOTES_EM_VOO = 2
+
+COLUNAS_STREAM = ['id_medidor', 'timestamp', 'tensao_v', 'potencia_kw', 'fator_potencia', 'energia_kwh',
+                  'alimentador', 'regiao', 'temperatura_estimada']
+NUMERICAS_STREAM = ['tensao_v', 'potencia_kw', 'fator_potencia', 'energia_kwh', 'temperatura_estimada']
+
+
+class SlidingWindows:
+    """
+    Buffers circulares (alimentador x slot de `slot_s` segundos) cobrindo `horizonte_s`.
+    O relógio é o da própria leitura (maior slot já visto): leituras atrasadas ainda dentro
+    do horizonte entram no slot certo; as mais antigas são descartadas.
+    """
+
+    def __init__(self, alimentadores=(), slot_s=60, horizonte_s=JANELAS['24 h']):
+        self.slot_s = slot_s
+        self.n_slots = horizonte_s // slot_s
+        self._lock = threading.Lock()
+        self._linhas = {}
+        self._somas = np.zeros((len(CAMPOS), 0, self.n_slots))
+        self._min = np.zeros((0, self.n_slots))
+        self._max = np.zeros((0, self.n_slots))
+        self._slot = np.full(self.n_slots, -1, dtype=np.int64)
+        self.watermark = None
+        self.descartadas = 0
+        self._rows(list(alimentadores))
+
+    def _rows(self, nomes):
+        """Linha de cada alimentador (cria as que faltam)"""
+        novos = [n for n in dict.fromkeys(nomes) if n not in self._linhas]
+        if novos:
+            for nome in novos:
+                self._linhas[nome] = len(self._linhas)
+            extra = len(novos)
+            self._somas = np.concatenate([self._somas, np.zeros((len(CAMPOS), extra, self.n_slots))], axis=1)
+            self._min = np.vstack([self._min, np.full((extra, self.n_slots), np.inf)])
+            self._max = np.vstack([self._max, np.full((extra, self.n_slots), -np.inf)])
+        return np.array([self._linhas[n] for n in nomes], dtype=np.int64)
+
+    def _advance(self, slot):
+        """Move o relógio até `slot`, zerando as posições que voltam a ser usadas"""
+        inicio = slot - self.n_slots + 1 if self.watermark is None else max(self.watermark + 1, slot - self.n_slots + 1)
+        novos = np.arange(inicio, slot + 1)
+        posicoes = novos % self.n_slots
+        self._somas[:, :, posicoes] = 0
+        self._min[:, posicoes] = np.inf
+        self._max[:, posicoes] = -np.inf
+        self._slot[posicoes] = novos
+        self.watermark = slot
+
+    def _flat(self, timestamps, alimentadores):
+        """Índice plano (linha, posição) das leituras dentro do horizonte"""
+        slot = timestamps.astype('datetime64[s]').astype(np.int64) // self.slot_s
+        dentro = slot > self.watermark - self.n_slots
+        self.descartadas += int((~dentro).sum())
+        codigos, nomes = pd.factorize(alimentadores)
+        linha = self._rows(list(nomes))[codigos]
+        return (linha * self.n_slots + slot % self.n_slots)[dentro], dentro
+
+    def add(self, readings, events, limites=None):
+        """
+        Acumula um lote de leituras e os eventos detectados nele.
+        `limites`: (inferior, superior) da faixa adequada por leitura; sem eles, FAIXA_ADEQUADA.
+        """
+        if readings.empty:
+            return
+        ts = readings['timestamp'].to_numpy()
+        with self._lock:
+            maior = int(ts.max().astype('datetime64[s]').astype(np.int64) // self.slot_s)
+            if self.watermark is None or maior > self.watermark:
+                self._advance(maior)
+
+            flat, dentro = self._flat(ts, readings['alimentador'])
+            tensao = readings['tensao_v'].to_numpy(dtype=float)[dentro]
+            faixa = FAIXA_ADEQUADA if limites is None else limites
+            inferior, superior = (np.broadcast_to(lim, len(readings))[dentro] for lim in faixa)
+            tamanho = self._somas[0].size
+            pesos = {
+                'leituras': None,
+                'potencia_kw': readings['potencia_kw'].to_numpy(dtype=float)[dentro],
+                'energia_kwh': readings['energia_kwh'].to_numpy(dtype=float)[dentro],
+                'tensao_v': tensao,
+                'violacoes': ((tensao < inferior) | (tensao > superior)).astype(float),
+            }
+            for campo, peso in pesos.items():
+                self._somas[CAMPOS.index(campo)] += np.bincount(flat, weights=peso, minlength=tamanho).reshape(-1, self.n_slots)
+            np.minimum.at(self._min.reshape(-1), flat, tensao)
+            np.maximum.at(self._max.reshape(-1), flat, tensao)
+
+            if not events.empty:
+                flat, dentro = self._flat(events['timestamp'].to_numpy(), events['alimentador'])
+                criticos = (events['severidade'].to_numpy() == 'CRÍTICA')[dentro].astype(float)
+                self._somas[CAMPOS.index('eventos')] += np.bincount(flat, minlength=tamanho).reshape(-1, self.n_slots)
+                self._somas[CAMPOS.index('criticos')] += np.bincount(flat, weights=criticos, minlength=tamanho).reshape(-1, self.n_slots)
+
+    @property
+    def fim(self):
+        """Fim da janela (timestamp do fim do slot mais recente)"""
+        return None if self.watermark is None else pd.Timestamp((self.watermark + 1) * self.slot_s, unit='s')
+
+    def window(self, segundos):
+        """Agregados por alimentador dos últimos `segundos` (relógio das leituras)"""
+        with self._lock:
+            nomes = list(self._linhas)
+            if self.watermark is None:
+                somas = np.zeros((len(CAMPOS), len(nomes)))
+                minimo = np.full(len(nomes), np.nan)
+                maximo = np.full(len(nomes), np.nan)
+            else:
+                n = min(-(-segundos // self.slot_s), self.n_slots)
+                slots = np.arange(self.watermark - n + 1, self.watermark + 1)
+                posicoes = slots % self.n_slots
+                posicoes = posicoes[self._slot[posicoes] == slots]
+                somas = self._somas[:, :, posicoes].sum(axis=2)
+                minimo = self._min[:, posicoes].min(axis=1, initial=np.inf)
+                maximo = self._max[:, posicoes].max(axis=1, initial=-np.inf)
+
+        s = dict(zip(CAMPOS, somas))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return pd.DataFrame({
+                'alimentador': nomes,
+                'leituras': s['leituras'].astype(np.int64),
+                'carga_media_kw': s['potencia_kw'] * JANELAS['15 min'] / segundos,
+                'energia_kwh': s['energia_kwh'],
+                'tensao_media_v': s['tensao_v'] / s['leituras'],
+                'tensao_min_v': np.where(np.isfinite(minimo), minimo, np.nan),
+                'tensao_max_v': np.where(np.isfinite(maximo), maximo, np.nan),
+                'violacoes_pct': s['violacoes'] / s['leituras'] * 100,
+                'eventos': s['eventos'].astype(np.int64),
+                'criticos': s['criticos'].astype(np.int64),
+            })
+
+
+def _parse_lines(linhas):
+    """Registros JSON do lote: decodifica tudo de uma vez e, se alguma linha estiver malformada, linha a linha"""
+    try:
+        return json.loads(b'[' + b','.join(linhas) + b']')
+    except ValueError:
+        registros = []
+        for linha in linhas:
+            try:
+                registros.append(json.loads(linha))
+            except ValueError:
+                continue
+        return registros
+
+
+def readings_from_lines(linhas):
+    """
+    Lote de linhas JSON -> (DataFrame no formato das leituras do app, com a coluna hora;
+    número de linhas rejeitadas). Linhas malformadas, sem algum campo ou com timestamp/valores
+    inválidos são descartadas sem derrubar o restante do lote.
+    """
+    registros = [r for r in _parse_lines(linhas) if isinstance(r, dict)]
+    df = pd.DataFrame(registros, columns=COLUNAS_STREAM)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', errors='coerce')
+    for coluna in NUMERICAS_STREAM:
+        df[coluna] = pd.to_numeric(df[coluna], errors='coerce')
+    df = df.dropna(subset=COLUNAS_STREAM).reset_index(drop=True)
+    df['hora'] = df['timestamp'].dt.hour
+    return df, len(linhas) - len(df)
+
+
+def reading_lines(readings):
+    """DataFrame de leituras -> payload com uma leitura JSON por linha (formato do produtor)"""
+    return readings[COLUNAS_STREAM].to_json(orient='records', lines=True, date_format='iso').encode('utf-8') + b'\n'
+
+
+class StreamingIngestor:
+    """
+    Servidor asyncio em thread daemon. Linhas recebidas se acumulam até `batch_size` ou
+    `flush_s` segundos; cada lote passa pelas regras e atualiza as janelas de uma vez, em um
+    worker próprio (um lote por vez, na ordem de chegada) - o loop segue lendo os sockets.
+    """
+
+    def __init__(self, rule_engine, host='127.0.0.1', port=9470, batch_size=2000, flush_s=0.25, max_events=500):
+        self.rule_engine = rule_engine
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.flush_s = flush_s
+        self.windows = SlidingWindows(ALIMENTADORES)
+        self.recent_events = deque(maxlen=max_events)
+        self._events_lock = threading.Lock()
+        self.readings = 0
+        self.events = 0
+        self.batches = 0
+        self.rejected = 0
+        self.connections = 0
+        self.last_batch_at = None
+        self.last_lag_s = None
+        self._pending = []
+        self._pending_since = None
+        self._ready = threading.Event()
+        self._erro = None
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='streaming-regras')
+        self._em_voo = deque()
+
+    def start(self):
+        """Sobe o servidor e só retorna com a porta aberta (OSError se não for possível)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name='streaming', daemon=True)
+            self._thread.start()
+            self._ready.wait()
+            if self._erro is not None:
+                raise self._erro
+        return self
+
+    @property
+    def address(self):
+        return self.host, self.port
+
+    async def _serve(self):
+        try:
+            server = await asyncio.start_server(self._handle, self.host, self.port, limit=1 << 20)
+        except OSError as exc:
+            self._erro = exc
+            self._ready.set()
+            return
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        asyncio.get_running_loop().create_task(self._flusher())
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        STREAM_CONNECTIONS.set(self.connections)
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                if not linha.strip():
+                    continue
+                if not self._pending:
+                    self._pending_since = time.perf_counter()
+                self._pending.append(linha)
+                if len(self._pending) >= self.batch_size:
+                    await self._flush()
+        finally:
+            self.connections -= 1
+            STREAM_CONNECTIONS.set(self.connections)
+            writer.close()
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_s)
+            if self._pending:
+                await self._flush()
+
+    async def _flush(self):
+        """
+        Entrega o lote pendente ao worker de regras. Com mais de `LOTES_EM_VOO` lotes na fila do
+        worker, aguarda o mais antigo (contrapressão sobre os produtores)
+        """
+        linhas, self._pending = self._pending, []
+        self._em_voo.append(asyncio.get_running_loop().run_in_executor(
+            self._executor, self._process_batch, linhas, self._pending_since))
+        while self._em_voo and (self._em_voo[0].done() or len(self._em_voo) > LOTES_EM_VOO):
+            await self._em_voo.popleft()
+
+    def _process_batch(self, linhas, recebido_em):
+        """Uma falha descarta só este lote (registrada), sem derrubar o serviço"""
+        try:
+            self.process(linhas, recebido_em)
+        except Exception:
+            self.rejected += len(linhas)
+            STREAM_REJECTED.inc(len(linhas))
+            logger.exception("Falha ao processar lote de %d linhas do streaming; lote descartado", len(linhas))
+
+    def process(self, linhas, recebido_em=None):
+        """Regras + janelas para um lote de linhas JSON"""
+        inicio = time.perf_counter()
+        df, rejeitadas = readings_from_lines(linhas)
+        if rejeitadas:
+            self.rejected += rejeitadas
+            STREAM_REJECTED.inc(rejeitadas)
+        if df.empty:
+            return
+        eventos = self.rule_engine.detect(df)
+        if not eventos.empty:
+            numeros = np.arange(self.events + 1, self.events + len(eventos) + 1)
+            eventos['id_evento'] = pd.Series(numeros).map('EVT-RN-S{:07d}'.format).to_numpy()
+            registros = eventos.to_dict('records')
+            with self._events_lock:
+                self.recent_events.extend(registros)
+        self.windows.add(df, eventos, self.rule_engine.voltage_limits(df))
+
+        self.readings += len(df)
+        self.events += len(eventos)
+        self.batches += 1
+        self.last_batch_at = datetime.now()
+        self.last_lag_s = time.perf_counter() - (recebido_em or inicio)
+        STREAM_READINGS.inc(len(df))
+        STREAM_EVENTS.inc(len(eventos))
+        STREAM_BATCH_SECONDS.observe(time.perf_counter() - inicio)
+        STREAM_LAG_SECONDS.set(self.last_lag_s)
+
+    def latest_events(self, n=20):
+        """Eventos mais recentes primeiro (cópia tirada sob o lock: o worker de regras estende a fila)"""
+        with self._events_lock:
+            recentes = list(self.recent_events)
+        return pd.DataFrame(recentes[::-1][:n])
+
+
+async def _send(host, port, payload, chunk=1 << 20):
+    _, writer = await asyncio.open_connection(host, port)
+    for inicio in range(0, len(payload), chunk):
+        writer.write(payload[inicio:inicio + chunk])
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+
+def send_readings(host, port, readings):
+    """Produtor: envia as leituras (ordem de timestamp) para o socket de ingestão"""
+    asyncio.run(_send(host, port, reading_lines(readings.sort_values('timestamp', kind='stable'))))
+
+
+def replay_readings(host, port, readings):
+    """Envia em segundo plano (botão de reprodução do app)"""
+    thread = threading.Thread(target=send_readings, args=(host, port, readings), name='stream-replay', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    from data_factory import generate_shard, shard_ranges
+    from rules import RuleEngine
+
+    parser = argparse.ArgumentParser(description='Ingestão em streaming: benchmark local ou produtor de leituras')
+    parser.add_argument('--medidores', type=int, default=100_000)
+    parser.add_argument('--ciclos', type=int, default=4, help='ciclos de 15 min enviados')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=0)
+    parser.add_argument('--produtor', action='store_true', help='apenas envia para um serviço já em execução')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    fim = pd.Timestamp.now().floor('15min')
+    timestamps = pd.date_range(end=fim, periods=args.ciclos, freq='15min')
+    faixas = shard_ranges(args.medidores, 1000)
+    seeds = np.random.SeedSequence(args.seed).spawn(len(faixas))
+    leituras = pd.concat([generate_shard(a, b, timestamps, s) for (a, b), s in zip(faixas, seeds)], ignore_index=True)
+
+    if args.produtor:
+        inicio = time.perf_counter()
+        send_readings(args.host, args.porta, leituras)
+        print(f"{len(leituras):,} leituras enviadas em {time.perf_counter() - inicio:.1f}s")
+        raise SystemExit
+
+    ingestor = StreamingIngestor(RuleEngine(), args.host, args.porta).start()
+    for ts, ciclo in leituras.groupby('timestamp', sort=True):
+        esperado = ingestor.readings + len(ciclo)
+        inicio = time.perf_counter()
+        send_readings(args.host, ingestor.port, ciclo)
+        while ingestor.readings < esperado:
+            time.sleep(0.01)
+        duracao = time.perf_counter() - inicio
+        print(f"ciclo {ts:%H:%M}: {len(ciclo):,} leituras em {duracao:.2f}s ({len(ciclo) / duracao:,.0f}/s) | "
+              f"lote p95 {STREAM_BATCH_SECONDS.quantile(0.95) * 1000:.0f} ms | atraso do último lote {ingestor.last_lag_s * 1000:.0f} ms")
+    print(f"{ingestor.events:,} eventos em {ingestor.batches:,} lotes")
+    print(ingestor.windows.window(JANELAS['1 h']).round(2).to_string(index=False))